@@ -0,0 +1,86 @@
+# app/admin.py
+"""
+管理后台接口（views/admin 下的页面使用）：
+  - /admin/records:        对局记录分页查询，可按 room_id 过滤
+  - /admin/records/export: 对局记录 NDJSON 流式导出
+  - /admin/rooms:          房间列表（来自进程内房间目录；多 worker 部署时各 worker 的目录通过
+                           "directory:rooms" 频道同步，包含所有 worker 上的房间，见 app/room_manager.py）
+  - /admin/room/delete:    删除房间，同时清理游戏状态并关闭房间内的 WebSocket 连接
+  - /admin/user:           按用户 ID 查询用户信息
+所有接口都要求请求携带有效的会话令牌（Authorization: Bearer），且令牌中的用户在配置 auth.admin_users 中；
+未登录返回 401，非管理员返回 403。admin_users 默认为空，即不开放管理后台。
+"""
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from app.database import read_database
+from app.models import users, game_records, game_sessions
+from app.records import newest_first, fetch_page, page_size, ndjson_response
+from app.room_manager import list_rooms, delete_room
+from app.state_store import store
+from app.game_modes.poker_battle import GAME_STATES
+from app.ws_hub import room_hub, game_hub
+from app.game_log import game_log
+from app.auth import require_admin
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+def _records_query(room_id: Optional[str], cursor: Optional[str]):
+    """对局记录连同用户名和整局玩家列表；按 room_id 过滤时走 (room_id, game_time) 索引"""
+    query = (
+        select(
+            game_records,
+            users.c.username,
+            game_sessions.c.players,
+        )
+        .select_from(
+            game_records
+            .join(users, users.c.id == game_records.c.user_id)
+            .join(game_sessions, game_sessions.c.id == game_records.c.session_id)
+        )
+    )
+    if room_id:
+        query = query.where(game_records.c.room_id == room_id)
+    return newest_first(query, cursor=cursor)
+
+
+@router.get("/records")
+async def admin_records(room_id: Optional[str] = None, cursor: Optional[str] = None, limit: Optional[int] = None):
+    records, next_cursor = await fetch_page(_records_query(room_id, cursor), page_size(limit))
+    return {"records": records, "next_cursor": next_cursor}
+
+
+@router.get("/records/export")
+async def admin_records_export(room_id: Optional[str] = None):
+    filename = f"records_{room_id}.ndjson" if room_id else "records.ndjson"
+    return ndjson_response(_records_query(room_id, None), filename)
+
+
+@router.get("/rooms")
+async def admin_rooms():
+    return {"rooms": list_rooms()}
+
+
+@router.post("/room/delete")
+async def admin_room_delete(payload: dict):
+    room_id = payload.get("room_id")
+    if not room_id:
+        raise HTTPException(status_code=400, detail="缺少房间ID")
+    if not await delete_room(room_id):
+        raise HTTPException(status_code=404, detail="房间不存在")
+    await store.delete(GAME_STATES, room_id)
+    game_log.discard(room_id)
+    # 房间已不存在，断开仍连在该房间上的客户端
+    room_hub.close_room(room_id)
+    game_hub.close_room(room_id)
+    return {"message": "房间已删除", "room_id": room_id}
+
+
+@router.get("/user")
+async def admin_user(id: int):
+    query = select(users.c.id, users.c.username, users.c.points).where(users.c.id == id)
+    user = await read_database.fetch_one(query)
+    if not user:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    return dict(user)
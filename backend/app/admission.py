@@ -0,0 +1,175 @@
+# app/admission.py
+"""
+WebSocket 消息的准入控制（配置 admission 一节）：
+  - 消息大小上限：超过 max_message_bytes 的消息在解析之前丢弃，并以 1009 (Message Too Big) 关闭连接
+  - 令牌桶限流：每个连接一个桶（connection_rate / connection_burst），同一路由下每个房间共享一个桶
+    （room_rate / room_burst），超出速率的消息直接丢弃，不解析也不处理。
+    连续被限流时只回复一次错误提示；连续丢弃超过 max_violations 条时以 1013 关闭连接
+  - 过载保护：后台协程每隔 lag_interval 测量事件循环的延迟，超过 overload_lag 进入过载模式，
+    降到一半以下时恢复；过载期间丢弃非关键消息（房间聊天回显、未知消息类型等），只处理游戏操作
+被拒绝的消息按原因计入 cardgame_ws_rejected_total 指标。
+"""
+import asyncio
+import logging
+import time
+from app.config import get_section
+from app.metrics import registry
+from app.wire import frame_size
+
+ADMISSION_CONFIG = get_section("admission", {
+    "max_message_bytes": 4096,
+    "connection_rate": 20,      # 每个连接每秒允许的消息数
+    "connection_burst": 40,
+    "room_rate": 60,            # 每个房间（所有连接合计）每秒允许的消息数
+    "room_burst": 120,
+    "max_violations": 200,
+    "lag_interval": 0.1,
+    "overload_lag": 0.1,        # 事件循环延迟超过该值（秒）时进入过载模式
+})
+
+# 消息过大时使用的关闭码（1009: Message Too Big）与持续超速时使用的关闭码（1013: Try Again Later）；
+# 1008 留给令牌无效（见 app/auth.py），客户端据此重新登录
+MESSAGE_TOO_BIG_CLOSE_CODE = 1009
+RATE_LIMIT_CLOSE_CODE = 1013
+
+# 拒绝原因
+TOO_BIG = "too_big"
+CONNECTION_RATE = "connection_rate"
+ROOM_RATE = "room_rate"
+SHED = "shed"
+
+WS_REJECTED = registry.counter(
+    "cardgame_ws_rejected_total", "被准入控制拒绝的 WebSocket 消息数", labels=("route", "reason"))
+EVENT_LOOP_LAG = registry.histogram("cardgame_event_loop_lag_seconds", "事件循环调度延迟")
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Limiter:
+    """一个连接的准入状态"""
+    __slots__ = ("route", "room_key", "bucket", "violations")
+
+    def __init__(self, route: str, room_key, bucket: TokenBucket):
+        self.route = route
+        self.room_key = room_key
+        self.bucket = bucket
+        self.violations = 0  # 自上一条被接受的消息以来连续被拒绝的条数
+
+
+class Admission:
+    def __init__(self, config: dict):
+        self.config = config
+        self.overloaded = False
+        self._rooms = {}  # 格式: { (路由, room_id): [TokenBucket, 连接数] }
+        self._task = None
+
+    def open(self, route: str, room_id: str = None) -> Limiter:
+        """连接建立时调用；room_id 为 None 的连接（如匹配队列）只按连接限流"""
+        room_key = None
+        if room_id is not None:
+            room_key = (route, room_id)
+            entry = self._rooms.get(room_key)
+            if entry is None:
+                entry = self._rooms[room_key] = [TokenBucket(self.config["room_rate"], self.config["room_burst"]), 0]
+            entry[1] += 1
+        bucket = TokenBucket(self.config["connection_rate"], self.config["connection_burst"])
+        return Limiter(route, room_key, bucket)
+
+    def close(self, limiter: Limiter):
+        """连接断开时调用，房间内没有连接后释放房间的令牌桶"""
+        entry = self._rooms.get(limiter.room_key)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._rooms[limiter.room_key]
+
+    def admit(self, limiter: Limiter, data) -> str:
+        """解析前的检查：返回拒绝原因，允许时返回 None；大小按编码后的字节数计算"""
+        limit = self.config["max_message_bytes"]
+        # 字符数已经超限时不必再编码
+        if len(data) > limit or frame_size(data) > limit:
+            return self._reject(limiter, TOO_BIG)
+        now = time.monotonic()
+        if not limiter.bucket.take(now):
+            return self._reject(limiter, CONNECTION_RATE)
+        entry = self._rooms.get(limiter.room_key)
+        if entry is not None and not entry[0].take(now):
+            return self._reject(limiter, ROOM_RATE)
+        limiter.violations = 0
+        return None
+
+    def shed(self, limiter: Limiter) -> bool:
+        """非关键消息：过载时返回 True（应丢弃）"""
+        if self.overloaded:
+            WS_REJECTED.inc(limiter.route, SHED)
+            return True
+        return False
+
+    def close_code(self, limiter: Limiter, reason: str):
+        """被拒绝后是否应关闭连接：返回关闭码，继续保持连接时返回 None"""
+        if reason == TOO_BIG:
+            return MESSAGE_TOO_BIG_CLOSE_CODE
+        if limiter.violations > self.config["max_violations"]:
+            return RATE_LIMIT_CLOSE_CODE
+        return None
+
+    @staticmethod
+    def notify(limiter: Limiter) -> bool:
+        """连续被拒绝时只回复第一次"""
+        return limiter.violations == 1
+
+    def _reject(self, limiter: Limiter, reason: str) -> str:
+        limiter.violations += 1
+        WS_REJECTED.inc(limiter.route, reason)
+        return reason
+
+    # ---------- 过载检测 ----------
+
+    async def _monitor(self):
+        interval = self.config["lag_interval"]
+        threshold = self.config["overload_lag"]
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - started - interval)
+            EVENT_LOOP_LAG.observe(lag)
+            if lag > threshold:
+                if not self.overloaded:
+                    logger.warning("事件循环延迟 %.0fms，进入过载模式", lag * 1000)
+                self.overloaded = True
+            elif self.overloaded and lag < threshold / 2:
+                logger.warning("事件循环延迟恢复，退出过载模式")
+                self.overloaded = False
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._monitor())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.overloaded = False
+
+
+# 全局准入控制实例
+admission = Admission(ADMISSION_CONFIG)
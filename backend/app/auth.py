@@ -0,0 +1,208 @@
+# app/auth.py
+"""
+登录会话（配置 auth 一节）：
+  - 密码以加盐的 PBKDF2-SHA256 哈希保存（格式: pbkdf2_sha256$迭代次数$盐$哈希）。哈希计算在专用线程池中执行，
+    大量同时登录也不会阻塞事件循环；旧的明文密码在该用户下次登录成功时自动升级为哈希
+  - 登录成功后签发 HMAC-SHA256 签名的会话令牌（用户名 + 过期时间），校验只需计算签名，不查询数据库
+  - 校验过的令牌保存在进程内的 LRU 缓存中，WebSocket 每条消息的身份检查只是一次字典查找
+  - 令牌通过请求头 Authorization: Bearer <token> 或查询参数 ?token= 传递（WebSocket 只能使用查询参数）
+  - require_token 为 false（默认）时，不带令牌的请求仍按请求中的 username 处理，兼容旧版客户端；
+    无法验证的令牌（已过期，或服务重启后密钥变化）同样按未携带令牌处理。
+    带了有效令牌的请求，username 必须与令牌一致（缺省时使用令牌中的用户名）
+管理后台接口（/admin/*）始终要求有效的令牌，且令牌中的用户在 admin_users 中（默认为空，即关闭管理后台）。
+secret 为空时每次启动随机生成，重启后已签发的令牌失效；多个 worker 必须配置相同的 secret，
+多 worker 部署（pubsub 不是 local 或环境变量 WEB_CONCURRENCY 大于 1）未配置 secret 时拒绝启动。
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from starlette.requests import HTTPConnection
+from app.config import get_section
+from app.pubsub import PUBSUB_CONFIG
+
+AUTH_CONFIG = get_section("auth", {
+    "secret": None,               # 令牌签名密钥
+    "token_ttl": 86400,           # 令牌有效期（秒）
+    "pbkdf2_iterations": 200000,
+    "hash_workers": 2,            # 计算密码哈希的线程数，限制登录高峰占用的 CPU
+    "cache_size": 10000,          # 令牌缓存的最大条目数
+    "require_token": False,
+    "admin_users": [],            # 可以使用管理后台接口的用户名
+})
+
+_ALGORITHM = "pbkdf2_sha256"
+_SECRET = (AUTH_CONFIG["secret"] or secrets.token_hex(32)).encode("utf-8")
+_hash_executor = ThreadPoolExecutor(max_workers=AUTH_CONFIG["hash_workers"], thread_name_prefix="password-hash")
+
+# WebSocket 握手时令牌无效使用的关闭码（1008: Policy Violation）
+AUTH_CLOSE_CODE = 1008
+
+
+# ---------- 密码哈希 ----------
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+
+
+def _hash_password(password: str) -> str:
+    iterations = AUTH_CONFIG["pbkdf2_iterations"]
+    salt = secrets.token_bytes(16)
+    return f"{_ALGORITHM}${iterations}${_b64encode(salt)}${_b64encode(_pbkdf2(password, salt, iterations))}"
+
+
+def _verify_password(password: str, stored: str) -> bool:
+    if not stored.startswith(_ALGORITHM + "$"):
+        # 升级前保存的明文密码
+        return hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8"))
+    try:
+        _, iterations, salt, expected = stored.split("$")
+        digest = _pbkdf2(password, _b64decode(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(digest, _b64decode(expected))
+
+
+def needs_rehash(stored: str) -> bool:
+    """明文密码或迭代次数已调整的哈希，登录成功后应重新计算"""
+    return not stored.startswith(f"{_ALGORITHM}${AUTH_CONFIG['pbkdf2_iterations']}$")
+
+
+async def hash_password(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, _hash_password, password)
+
+
+async def verify_password(password: str, stored: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, _verify_password, password, stored)
+
+
+# ---------- 会话令牌 ----------
+
+class SessionTokens:
+    def __init__(self, config: dict):
+        self.config = config
+        self._cache = OrderedDict()  # 格式: { token: (username, 过期时间) }，按最近使用排序
+
+    def __len__(self):
+        return len(self._cache)
+
+    def issue(self, username: str):
+        """签发令牌，返回 (token, 过期时间戳)"""
+        expires = int(time.time()) + self.config["token_ttl"]
+        body = f"{_b64encode(username.encode('utf-8'))}.{expires}"
+        token = f"{body}.{_b64encode(self._sign(body))}"
+        self._remember(token, (username, expires))
+        return token, expires
+
+    def resolve(self, token: str):
+        """返回令牌对应的用户名；签名不正确或已过期时返回 None"""
+        entry = self._cache.get(token)
+        if entry is None:
+            entry = self._verify(token)
+            if entry is None:
+                return None
+            self._remember(token, entry)
+        else:
+            self._cache.move_to_end(token)
+        if entry[1] <= time.time():
+            self._cache.pop(token, None)
+            return None
+        return entry[0]
+
+    def _sign(self, body: str) -> bytes:
+        return hmac.new(_SECRET, body.encode("ascii"), hashlib.sha256).digest()
+
+    def _verify(self, token: str):
+        try:
+            username, expires, signature = token.split(".")
+            body = f"{username}.{expires}"
+            if not hmac.compare_digest(self._sign(body), _b64decode(signature)):
+                return None
+            return _b64decode(username).decode("utf-8"), int(expires)
+        except (ValueError, UnicodeError):
+            return None
+
+    def _remember(self, token: str, entry):
+        # 只缓存签名正确的令牌，伪造的令牌无法挤占缓存
+        self._cache[token] = entry
+        if len(self._cache) > self.config["cache_size"]:
+            self._cache.popitem(last=False)
+
+
+# 全局令牌实例
+tokens = SessionTokens(AUTH_CONFIG)
+
+
+def check_secret():
+    """启动时调用：多 worker 部署时各进程随机生成的密钥互不相同，令牌会在其他 worker 上校验失败"""
+    multi_worker = PUBSUB_CONFIG["backend"] != "local" or int(os.environ.get("WEB_CONCURRENCY", "1")) > 1
+    if multi_worker and not AUTH_CONFIG["secret"]:
+        raise RuntimeError("多 worker 部署必须在配置 auth.secret 中设置相同的令牌签名密钥")
+
+
+def connection_token(connection: HTTPConnection):
+    """从请求头或查询参数中取出令牌，没有时返回 None"""
+    header = connection.headers.get("authorization", "")
+    if header[:7].lower() == "bearer ":
+        return header[7:].strip() or None
+    return connection.query_params.get("token") or None
+
+
+def check_user(token, username):
+    """
+    身份检查，返回 (用户名, None) 或 (None, (状态码, 错误提示))。
+    没有令牌且不要求令牌时原样返回 username。
+    """
+    if token is None:
+        if AUTH_CONFIG["require_token"]:
+            return None, (401, "请先登录")
+        return username, None
+    user = tokens.resolve(token)
+    if user is None:
+        if AUTH_CONFIG["require_token"]:
+            return None, (401, "登录已失效，请重新登录")
+        # 不要求令牌时，无法验证的令牌与未携带令牌相同，旧的登录状态不影响使用
+        return username, None
+    if username and username != user:
+        return None, (403, "无权以其他用户身份操作")
+    return user, None
+
+
+def authorize(connection: HTTPConnection, username=None):
+    """HTTP 接口的身份检查：返回实际操作的用户名，未通过时抛出 HTTPException"""
+    user, error = check_user(connection_token(connection), username)
+    if error is not None:
+        raise HTTPException(status_code=error[0], detail=error[1])
+    return user
+
+
+def websocket_token_rejected(token) -> bool:
+    """WebSocket 握手时的检查：要求令牌时，未携带令牌或携带了无效的令牌"""
+    if not AUTH_CONFIG["require_token"]:
+        return False
+    return token is None or tokens.resolve(token) is None
+
+
+def require_admin(connection: HTTPConnection) -> str:
+    """管理后台接口的依赖：不受 require_token 影响，必须携带有效令牌且是管理员，返回管理员用户名"""
+    token = connection_token(connection)
+    user = tokens.resolve(token) if token is not None else None
+    if user is None:
+        raise HTTPException(status_code=401, detail="请先登录")
+    if user not in AUTH_CONFIG["admin_users"]:
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    return user
@@ -0,0 +1,29 @@
+# app/config.py
+import json
+import os
+from pathlib import Path
+
+# 服务端配置文件，默认位于 backend/config/config.json，可通过环境变量 CARDGAME_CONFIG 指定其他路径
+CONFIG_PATH = Path(os.environ.get("CARDGAME_CONFIG", Path(__file__).parent.parent / "config" / "config.json"))
+
+
+def load_config(path: Path = CONFIG_PATH) -> dict:
+    """读取配置文件；文件不存在或为空时返回空字典"""
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read().strip()
+    if not content:
+        return {}
+    config = json.loads(content)
+    if not isinstance(config, dict):
+        raise ValueError("配置文件格式不正确，应为 JSON 对象")
+    return config
+
+
+settings = load_config()
+
+
+def get_section(name: str, defaults: dict) -> dict:
+    """读取配置中的某一节，未配置的项使用默认值"""
+    return {**defaults, **settings.get(name, {})}
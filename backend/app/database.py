@@ -1,15 +1,260 @@
 # app/database.py
+"""
+数据库连接（配置 database 一节）：
+  - url: 主库地址，默认使用 backend 目录下的 SQLite 文件 test.db（测试环境）
+  - pool_size: 写连接池大小；SQLite 连接会被复用，不再为每个请求新建连接和线程
+  - pragmas: 每个 SQLite 连接建立时执行的 PRAGMA（WAL、synchronous、cache_size、mmap_size 等）
+  - busy_timeout: 等待其他连接释放写锁的最长时间（毫秒）；写连接池的事务以 BEGIN IMMEDIATE 开始，
+    先读后写的事务（如结算日志去重）在开始时就排队拿写锁，不会在升级为写事务时因 SQLITE_BUSY 失败
+  - read_url / read_pool_size: 只读连接池。对局记录、管理后台、排行榜等大查询使用 read_database，
+    WAL 模式下读与写互不阻塞，读请求不会排在结算写入之后；read_url 为空时与主库使用同一个文件
+数据表和索引在启动时由 create_tables 异步创建，不再需要单独的同步 engine。
+"""
+import asyncio
+import logging
+import time
+import databases
 from databases import Database
-from sqlalchemy import create_engine, MetaData
+from databases.backends.sqlite import SQLiteBackend, SQLitePool, SQLiteConnection, SQLiteTransaction
+from sqlalchemy import MetaData
+from sqlalchemy.schema import CreateTable, CreateIndex
+from app.config import get_section
+from app.metrics import DB_QUERY_SECONDS
 
-# 使用 SQLite 数据库（测试环境），数据库文件 test.db 会在 backend 目录下创建
-DATABASE_URL = "sqlite+aiosqlite:///./test.db"
+logger = logging.getLogger(__name__)
+
+DATABASE_CONFIG = get_section("database", {
+    "url": "sqlite+aiosqlite:///./test.db",
+    "pool_size": 4,
+    "read_url": None,
+    "read_pool_size": 4,
+    "busy_timeout": 5000,
+    "pragmas": {
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "cache_size": -16000,     # 负数单位为 KiB，即每个连接约 16MB 页缓存
+        "mmap_size": 134217728,   # 128MB 内存映射读取
+    },
+})
+
+DATABASE_URL = DATABASE_CONFIG["url"]
+
+# 下面的连接池继承了 databases 的内部实现，只在固定的版本上核对过
+if not databases.__version__.startswith("0.9."):
+    raise ImportError(f"app.database 需要 databases 0.9.x（requirements.txt），当前为 {databases.__version__}")
+
+
+class PooledSQLitePool(SQLitePool):
+    """
+    复用 aiosqlite 连接的连接池（databases 自带的 SQLite 后端每次取连接都新建连接）。
+    继承了 databases 的内部实现（SQLitePool、_database_url、_options），requirements.txt 中固定了 databases 的版本，
+    升级时需要重新核对。
+    新连接建立时设置 busy_timeout 并执行配置中的 PRAGMA；read_only 的连接池额外开启 query_only，拒绝任何写入。
+    """
+
+    def __init__(self, url, pool_size: int = 4, pragmas: dict = None, read_only: bool = False,
+                 busy_timeout: int = 5000, **options):
+        super().__init__(url, **options)
+        self._pool_size = pool_size
+        self._pragmas = {"busy_timeout": busy_timeout, **(pragmas or {})}
+        self.read_only = read_only
+        self._slots = None
+        self._idle = []
+        self._closed = True
+
+    def open(self):
+        # 信号量在连接时创建，绑定到当前事件循环
+        self._slots = asyncio.Semaphore(self._pool_size)
+        self._closed = False
+
+    async def _open(self):
+        connection = await super().acquire()
+        for name, value in self._pragmas.items():
+            if not name.isidentifier():
+                raise ValueError(f"无效的 PRAGMA: {name}")
+            await connection.execute(f"PRAGMA {name} = {value}")
+        if self.read_only:
+            await connection.execute("PRAGMA query_only = ON")
+        return connection
+
+    async def acquire(self):
+        await self._slots.acquire()
+        try:
+            if self._idle:
+                return self._idle.pop()
+            return await self._open()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def release(self, connection):
+        try:
+            if connection.in_transaction:
+                # 未正常结束的事务不能带回连接池
+                await connection.rollback()
+            if self._closed:
+                await super().release(connection)
+            else:
+                self._idle.append(connection)
+        except Exception:
+            await super().release(connection)
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            await super().release(connection)
+
+
+class ImmediateSQLiteTransaction(SQLiteTransaction):
+    """最外层事务以 BEGIN IMMEDIATE 开始：开始时就获取写锁（等待 busy_timeout），嵌套事务仍使用 SAVEPOINT"""
+
+    async def start(self, is_root, extra_options):
+        if not is_root:
+            return await super().start(is_root, extra_options)
+        self._is_root = True
+        async with self._connection.raw_connection.execute("BEGIN IMMEDIATE") as cursor:
+            await cursor.close()
+
+
+class PooledSQLiteConnection(SQLiteConnection):
+    def transaction(self):
+        # 只读连接池不能用 IMMEDIATE：读事务拿写锁会阻塞所有写入
+        if self._pool.read_only:
+            return super().transaction()
+        return ImmediateSQLiteTransaction(self)
+
+
+class PooledSQLiteBackend(SQLiteBackend):
+    def __init__(self, database_url, **options):
+        super().__init__(database_url, **options)
+        self._pool = PooledSQLitePool(self._database_url, **self._options)
+
+    def connection(self):
+        return PooledSQLiteConnection(self._pool, self._dialect)
+
+    async def connect(self):
+        self._pool.open()
+
+    async def disconnect(self):
+        await self._pool.close()
+        await super().disconnect()
 
-database = Database(DATABASE_URL)
-metadata = MetaData()
 
-# 创建同步的 engine 用于创建数据表
-engine = create_engine(
-    DATABASE_URL.replace("+aiosqlite", ""),  # 替换为同步驱动
-    connect_args={"check_same_thread": False}
+class InstrumentedDatabase(Database):
+    """为查询方法记录耗时指标的 Database；name 用于在指标中区分读写连接池"""
+
+    SUPPORTED_BACKENDS = {**Database.SUPPORTED_BACKENDS, "sqlite": "app.database:PooledSQLiteBackend"}
+
+    def __init__(self, url, name: str, **options):
+        super().__init__(url, **options)
+        self.name = name
+
+    async def fetch_all(self, query, values=None):
+        started = time.perf_counter()
+        try:
+            return await super().fetch_all(query, values)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, self.name, "fetch_all")
+
+    async def fetch_one(self, query, values=None):
+        started = time.perf_counter()
+        try:
+            return await super().fetch_one(query, values)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, self.name, "fetch_one")
+
+    async def fetch_val(self, query, values=None, column=0):
+        started = time.perf_counter()
+        try:
+            return await super().fetch_val(query, values, column)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, self.name, "fetch_val")
+
+    async def execute(self, query, values=None):
+        started = time.perf_counter()
+        try:
+            return await super().execute(query, values)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, self.name, "execute")
+
+    async def iterate(self, query, values=None):
+        """流式读取：只统计等待数据库返回各行的时间，不包括调用方处理每一行（例如向客户端发送）的时间"""
+        rows = super().iterate(query, values)
+        elapsed = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    record = await rows.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - started
+                yield record
+        finally:
+            await rows.aclose()
+            DB_QUERY_SECONDS.observe(elapsed, self.name, "iterate")
+
+    async def execute_many(self, query, values):
+        started = time.perf_counter()
+        try:
+            return await super().execute_many(query, values)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, self.name, "execute_many")
+
+
+def _pool_options(url: str, pool_size: int, read_only: bool) -> dict:
+    """SQLite 使用上面的连接池；其他数据库交给对应后端自带的连接池"""
+    if url.split(":", 1)[0].split("+", 1)[0] == "sqlite":
+        return {
+            "pool_size": pool_size, "pragmas": DATABASE_CONFIG["pragmas"], "read_only": read_only,
+            "busy_timeout": DATABASE_CONFIG["busy_timeout"],
+        }
+    return {"min_size": 1, "max_size": pool_size}
+
+
+database = InstrumentedDatabase(
+    DATABASE_URL, "write", **_pool_options(DATABASE_URL, DATABASE_CONFIG["pool_size"], False)
+)
+_READ_URL = DATABASE_CONFIG["read_url"] or DATABASE_URL
+read_database = InstrumentedDatabase(
+    _READ_URL, "read", **_pool_options(_READ_URL, DATABASE_CONFIG["read_pool_size"], True)
 )
+metadata = MetaData()
+
+
+async def connect():
+    await database.connect()
+    await read_database.connect()
+
+
+async def disconnect():
+    await read_database.disconnect()
+    await database.disconnect()
+
+
+async def _drop_stale_unique_indexes(table):
+    """
+    迁移：模型中已改为普通索引、数据库中仍是唯一索引的（如 game_sessions.room_id），
+    先删除旧的唯一索引，再由 create_tables 按新定义重建。目前只检查 SQLite。
+    """
+    if database.url.dialect != "sqlite":
+        return
+    rows = await database.fetch_all(f'PRAGMA index_list("{table.name}")')
+    unique = {row["name"] for row in rows if row["unique"]}
+    for index in table.indexes:
+        if not index.unique and index.name in unique:
+            logger.info("迁移: 索引 %s 改为非唯一索引", index.name)
+            await database.execute(f'DROP INDEX "{index.name}"')
+
+
+async def create_tables():
+    """创建缺少的数据表和索引（已存在的表不会被修改，但会补建新增的索引，并执行上面的索引迁移）"""
+    for table in metadata.sorted_tables:
+        await database.execute(CreateTable(table, if_not_exists=True))
+        await _drop_stale_unique_indexes(table)
+        for index in table.indexes:
+            await database.execute(CreateIndex(index, if_not_exists=True))
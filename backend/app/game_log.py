@@ -0,0 +1,159 @@
+# app/game_log.py
+"""
+对局事件日志（配置 game_log 一节）：
+  - 游戏模块把每次状态变化记录为一条紧凑事件（开局记录随机种子，摸牌 / 出牌只记录整数牌），
+    事件先缓存在内存中，每隔 flush_interval 用一个事务批量写入 game_events
+  - 每个房间在 game_snapshots 中保留一份进行中游戏的快照：开局时写入，之后每 snapshot_interval 个事件更新一次，
+    游戏被回收时删除
+  - 启动时只读取快照以及快照之后的事件（一次关联查询），恢复时间与进行中的游戏数成正比，与历史对局总数无关
+  - 历史事件永久保留，供对局回放（纠纷处理）使用
+事件写入数据库前进程崩溃时，最多丢失最近 flush_interval 内的操作。
+"""
+import asyncio
+import json
+from sqlalchemy import select, insert, delete
+from app.config import get_section
+from app.database import database, read_database
+from app.models import game_events, game_snapshots
+
+GAME_LOG_CONFIG = get_section("game_log", {
+    "enabled": True,
+    "flush_interval": 0.1,     # 批量写入数据库的间隔（秒）
+    "snapshot_interval": 16,   # 每隔多少个事件更新一次快照
+})
+
+
+# 每条多行 INSERT 最多写入的事件数，避免超出 SQLite 单条语句的参数个数上限
+_INSERT_CHUNK = 500
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+class GameLog:
+    def __init__(self, config: dict):
+        self.config = config
+        self.enabled = config["enabled"]
+        self._events = []  # 待写入的事件行
+        self._snapshots = {}  # 待写入的快照，格式: { room_id: 快照行 或 None（删除） }
+        self._snapshot_seq = {}  # 格式: { room_id: 最近一次快照的 seq }
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    def __len__(self):
+        return len(self._events)
+
+    # ---------- 记录 ----------
+
+    def append(self, room_id: str, game_key: str, seq: int, kind: str, data: dict):
+        if self.enabled:
+            self._events.append({"game_key": game_key, "room_id": room_id, "seq": seq, "kind": kind, "data": _dumps(data)})
+
+    def snapshot_due(self, room_id: str, seq: int) -> bool:
+        last = self._snapshot_seq.get(room_id)
+        return last is None or seq - last >= self.config["snapshot_interval"]
+
+    def snapshot(self, room_id: str, game_key: str, seq: int, record: dict):
+        """record 在调用时立即编码，之后对状态的修改不会影响快照"""
+        if self.enabled:
+            self._snapshot_seq[room_id] = seq
+            self._snapshots[room_id] = {"room_id": room_id, "game_key": game_key, "seq": seq, "data": _dumps(record)}
+
+    def discard(self, room_id: str):
+        """游戏被回收或删除：删除快照，事件仍保留"""
+        if self.enabled:
+            self._snapshot_seq.pop(room_id, None)
+            self._snapshots[room_id] = None
+
+    # ---------- 写入数据库 ----------
+
+    async def flush(self):
+        async with self._flush_lock:
+            events, self._events = self._events, []
+            snapshots, self._snapshots = self._snapshots, {}
+            if not events and not snapshots:
+                return
+            try:
+                async with database.transaction():
+                    for start in range(0, len(events), _INSERT_CHUNK):
+                        await database.execute(insert(game_events).values(events[start:start + _INSERT_CHUNK]))
+                    if snapshots:
+                        await database.execute(delete(game_snapshots).where(game_snapshots.c.room_id.in_(list(snapshots))))
+                        rows = [row for row in snapshots.values() if row is not None]
+                        if rows:
+                            await database.execute(insert(game_snapshots).values(rows))
+            except Exception:
+                # 写入失败时放回缓存（保持顺序），下次重试；期间更新过的快照以新的为准
+                self._events[:0] = events
+                self._snapshots = {**snapshots, **self._snapshots}
+                raise
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.config["flush_interval"])
+            try:
+                await self.flush()
+            except Exception as e:
+                print("对局事件写入数据库失败:", e)
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并写入剩余事件（需在断开数据库之前调用）"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.enabled:
+            await self.flush()
+
+    # ---------- 读取 ----------
+
+    async def load_live(self):
+        """
+        读取所有进行中游戏的快照及其后的事件，返回 [(快照行, [事件行, ...]), ...]；
+        事件行的 data 已解码
+        """
+        snapshots = {row["room_id"]: dict(row) for row in await database.fetch_all(select(game_snapshots))}
+        query = (
+            select(game_events.c.room_id, game_events.c.seq, game_events.c.kind, game_events.c.data)
+            .select_from(game_events.join(game_snapshots, game_snapshots.c.game_key == game_events.c.game_key))
+            .where(game_events.c.seq > game_snapshots.c.seq)
+            .order_by(game_events.c.room_id, game_events.c.seq)
+        )
+        events = {}
+        for row in await database.fetch_all(query):
+            events.setdefault(row["room_id"], []).append({**dict(row), "data": json.loads(row["data"])})
+        live = []
+        for room_id, snapshot in snapshots.items():
+            snapshot["data"] = json.loads(snapshot["data"])
+            self._snapshot_seq[room_id] = snapshot["seq"]
+            live.append((snapshot, events.get(room_id, [])))
+        return live
+
+    async def events(self, game_key: str):
+        """一局游戏的全部事件（按 seq 排序），data 已解码"""
+        await self.flush()
+        query = (
+            select(game_events.c.seq, game_events.c.kind, game_events.c.data)
+            .where(game_events.c.game_key == game_key)
+            .order_by(game_events.c.seq)
+        )
+        return [{**dict(row), "data": json.loads(row["data"])} for row in await read_database.fetch_all(query)]
+
+    async def latest_game_key(self, room_id: str):
+        """房间内最近一局游戏的 game_key，没有记录时返回 None"""
+        await self.flush()
+        query = (
+            select(game_events.c.game_key)
+            .where(game_events.c.room_id == room_id)
+            .order_by(game_events.c.id.desc())
+            .limit(1)
+        )
+        return await read_database.fetch_val(query)
+
+
+# 全局对局事件日志实例
+game_log = GameLog(GAME_LOG_CONFIG)
@@ -1,16 +1,48 @@
 # app/game_manager.py
+import asyncio
 import importlib
 import json
+import logging
 from pathlib import Path
 from fastapi import HTTPException
+from app.config import get_section
+
+logger = logging.getLogger(__name__)
 
 # 定义存放游戏模式配置的目录
 GAME_MODES_DIR = Path(__file__).parent / "game_modes"
 CONFIG_DIR = GAME_MODES_DIR / "config"
 
+GAME_MODES_CONFIG = get_section("game_modes", {
+    # 检查 game_modes/config 下配置文件是否变化的间隔（秒），0 表示不做热加载
+    "reload_interval": 2.0,
+})
+
+
+class GameMode:
+    """
+    已加载的游戏模式：
+      - module: 模式代码模块，例如 app/game_modes/poker_battle.py
+      - config: 原始 JSON 配置
+      - compiled: 模式的 compile_config(config) 预先编译出的结构（权重表、计分表等）；
+        模块未提供 compile_config 时即为原始配置
+    """
+    __slots__ = ("name", "module", "config", "compiled")
+
+    def __init__(self, name: str, module, config: dict):
+        self.name = name
+        self.module = module
+        self.config = config
+        compile_config = getattr(module, "compile_config", None)
+        self.compiled = compile_config(config) if compile_config else config
+
+
 class GameManager:
     def __init__(self):
-        self.modes_config = self._load_modes_config()
+        # 启动时一次性发现、导入并编译所有模式；配置有误时直接抛出异常，避免带着错误配置启动
+        self._signature = self._config_signature()
+        self.modes = self._load_modes(self._load_modes_config())
+        self._watch_task = None
 
     def _load_modes_config(self):
         """
@@ -40,22 +72,76 @@ class GameManager:
                     raise HTTPException(status_code=500, detail=f"加载游戏模式配置 {mode_name} 失败: {str(e)}")
             return modes_config
 
+    def _load_modes(self, modes_config: dict):
+        """导入每个模式的代码模块并编译配置，返回 { 模式名: GameMode }"""
+        modes = {}
+        for mode_name, config in modes_config.items():
+            try:
+                module = importlib.import_module(f"app.game_modes.{mode_name}")
+                modes[mode_name] = GameMode(mode_name, module, config)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"加载游戏模式 {mode_name} 失败: {str(e)}")
+        return modes
+
+    @staticmethod
+    def _config_signature():
+        """配置目录中所有 JSON 文件的 (文件名, 修改时间, 大小)，用于判断是否需要重新加载"""
+        return frozenset(
+            (path.name, stat.st_mtime_ns, stat.st_size)
+            for path in CONFIG_DIR.glob("*.json")
+            for stat in (path.stat(),)
+        )
+
+    def reload(self) -> bool:
+        """
+        配置文件有变化时重新加载并编译所有模式，返回是否发生了重新加载。
+        新配置整体编译成功后才一次性替换；进行中的对局在开局时已持有编译好的配置，不受影响。
+        新配置有误时保留旧配置并抛出异常。
+        """
+        signature = self._config_signature()
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        self.modes = self._load_modes(self._load_modes_config())
+        return True
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self.reload():
+                    logger.info("游戏模式配置已重新加载: %s", ", ".join(self.modes))
+            except HTTPException as e:
+                logger.warning("游戏模式配置重新加载失败，继续使用旧配置: %s", e.detail)
+
+    def start_watching(self):
+        interval = GAME_MODES_CONFIG["reload_interval"]
+        if interval and self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch(interval))
+
+    def stop_watching(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+
+    def get_mode(self, mode_name: str) -> GameMode:
+        mode = self.modes.get(mode_name)
+        if mode is None:
+            raise HTTPException(status_code=400, detail=f"游戏模式 {mode_name} 不存在")
+        return mode
+
     def get_mode_config(self, mode_name: str):
         """读取指定游戏模式的配置"""
-        if mode_name not in self.modes_config:
-            raise HTTPException(status_code=400, detail=f"游戏模式 {mode_name} 不存在")
-        return self.modes_config[mode_name]
+        return self.get_mode(mode_name).config
+
+    def get_compiled_config(self, mode_name: str):
+        """读取指定游戏模式当前编译好的配置"""
+        return self.get_mode(mode_name).compiled
 
     async def start_game(self, mode_name: str, room):
-        """根据模式名启动游戏（异步版本）"""
-        config = self.get_mode_config(mode_name)
-        try:
-            # 动态加载游戏模式处理代码模块，例如 app/game_modes/poker_battle.py
-            module = importlib.import_module(f"app.game_modes.{mode_name}")
-            # 调用模块中的异步函数 start_game(room, config) 并等待结果
-            return await module.start_game(room, config)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"加载游戏模式 {mode_name} 失败: {str(e)}")
+        """根据模式名启动游戏（异步版本），模式模块和编译好的配置均已在启动时准备好"""
+        mode = self.get_mode(mode_name)
+        return await mode.module.start_game(room, mode.compiled)
 
 # 创建全局 GameManager 实例
 game_manager = GameManager()
@@ -0,0 +1,103 @@
+# app/game_modes/cards.py
+"""
+紧凑的整数牌型表示：
+  - 每张牌用 0~51 的整数编码：code = 花色下标 * 13 + 牌值下标
+  - 牌堆与手牌基于 array 存储并使用 __slots__，降低每个房间的内存占用
+  - 权重表在加载模式配置时一次性构建，比较牌面只需一次下标访问
+  - 字典形式的牌（{"suit": ..., "rank": ...}）只在协议边界进行转换
+"""
+import random
+from array import array
+
+SUITS = ("clubs", "diamonds", "hearts", "spades")
+RANKS = ("A", "2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K")
+DECK_SIZE = len(SUITS) * len(RANKS)
+
+_SUIT_INDEX = {suit: i for i, suit in enumerate(SUITS)}
+_RANK_INDEX = {rank: i for i, rank in enumerate(RANKS)}
+# 预先生成每张牌的 (花色, 牌值)，转换为字典时无需再做除法和取模
+_CARD_PARTS = tuple((suit, rank) for suit in SUITS for rank in RANKS)
+# 每张牌的字典形式只生成一次，广播完整状态时不再为每张牌新建字典
+_CARD_DICTS = tuple({"suit": suit, "rank": rank} for suit, rank in _CARD_PARTS)
+
+
+def card_to_dict(code: int) -> dict:
+    """整数牌 -> 协议使用的字典形式（返回共享的字典，调用方不得修改）"""
+    return _CARD_DICTS[code]
+
+
+def card_from_dict(card) -> int | None:
+    """协议中的字典牌 -> 整数牌，格式不合法时返回 None"""
+    if not isinstance(card, dict):
+        return None
+    suit = _SUIT_INDEX.get(str(card.get("suit", "")).lower())
+    rank = _RANK_INDEX.get(str(card.get("rank", "")))
+    if suit is None or rank is None:
+        return None
+    return suit * len(RANKS) + rank
+
+
+def build_weight_table(config) -> tuple:
+    """根据模式配置一次性构建 52 张牌的权重表：权重 = (牌值 * 10) + 花色权重"""
+    card_value_order = config.get("card_value_order", {})
+    suit_order = config.get("suit_order", {})
+    return tuple(
+        card_value_order.get(rank, 0) * 10 + suit_order.get(suit, 0)
+        for suit, rank in _CARD_PARTS
+    )
+
+
+class Deck:
+    """牌堆：从数组尾部摸牌，摸牌为 O(1)"""
+    __slots__ = ("_cards",)
+
+    def __init__(self, cards=None):
+        self._cards = array("B", range(DECK_SIZE) if cards is None else cards)
+
+    def shuffle(self, rng=random):
+        rng.shuffle(self._cards)
+
+    def draw(self) -> int:
+        return self._cards.pop()
+
+    def codes(self) -> list:
+        """按内部存储顺序返回整数牌列表（用于序列化，可原样传回构造函数）"""
+        return self._cards.tolist()
+
+    def __len__(self):
+        return len(self._cards)
+
+    def __iter__(self):
+        # 按摸牌顺序迭代（下一张要摸的牌在最前）
+        return reversed(self._cards)
+
+
+class Hand:
+    """手牌：玩家手中的整数牌集合"""
+    __slots__ = ("_cards",)
+
+    def __init__(self, cards=()):
+        self._cards = array("B", cards)
+
+    def add(self, code: int):
+        self._cards.append(code)
+
+    def remove(self, code: int) -> bool:
+        """移除一张牌，手牌中没有该牌时返回 False"""
+        try:
+            self._cards.remove(code)
+        except ValueError:
+            return False
+        return True
+
+    def codes(self) -> list:
+        return self._cards.tolist()
+
+    def __contains__(self, code):
+        return code in self._cards
+
+    def __len__(self):
+        return len(self._cards)
+
+    def __iter__(self):
+        return iter(self._cards)
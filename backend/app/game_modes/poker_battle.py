@@ -1,68 +1,356 @@
 import random
 import json
+import hashlib
+import logging
+import time
 from datetime import datetime
-from fastapi import HTTPException, WebSocket, WebSocketDisconnect, APIRouter
-from sqlalchemy import select, update, insert
-from app.database import database
-from app.models import users, game_records,game_sessions
-from app.room_manager import get_room_info
-from pathlib import Path
+from functools import partial
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect, APIRouter, Depends
+from sqlalchemy import select
+from app.settlement import settle_game, settlement_key
+from app.database import read_database
+from app.models import game_sessions
+from app.game_log import game_log
+from app.room_manager import get_room_info, restore_room, set_playing
+from app.ws_hub import game_hub, dumps as _dumps
+from app import wire
+from app.metrics import WS_MESSAGE_BYTES
+from app.room_actor import RoomActors
+from app.admission import admission
+from app.auth import connection_token, check_user, websocket_token_rejected, require_admin, AUTH_CLOSE_CODE
+from app.state_store import store, VersionConflict
+from app.lifecycle import lifecycle, LIFECYCLE_CONFIG
+from app.game_modes.cards import Deck, Hand, DECK_SIZE, build_weight_table, card_from_dict, card_to_dict
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
-# 加载配置文件
-def load_config():
-    config_path = Path(__file__).parent / "config" / "poker_battle.json"
-    try:
-        with open(config_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="无法加载游戏模式配置: " + str(e))
+# 每个房间的游戏状态保存在共享状态存储的 game_states 命名空间中（值为 GameState）
+# 牌以 0~51 的整数表示，只在协议边界转换为字典
+GAME_STATES = "game_states"
+# 协议模式：legacy 每次广播完整状态；delta 只在加入、重开和序号断档时发送快照，其余发送增量补丁；
+# binary 与 delta 语义相同，但使用紧凑的二进制帧（见 app/wire.py）
+PROTOCOL_LEGACY = "legacy"
+PROTOCOL_DELTA = "delta"
+PROTOCOL_BINARY = wire.PROTOCOL_BINARY
+# 支持的玩家人数（scoring 中对应 "<n>_players"）
+PLAYER_COUNTS = (2, 3)
+
+
+class PokerRules:
+    """
+    由 GameManager 在启动和配置热加载时编译好的规则：
+      - config: 原始配置
+      - weights: 52 张牌的权重表
+      - scores: { 玩家人数: 各名次得分 }
+      - digest: 配置内容摘要，用于在序列化的游戏状态中引用规则
+    """
+    __slots__ = ("config", "weights", "scores", "digest")
+
+    def __init__(self, config):
+        self.config = config
+        self.weights = build_weight_table(config)
+        self.scores = {n: rank_scores(config, n) for n in PLAYER_COUNTS if f"{n}_players" in config["scoring"]}
+        self.digest = hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def scores_for(self, player_count: int):
+        scores = self.scores.get(player_count)
+        if scores is None:
+            raise HTTPException(status_code=400, detail="不支持该玩家数量")
+        return scores
+
+
+# 本进程编译过的规则，格式: { digest: PokerRules }；热加载后旧规则仍保留，供进行中的对局使用，
+# 回收对局时由 prune_rules 移除已经没有对局引用的旧规则
+_RULES = {}
+# 两次清理旧规则之间的最短间隔（秒），避免每回收一局都遍历所有对局
+_RULES_PRUNE_INTERVAL = 60
+_rules_pruned_at = 0.0
+
+
+def compile_config(config) -> PokerRules:
+    """GameManager 调用的编译入口"""
+    rules = PokerRules(config)
+    return _RULES.setdefault(rules.digest, rules)
+
+
+def current_rules() -> PokerRules:
+    """当前生效的规则（用于开新局）"""
+    # 延迟导入：game_manager 在初始化时会导入本模块
+    from app.game_manager import game_manager
+    return game_manager.get_compiled_config("poker_battle")
+
+
+class GameState:
+    """
+    单个房间的游戏状态：
+      - deck: 牌堆（Deck）
+      - hands: { username: Hand }
+      - table: { username: 整数牌 or None }（None 表示未出牌）
+      - drawn / played: 已摸牌 / 已出牌的玩家集合
+      - game_time: 游戏开始时间；finished: 是否已结束
+      - version: 房间状态版本号，每次状态变化递增，作为增量广播的序号
+      - rules: 开局时生效的规则（PokerRules），配置热加载不影响进行中的对局
+    """
+    __slots__ = ("deck", "hands", "table", "drawn", "played", "game_time", "finished", "version", "rules")
+
+    def __init__(self, players, deck, rules):
+        self.deck = deck
+        self.rules = rules
+        self.hands = {player: Hand() for player in players}
+        self.table = dict.fromkeys(players)
+        self.drawn = set()
+        self.played = set()
+        self.game_time = datetime.utcnow()
+        self.finished = False
+        self.version = 0
+
+    def table_to_dict(self):
+        return {player: None if card is None else card_to_dict(card) for player, card in self.table.items()}
+
+    def to_record(self):
+        """序列化为可 JSON 编码的紧凑记录（供需要持久化的状态存储后端使用）"""
+        return {
+            "deck": self.deck.codes(),
+            "hands": {player: hand.codes() for player, hand in self.hands.items()},
+            "table": self.table,
+            "drawn": list(self.drawn),
+            "played": list(self.played),
+            "game_time": self.game_time.isoformat(),
+            "finished": self.finished,
+            "version": self.version,
+            "rules": self.rules.digest
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        state = cls.__new__(cls)
+        state.deck = Deck(record["deck"])
+        state.hands = {player: Hand(cards) for player, cards in record["hands"].items()}
+        state.table = record["table"]
+        state.drawn = set(record["drawn"])
+        state.played = set(record["played"])
+        state.game_time = datetime.fromisoformat(record["game_time"])
+        state.finished = record["finished"]
+        state.version = record["version"]
+        # 其他 worker 开局时使用的规则本进程未编译过时（例如刚热加载），退回当前规则
+        state.rules = _RULES.get(record.get("rules")) or current_rules()
+        return state
+
+    def player_flags(self, player):
+        return {"drawn": player in self.drawn, "played": player in self.played}
+
+    def player_index(self, player) -> int:
+        """玩家的入座序号（二进制协议中引用玩家使用）"""
+        return list(self.hands).index(player)
+
+    def binary_snapshot(self, restart: bool = False) -> bytes:
+        """二进制协议使用的完整快照"""
+        players = [
+            (player, player in self.drawn, player in self.played, self.table[player], hand.codes())
+            for player, hand in self.hands.items()
+        ]
+        return wire.snapshot(self.version, len(self.deck), self.finished, self.game_time, players, restart)
+
+    def to_dict(self):
+        """转换为协议使用的字典形式（与旧版状态格式保持一致）"""
+        return {
+            "deck": [card_to_dict(card) for card in self.deck],
+            **self._public_dict()
+        }
+
+    def snapshot(self):
+        """增量协议使用的完整快照：牌堆只下发剩余张数"""
+        return {"deck_count": len(self.deck), "seq": self.version, **self._public_dict()}
+
+    def _public_dict(self):
+        return {
+            "hands": {player: [card_to_dict(card) for card in hand] for player, hand in self.hands.items()},
+            "table": self.table_to_dict(),
+            "playerActions": {player: self.player_flags(player) for player in self.hands},
+            "game_time": self.game_time,
+            "finished": self.finished
+        }
+
+
+def card_weight(card, rules: PokerRules):
+    """整数牌的权重：权重 = (牌值 * 10) + 花色权重"""
+    return rules.weights[card]
+
+
+def rank_scores(config, player_count: int):
+    """按名次（牌面权重从大到小）返回每个名次的得分变化"""
+    scoring = config["scoring"]
+    if player_count == 2:
+        return scoring["2_players"]["win"], scoring["2_players"]["lose"]
+    if player_count == 3:
+        return scoring["3_players"]["win"], scoring["3_players"]["draw"], scoring["3_players"]["lose"]
+    raise HTTPException(status_code=400, detail="不支持该玩家数量")
 
 
-CONFIG = load_config()
+def compute_results(table, weights, scores):
+    """
+    结算规则：按牌面权重从大到小排名，依次获得 scores 中对应名次的得分。
+    权重相同时保持桌面（入座）顺序。table 格式: { username: 整数牌 }
+    """
+    played = sorted(table.items(), key=lambda x: weights[x[1]], reverse=True)
+    return {player: score for (player, _), score in zip(played, scores)}
+
+
+store.register_codec(GAME_STATES, GameState.to_record, GameState.from_record)
+
+
+# 游戏因长时间无活动被回收时，关闭仍连着的客户端使用的关闭码（1001: Going Away）
+GAME_EXPIRED_CLOSE_CODE = 1001
+
+
+def _touch(room_id: str, state):
+    """记录一次游戏活动；游戏中的活动同样会推迟所在房间的回收"""
+    ttl = LIFECYCLE_CONFIG["finished_game_ttl"] if state.finished else LIFECYCLE_CONFIG["game_idle_ttl"]
+    lifecycle.touch("game", room_id, ttl)
+    lifecycle.touch("room", room_id, LIFECYCLE_CONFIG["room_idle_ttl"])
+
 
-# 全局字典存储每个房间的游戏状态
-# 状态中新增 playerActions 字段，用于记录每个玩家是否已摸牌和出牌
-game_states = {}  # 格式: { room_id: { "deck": [...], "hands": { username: [cards] }, "table": { username: card or None }, "playerActions": { username: { drawn: bool, played: bool } }, "game_time": datetime, "finished": bool } }
-# 全局字典存储 WebSocket 连接，用于广播消息
-ws_connections = {}  # 格式: { room_id: [WebSocket, ...] }
+async def _inspect_game(room_id: str):
+    state, version = await store.get(GAME_STATES, room_id)
+    if state is None:
+        return None
+    return version, LIFECYCLE_CONFIG["finished_game_ttl"] if state.finished else LIFECYCLE_CONFIG["game_idle_ttl"]
 
 
-def card_weight(card, config):
-    """根据配置计算牌面权重：权重 = (牌值 * 10) + 花色权重"""
-    card_value_order = config.get("card_value_order", {})
-    suit_order = config.get("suit_order", {})
-    rank_weight = card_value_order.get(card["rank"], 0)
-    suit_weight = suit_order.get(card["suit"].lower(), 0)
-    return rank_weight * 10 + suit_weight
+async def _reclaim_game(room_id: str):
+    global _rules_pruned_at
+    await store.delete(GAME_STATES, room_id)
+    await set_playing(room_id, False)
+    game_log.discard(room_id)
+    game_hub.close_room(room_id, GAME_EXPIRED_CLOSE_CODE)
+    game_actors.stop(room_id)
+    if len(_RULES) > 1 and time.monotonic() - _rules_pruned_at >= _RULES_PRUNE_INTERVAL:
+        _rules_pruned_at = time.monotonic()
+        await prune_rules()
+
+
+async def prune_rules() -> int:
+    """从 _RULES 中移除没有对局引用的旧规则（当前规则始终保留），返回移除的数量"""
+    live = {current_rules().digest}
+    for room_id in await store.keys(GAME_STATES):
+        state, _ = await store.get(GAME_STATES, room_id)
+        if state is not None:
+            live.add(state.rules.digest)
+    stale = [digest for digest in _RULES if digest not in live]
+    for digest in stale:
+        del _RULES[digest]
+    if stale:
+        logger.info("已移除 %d 份没有对局使用的旧规则", len(stale))
+    return len(stale)
+
+
+lifecycle.register("game", _inspect_game, _reclaim_game)
+
+
+def _log(room_id: str, state, kind: str, data: dict):
+    """记录一条对局事件（seq 为操作后的版本号）；开局时以及每隔 snapshot_interval 个事件写一次快照"""
+    game_key = settlement_key(room_id, state.game_time)
+    game_log.append(room_id, game_key, state.version, kind, data)
+    if kind == "init" or game_log.snapshot_due(room_id, state.version):
+        game_log.snapshot(room_id, game_key, state.version, state.to_record())
+
+
+def _state_from_init(data: dict, seq: int):
+    """根据开局事件重建初始状态：用记录的随机种子重新洗牌"""
+    rules = _RULES.get(data["rules"]) or current_rules()
+    deck = Deck()
+    deck.shuffle(random.Random(data["seed"]))
+    state = GameState(data["players"], deck, rules)
+    state.game_time = datetime.fromisoformat(data["game_time"])
+    state.version = seq
+    return state
 
 
-async def initialize_game(room, config):
+def _apply_event(state, kind: str, seq: int, data: dict) -> bool:
+    """把一条事件应用到游戏状态上（重启恢复与对局回放共用）；事件与状态不一致时返回 False"""
+    consistent = True
+    if kind == "draw":
+        consistent = state.deck.draw() == data["c"]
+        state.hands[data["u"]].add(data["c"])
+        state.drawn.add(data["u"])
+    elif kind == "play":
+        consistent = state.hands[data["u"]].remove(data["c"])
+        state.table[data["u"]] = data["c"]
+        state.played.add(data["u"])
+    elif kind == "finish":
+        state.finished = True
+    elif kind == "reopen":
+        state.finished = False
+    state.version = seq
+    return consistent
+
+
+async def restore_games() -> int:
+    """
+    进程重启后根据事件日志重建进行中的游戏：从每个房间的最近快照开始重放其后的事件。
+    状态存储中已有同样新或更新的状态时（例如持久化的状态存储）不覆盖。
+    房间已不存在时（进程内状态存储）以游戏中的玩家补建房间，玩家可以重新进入。返回恢复的游戏数。
+    """
+    restored = 0
+    for snapshot, events in await game_log.load_live():
+        room_id = snapshot["room_id"]
+        state = GameState.from_record(snapshot["data"])
+        if not all(_apply_event(state, event["kind"], event["seq"], event["data"]) for event in events):
+            logger.warning("房间 %s 的对局事件与快照不一致，跳过恢复", room_id)
+            continue
+        existing, version = await store.get(GAME_STATES, room_id)
+        if existing is not None and existing.version >= state.version:
+            continue
+        try:
+            await store.put(GAME_STATES, room_id, state, version)
+        except VersionConflict:
+            continue
+        await restore_room(room_id, list(state.hands), "poker_battle", playing=not state.finished)
+        restored += 1
+    return restored
+
+
+async def get_game_state(room_id: str):
+    state, _ = await store.get(GAME_STATES, room_id)
+    return state
+
+
+async def initialize_game(room, rules: PokerRules):
     """
     初始化游戏状态：
-      - 生成52张牌的牌堆（牌以字典形式表示：{ "suit": "spades", "rank": "7" }）
-      - 初始化每个玩家的手牌为空
-      - 桌面出牌记录初始化为 None（表示未出牌）
-      - 为每个玩家设置 playerActions 标志 { drawn: False, played: False }
+      - 生成并洗好 52 张整数牌的牌堆
+      - 初始化每个玩家的手牌为空、桌面出牌为 None（表示未出牌）
       - 记录游戏开始时间和标记游戏未结束
     """
     room_id = room["room_id"]
-    suits = ["clubs", "diamonds", "hearts", "spades"]
-    ranks = ["A", "2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K"]
-    deck = [{"suit": suit, "rank": rank} for suit in suits for rank in ranks]
-    random.shuffle(deck)
-    players = list(room["users"].keys())
-    state = {
-        "deck": deck,
-        "hands": {player: [] for player in players},
-        "table": {player: None for player in players},
-        "playerActions": {player: {"drawn": False, "played": False} for player in players},
-        "game_time": datetime.utcnow(),
-        "finished": False
-    }
-    game_states[room_id] = state
+    # 记录洗牌使用的随机种子，回放时可以重新得到同样的牌堆（53 位以内，前端 JSON 解析不丢失精度）
+    seed = random.getrandbits(53)
+    deck = Deck()
+    deck.shuffle(random.Random(seed))
+    state = GameState(list(room["users"].keys()), deck, rules)
+    while True:
+        # 同一房间重开时版本号继续递增，保证客户端看到的序号单调
+        previous, version = await store.get(GAME_STATES, room_id)
+        if previous is not None:
+            state.version = previous.version + 1
+        try:
+            await store.put(GAME_STATES, room_id, state, version)
+        except VersionConflict:
+            continue
+        _log(room_id, state, "init", {
+            "seed": seed, "players": list(state.hands), "rules": rules.digest, "game_time": state.game_time.isoformat()
+        })
+        _touch(room_id, state)
+        await set_playing(room_id, True)
+        return state
+
+
+def _require_state(state):
+    if state is None:
+        raise HTTPException(status_code=400, detail="游戏状态未初始化")
     return state
 
 
@@ -70,190 +358,427 @@ async def draw_card(room_id: str, username: str):
     """
     摸牌操作：
       - 如果该玩家已摸牌，则拒绝再次摸牌
-      - 否则从牌堆中抽取一张牌，加入玩家手牌，并将 playerActions[username].drawn 置为 True
+      - 否则从牌堆中抽取一张牌，加入玩家手牌，并标记为已摸牌
     """
-    if room_id not in game_states:
-        raise HTTPException(status_code=400, detail="游戏状态未初始化")
-    state = game_states[room_id]
-    if state["playerActions"].get(username, {}).get("drawn", False):
-        raise HTTPException(status_code=400, detail="已摸牌，无法重复摸牌")
-    if not state["deck"]:
-        raise HTTPException(status_code=400, detail="牌堆为空")
-    card = state["deck"].pop(0)
-    state["hands"][username].append(card)
-    state["playerActions"][username]["drawn"] = True
+    def mutate(state):
+        _require_state(state)
+        if username not in state.hands:
+            raise HTTPException(status_code=400, detail="玩家不在本局游戏中")
+        if username in state.drawn:
+            raise HTTPException(status_code=400, detail="已摸牌，无法重复摸牌")
+        if not state.deck:
+            raise HTTPException(status_code=400, detail="牌堆为空")
+        card = state.deck.draw()
+        state.hands[username].add(card)
+        state.drawn.add(username)
+        state.version += 1
+        return card, state
+    card, state = await store.update(GAME_STATES, room_id, mutate)
+    _log(room_id, state, "draw", {"u": username, "c": card})
+    _touch(room_id, state)
     return card, state
 
 
-async def play_card(room_id: str, username: str, card: dict):
+async def play_card(room_id: str, username: str, card: int):
     """
     出牌操作：
       - 如果该玩家已出牌，则拒绝重复出牌
-      - 检查玩家手牌中是否存在该牌，若存在则移除，并记录到桌面出牌，同时将 playerActions[username].played 置为 True
+      - 检查玩家手牌中是否存在该牌，若存在则移除，并记录到桌面出牌，同时标记为已出牌
     """
-    if room_id not in game_states:
-        raise HTTPException(status_code=400, detail="游戏状态未初始化")
-    state = game_states[room_id]
-    if state["playerActions"].get(username, {}).get("played", False):
-        raise HTTPException(status_code=400, detail="已出牌，无法重复出牌")
-    if username not in state["hands"] or card not in state["hands"][username]:
-        raise HTTPException(status_code=400, detail="该玩家没有这张牌")
-    state["hands"][username].remove(card)
-    state["table"][username] = card
-    state["playerActions"][username]["played"] = True
+    def mutate(state):
+        _require_state(state)
+        if username in state.played:
+            raise HTTPException(status_code=400, detail="已出牌，无法重复出牌")
+        hand = state.hands.get(username)
+        if card is None or hand is None or not hand.remove(card):
+            raise HTTPException(status_code=400, detail="该玩家没有这张牌")
+        state.table[username] = card
+        state.played.add(username)
+        state.version += 1
+        return state
+    state = await store.update(GAME_STATES, room_id, mutate)
+    _log(room_id, state, "play", {"u": username, "c": card})
+    _touch(room_id, state)
     return state
 
 
-async def finish_game(room, config):
-    room_id = room["room_id"]
-    if room_id not in game_states:
-        raise HTTPException(status_code=400, detail="游戏状态未初始化")
-    state = game_states[room_id]
-    if state["finished"]:
-        raise HTTPException(status_code=400, detail="该局游戏已结束")
-    if any(card is None for card in state["table"].values()):
-        raise HTTPException(status_code=400, detail="并非所有玩家都已出牌")
-
-    played = list(state["table"].items())
-    played.sort(key=lambda x: card_weight(x[1], config), reverse=True)
-
-    results = {}
-    if len(played) == 2:
-        results[played[0][0]] = CONFIG["scoring"]["2_players"]["win"]
-        results[played[1][0]] = CONFIG["scoring"]["2_players"]["lose"]
-    elif len(played) == 3:
-        results[played[0][0]] = CONFIG["scoring"]["3_players"]["win"]
-        results[played[1][0]] = CONFIG["scoring"]["3_players"]["draw"]
-        results[played[2][0]] = CONFIG["scoring"]["3_players"]["lose"]
-    else:
-        raise HTTPException(status_code=400, detail="不支持该玩家数量")
-
-    # 创建对局 session 并获取 session_id
-    players = list(state["table"].keys())
-    game_time = state["game_time"]
-    session_insert = insert(game_sessions).values(
-        room_id=room_id,
-        game_time=game_time,
-        players=",".join(players)
-    )
-    session_id = await database.execute(session_insert)
-
-    for player in players:
-        query = select(users).where(users.c.username == player)
-        user_data = await database.fetch_one(query)
-        if not user_data:
-            continue
-        score_change = results.get(player, 0)
-        new_points = user_data["points"] + score_change
-        upd = update(users).where(users.c.id == user_data["id"]).values(points=new_points)
-        await database.execute(upd)
-        opponents = [p for p in players if p != player]
-        opponents_str = ",".join(opponents)
-        if score_change > 0:
-            result_label = "win"
-        elif score_change < 0:
-            result_label = "loss"
-        else:
-            result_label = "draw"
-        record = {
-            "user_id": user_data["id"],
-            "session_id": session_id,
-            "game_time": game_time,
-            "room_id": room_id,
-            "opponents": opponents_str,
-            "result": result_label,
-            "score_change": score_change
-        }
-        ins = insert(game_records).values(**record)
-        await database.execute(ins)
+def _set_finished(finished: bool):
+    def mutate(state):
+        _require_state(state)
+        state.finished = finished
+        state.version += 1
+        return state
+    return mutate
+
 
-    state["finished"] = True
-    return {"results": results, "table": state["table"]}
+async def finish_game(room):
+    result, _ = await _finish(room["room_id"])
+    return result
 
 
-async def start_game_http(room, config):
-    state = await initialize_game(room, config)
-    return {"game_state": state, "mode": "poker_battle"}
+async def _finish(room_id: str):
+    """结算本局（按开局时的规则），返回 (结算结果, 结算后的状态)"""
 
+    def claim(state):
+        # 先在状态存储中把本局标记为已结束，多个进程同时结算时只有一个能成功
+        _require_state(state)
+        if state.finished:
+            raise HTTPException(status_code=400, detail="该局游戏已结束")
+        if any(card is None for card in state.table.values()):
+            raise HTTPException(status_code=400, detail="并非所有玩家都已出牌")
 
-async def start_game(room, config):
-    return await start_game_http(room, config)
+        rules = state.rules
+        results = compute_results(state.table, rules.weights, rules.scores_for(len(state.table)))
+        state.finished = True
+        state.version += 1
+        return results, state
+
+    results, state = await store.update(GAME_STATES, room_id, claim)
+    try:
+        # 在单个事务中写入对局 session、积分变化和对局记录
+        await settle_game(room_id, state.game_time, results)
+    except Exception:
+        # 结算失败时撤销结束标记，允许重新结算
+        reopened = await store.update(GAME_STATES, room_id, _set_finished(False))
+        _log(room_id, reopened, "reopen", {})
+        raise
+    _log(room_id, state, "finish", {"results": results})
+    _touch(room_id, state)
+    await set_playing(room_id, False)
+    return {"results": results, "table": state.table_to_dict()}, state
+
+
+async def start_game_http(room, rules: PokerRules):
+    state = await initialize_game(room, rules)
+    return {"game_state": state.to_dict(), "mode": "poker_battle"}
+
+
+async def start_game(room, rules: PokerRules):
+    """GameManager 调用的开局入口，rules 为 compile_config 编译好的配置"""
+    return await start_game_http(room, rules)
 
 
 ##########################
 # WebSocket 路由集成
 ##########################
 
+def broadcast(room_id: str, legacy_message: dict, delta_message: dict = None, binary_message=None):
+    """
+    向房间内所有连接广播：每种协议模式的消息只编码一次，房间内没有该协议的连接时不编码。
+    delta_message 为 None 时，增量协议的连接也收到 legacy_message；
+    binary_message 为生成二进制帧的无参函数。
+    """
+    legacy_text = None
+
+    def encode(protocol):
+        nonlocal legacy_text
+        if protocol == PROTOCOL_BINARY:
+            return binary_message()
+        if protocol == PROTOCOL_DELTA and delta_message is not None:
+            return _dumps(delta_message)
+        if legacy_text is None:
+            legacy_text = _dumps(legacy_message)
+        return legacy_text
+
+    game_hub.broadcast(room_id, encode)
+
+
+def _card_arg(card):
+    """客户端消息中的牌：整数编码（二进制协议或 JSON 中的整数），或旧版的字典形式"""
+    if type(card) is int:
+        return card if 0 <= card < DECK_SIZE else None
+    return card_from_dict(card)
+
+
+def _flags_op(state, username):
+    return {"op": "flags", "username": username, **state.player_flags(username)}
+
+
+class _Batch:
+    """
+    房间 actor 一个批次内产生的消息，在批次结束时按顺序发送：
+      - 连续的摸牌 / 出牌合并为一次广播：legacy 只发送最后一条（附带合并结束时的完整状态），
+        delta 合并为一条 patch（包含多个操作时附带 base，即合并前的序号），二进制协议把各帧拼接为一条消息
+      - 结算、重开、广播的错误提示单独广播；只发给一个连接的消息在记录时立即编码
+    游戏状态可能在同一批次的后续操作中被原地修改，因此记录时保存的都是当时的值。
+    """
+    __slots__ = ("room_id", "_segments", "_legacy", "_ops", "_frames", "_base", "_seq", "_state")
+
+    def __init__(self, room_id: str):
+        self.room_id = room_id
+        self._segments = []  # 格式: [(None, legacy 消息, delta 消息, 二进制帧函数) 或 (连接, 已编码消息), ...]
+        self._ops = None  # 尚未结束的连续摸牌 / 出牌的增量操作，None 表示没有
+
+    def action(self, state, legacy_message: dict, ops: list, frame):
+        """记录一次摸牌 / 出牌；frame 为生成二进制帧的无参函数"""
+        if self._ops is None:
+            self._ops, self._frames, self._base = [], [], state.version - 1
+        self._legacy = legacy_message
+        self._ops.extend(ops)
+        self._frames.append(frame)
+        self._seq = state.version
+        self._state = state
+
+    def end_run(self):
+        """结束当前的连续摸牌 / 出牌（之后状态将被结算等操作修改时调用）"""
+        if self._ops is None:
+            return
+        patch = {"action": "patch", "seq": self._seq, "ops": self._ops}
+        if self._base != self._seq - 1:
+            patch["base"] = self._base
+        frames = self._frames
+        self._segments.append((
+            None,
+            {**self._legacy, "state": self._state.to_dict()},
+            patch,
+            frames[0] if len(frames) == 1 else lambda: b"".join(frame() for frame in frames),
+        ))
+        self._ops = self._state = None
+
+    def broadcast(self, legacy_message: dict, delta_message: dict = None, binary_message=None):
+        self.end_run()
+        self._segments.append((None, legacy_message, delta_message, binary_message))
+
+    def broadcast_error(self, detail: str):
+        self.broadcast({"action": "error", "detail": detail}, binary_message=lambda: wire.error(detail))
+
+    def send(self, conn, message: dict, binary_message):
+        self.end_run()
+        self._segments.append((conn, binary_message() if conn.protocol == PROTOCOL_BINARY else _dumps(message)))
+
+    def send_error(self, conn, detail: str):
+        self.send(conn, {"action": "error", "detail": detail}, lambda: wire.error(detail))
+
+    def flush(self):
+        self.end_run()
+        for segment in self._segments:
+            if segment[0] is None:
+                broadcast(self.room_id, *segment[1:])
+            else:
+                game_hub.send(*segment)
+        self._segments = []
+
+
+async def _finish_and_broadcast(batch: _Batch, conn, error_to_room: bool):
+    batch.end_run()
+    try:
+        result, state = await _finish(batch.room_id)
+    except HTTPException as e:
+        if error_to_room:
+            batch.broadcast_error(e.detail)
+        else:
+            batch.send_error(conn, e.detail)
+        return
+    # 结算消息本身很小，两种 JSON 模式共用同一份（legacy 客户端会忽略 seq 字段）
+    results = result["results"]
+    frame = partial(wire.finish, state.version, [(card, results.get(player, 0)) for player, card in state.table.items()])
+    batch.broadcast({"action": "finish_game", "seq": state.version, "result": result}, binary_message=frame)
+
+
+# 已知的游戏消息类型（其余消息在指标中统一记为 unknown，避免标签数量无限增长）
+GAME_ACTIONS = {"join", "draw_card", "play_card", "restart_game", "finish_game", "sync"}
+
+
+def _reject(conn, detail: str):
+    """在接收协程中直接回复错误（消息未交给 actor）"""
+    game_hub.send(conn, wire.error(detail) if conn.protocol == PROTOCOL_BINARY else _dumps({"action": "error", "detail": detail}))
+
+
 @router.websocket("/ws/game/{room_id}")
 async def game_websocket(websocket: WebSocket, room_id: str):
+    """
+    游戏 WebSocket。连接时通过查询参数 ?protocol=delta 选择增量协议：
+      - 加入时收到 snapshot（含 seq），之后收到 patch 消息；patch 应用在序号 base 之上（未给出时为 seq - 1），
+        同一时刻的多个操作会合并为一条 patch
+      - 客户端发现序号断档时发送 {"action": "sync", "seq": 最后收到的序号}，服务端补发 snapshot
+    ?protocol=binary&version=1 选择语义相同的二进制协议（见 app/wire.py），连接后先收到 HELLO。
+    未指定时保持旧协议，每次操作（或同一时刻的多个操作）广播完整状态。
+    消息交给房间 actor 依次处理（见 app/room_actor.py），接收协程不直接修改游戏状态。
+    携带 ?token= 时以令牌中的用户身份操作，消息中的 username 必须与之一致（见 app/auth.py）。
+    消息在解析前先经过准入控制（大小上限、按连接和房间限流，见 app/admission.py）。
+    """
+    token = connection_token(websocket)
+    if websocket_token_rejected(token):
+        await websocket.close(code=AUTH_CLOSE_CODE)
+        return
     await websocket.accept()
-    if room_id not in ws_connections:
-        ws_connections[room_id] = []
-    ws_connections[room_id].append(websocket)
+    protocol, version = wire.negotiate(websocket.query_params, (PROTOCOL_DELTA, PROTOCOL_BINARY), PROTOCOL_LEGACY)
+    conn = game_hub.register(room_id, websocket, protocol)
+    limiter = admission.open("game", room_id)
+    if protocol == PROTOCOL_BINARY:
+        game_hub.send(conn, wire.hello(version))
+    if protocol != PROTOCOL_LEGACY:
+        # 快照同样由 actor 发送，与其他消息保持顺序
+        game_actors.submit(room_id, conn, {"action": "join"})
     try:
-        while True:
-            data = await websocket.receive_text()
+        # 连接被广播中心关闭（慢客户端、房间被回收或删除）后退出循环
+        while not conn.closed:
+            data = await wire.receive(websocket)
+            if conn.closed:
+                break
+            WS_MESSAGE_BYTES.observe(wire.frame_size(data), "game", "in")
+            rejected = admission.admit(limiter, data)
+            if rejected is not None:
+                close_code = admission.close_code(limiter, rejected)
+                if close_code is not None:
+                    game_hub.close(conn, close_code)
+                    break
+                if admission.notify(limiter):
+                    _reject(conn, "操作过于频繁，请稍后再试")
+                continue
             try:
-                message = json.loads(data)
+                message = wire.decode_client(data) if isinstance(data, bytes) else json.loads(data)
             except Exception:
                 continue
-            action = message.get("action")
-            username = message.get("username")
-            if action == "draw_card":
-                try:
-                    card, state = await draw_card(room_id, username)
-                    response = {"action": "draw_card", "username": username, "card": card, "state": state}
-                except HTTPException as e:
-                    response = {"action": "error", "detail": e.detail}
-                    # 错误只发给当前连接
-                    await websocket.send_text(json.dumps(response, default=str))
-                    continue
-                for conn in ws_connections.get(room_id, []):
-                    await conn.send_text(json.dumps(response, default=str))
-            elif action == "play_card":
-                card = message.get("card")
-                try:
-                    state = await play_card(room_id, username, card)
-                    response = {"action": "play_card", "username": username, "card": card, "state": state}
-                except HTTPException as e:
-                    response = {"action": "error", "detail": e.detail}
-                for conn in ws_connections.get(room_id, []):
-                    await conn.send_text(json.dumps(response, default=str))
-                # 检查是否所有玩家已出牌
-                current_state = game_states.get(room_id)
-                if current_state and all(v is not None for v in current_state["table"].values()):
-                    try:
-                        room = get_room_info(room_id)
-                        result = await finish_game(room, CONFIG)
-                        finish_msg = {"action": "finish_game", "result": result}
-                        for conn in ws_connections.get(room_id, []):
-                            await conn.send_text(json.dumps(finish_msg, default=str))
-                    except HTTPException as e:
-                        err_msg = {"action": "error", "detail": e.detail}
-                        for conn in ws_connections.get(room_id, []):
-                            await conn.send_text(json.dumps(err_msg, default=str))
-            elif action == "restart_game":
-                room = get_room_info(room_id)
-                try:
-                    new_state = await initialize_game(room, CONFIG)
-                    restart_msg = {"action": "game_restart", "game_state": new_state}
-                    for conn in ws_connections.get(room_id, []):
-                        await conn.send_text(json.dumps(restart_msg, default=str))
-                except HTTPException as e:
-                    restart_msg = {"action": "error", "detail": e.detail}
-                    await websocket.send_text(json.dumps(restart_msg, default=str))
-            elif action == "finish_game":
-                room = get_room_info(room_id)
-                try:
-                    result = await finish_game(room, CONFIG)
-                    response = {"action": "finish_game", "result": result}
-                    for conn in ws_connections.get(room_id, []):
-                        await conn.send_text(json.dumps(response, default=str))
-                except HTTPException as e:
-                    response = {"action": "error", "detail": e.detail}
-                    await websocket.send_text(json.dumps(response, default=str))
-            else:
-                response = {"action": "error", "detail": "Unknown action"}
-                await websocket.send_text(json.dumps(response, default=str))
+            if not isinstance(message, dict):
+                continue
+            if message.get("action") not in GAME_ACTIONS and admission.shed(limiter):
+                # 过载时丢弃未知消息，不再回复错误
+                continue
+            # 身份检查在接收协程中完成（一次缓存查找），actor 只处理已确认身份的消息
+            username, denied = check_user(token, message.get("username"))
+            if denied is not None:
+                _reject(conn, denied[1])
+                continue
+            if username is not None:
+                message["username"] = username
+            game_actors.submit(room_id, conn, message)
     except WebSocketDisconnect:
-        ws_connections[room_id].remove(websocket)
+        pass
+    finally:
+        game_hub.unregister(conn)
+        admission.close(limiter)
+        if not game_hub.connection_count(room_id):
+            game_actors.stop(room_id)
+
+
+async def _handle_game_action(batch: _Batch, conn, message: dict):
+    room_id = batch.room_id
+    action = message.get("action")
+    username = message.get("username")
+    if action == "draw_card":
+        try:
+            card, state = await draw_card(room_id, username)
+        except HTTPException as e:
+            # 错误只发给当前连接
+            batch.send_error(conn, e.detail)
+            return
+        card_dict = card_to_dict(card)
+        deck_count = len(state.deck)
+        batch.action(
+            state,
+            {"action": "draw_card", "username": username, "card": card_dict},
+            [{"op": "draw", "username": username, "card": card_dict, "deck_count": deck_count},
+             _flags_op(state, username)],
+            partial(wire.draw, state.version, state.player_index(username), card, deck_count,
+                    username in state.drawn, username in state.played)
+        )
+    elif action == "play_card":
+        card = _card_arg(message.get("card"))
+        try:
+            state = await play_card(room_id, username, card)
+        except HTTPException as e:
+            batch.broadcast_error(e.detail)
+            state = await get_game_state(room_id)
+        else:
+            card_dict = card_to_dict(card)
+            batch.action(
+                state,
+                {"action": "play_card", "username": username, "card": card_dict},
+                [{"op": "play", "username": username, "card": card_dict}, _flags_op(state, username)],
+                partial(wire.play, state.version, state.player_index(username), card,
+                        username in state.drawn, username in state.played)
+            )
+        # 检查是否所有玩家已出牌；同一房间的消息依次处理，不会有两个连接同时触发结算
+        if state and not state.finished and all(v is not None for v in state.table.values()):
+            await _finish_and_broadcast(batch, conn, error_to_room=True)
+    elif action == "restart_game":
+        room = await get_room_info(room_id)
+        if room is None:
+            # 例如重启后只从事件日志恢复了游戏，房间已不存在
+            batch.send_error(conn, "房间不存在")
+            return
+        try:
+            new_state = await initialize_game(room, current_rules())
+        except HTTPException as e:
+            batch.send_error(conn, e.detail)
+            return
+        frame = new_state.binary_snapshot(restart=True)
+        batch.broadcast(
+            {"action": "game_restart", "game_state": new_state.to_dict()},
+            {"action": "game_restart", "game_state": new_state.snapshot()},
+            lambda: frame
+        )
+    elif action == "finish_game":
+        await _finish_and_broadcast(batch, conn, error_to_room=False)
+    elif action in ("sync", "join"):
+        state = await get_game_state(room_id)
+        if state is None:
+            if action == "sync":
+                batch.send_error(conn, "游戏状态未初始化")
+        elif message.get("seq") == state.version:
+            batch.send(conn, {"action": "sync", "seq": state.version}, lambda: wire.sync(state.version))
+        else:
+            batch.send(conn, {"action": "snapshot", "game_state": state.snapshot()}, state.binary_snapshot)
+    else:
+        batch.send_error(conn, "Unknown action")
+
+
+game_actors = RoomActors("game", _handle_game_action, _Batch, GAME_ACTIONS)
+
+
+def _describe_event(event: dict) -> dict:
+    """回放接口中的事件：牌转换为字典形式"""
+    data = event["data"]
+    described = {"seq": event["seq"], "action": event["kind"]}
+    if event["kind"] == "init":
+        described.update(players=data["players"], game_time=data["game_time"])
+    elif event["kind"] in ("draw", "play"):
+        described.update(username=data["u"], card=card_to_dict(data["c"]))
+    elif event["kind"] == "finish":
+        described.update(results=data["results"])
+    return described
+
+
+@router.get("/game/replay", dependencies=[Depends(require_admin)])
+async def game_replay(session_id: int = None, room_id: str = None):
+    """
+    对局回放（纠纷处理，需要管理员令牌）：按结算后的 session_id，或按房间号取该房间最近一局。
+    从开局记录的随机种子重新洗牌并逐条重放事件，返回事件列表、重放得到的最终状态，
+    以及摸到的牌、出的牌和结算结果是否都与重放结果一致（consistent）。
+    返回内容包含随机种子和所有手牌，只回放已结算的对局；房间最近一局仍在进行时返回 409。
+    """
+    if session_id is not None:
+        query = select(game_sessions.c.room_id, game_sessions.c.game_time).where(game_sessions.c.id == session_id)
+        session = await read_database.fetch_one(query)
+        if session is None:
+            raise HTTPException(status_code=404, detail="对局不存在")
+        game_key = settlement_key(session["room_id"], session["game_time"])
+    elif room_id:
+        game_key = await game_log.latest_game_key(room_id)
+    else:
+        raise HTTPException(status_code=400, detail="缺少 session_id 或房间ID")
+    events = await game_log.events(game_key) if game_key else []
+    if not events or events[0]["kind"] != "init":
+        raise HTTPException(status_code=404, detail="没有该局的事件记录")
+
+    init = events[0]
+    state = _state_from_init(init["data"], init["seq"])
+    consistent = True
+    for event in events[1:]:
+        if event["kind"] == "finish" and state.rules.digest == init["data"]["rules"]:
+            # 开局时的规则仍可用时，按重放后的桌面重新计算结算结果
+            expected = compute_results(state.table, state.rules.weights, state.rules.scores_for(len(state.table)))
+            consistent = consistent and expected == event["data"]["results"]
+        consistent = _apply_event(state, event["kind"], event["seq"], event["data"]) and consistent
+    if not state.finished:
+        # finish 事件在结算写入后才记录：未结束的对局不能泄露牌序和其他玩家的手牌
+        raise HTTPException(status_code=409, detail="该局游戏尚未结束")
+    return {
+        "game_key": game_key,
+        "seed": init["data"]["seed"],
+        "rules": init["data"]["rules"],
+        "consistent": consistent,
+        "events": [_describe_event(event) for event in events],
+        "final_state": state.snapshot(),
+    }
@@ -0,0 +1,327 @@
+# app/leaderboard.py
+"""
+进程内积分排行榜：
+  - 以积分值为下标的树状数组（Fenwick tree）记录每个积分上的人数，
+    查询名次、按名次取玩家都是 O(log R)（R 为积分取值范围）
+  - 同分玩家按用户名排序，保存在每个积分对应的顺序统计树（treap，节点记录子树大小）中，
+    插入、删除、查询某个用户名在同分玩家中的位置都是 O(log m)（m 为同分人数）；
+    新用户都从 0 分开始，0 分的玩家最多，不能用有序列表（插入删除 O(m)）
+  - 启动时从 users 表一次性重建，之后由注册和结算增量更新，请求时不再对 users 表排序
+多 worker 部署时，其他 worker 的结算和注册通过 "points:changed" 频道同步（见 app/user_manager.py）；
+broker 重连期间可能丢失消息，可配置 refresh_interval 定期从数据库重建作为兜底。
+"""
+import asyncio
+import logging
+import random
+from sqlalchemy import select
+from app.config import get_section
+from app.database import read_database
+from app.models import users
+
+LEADERBOARD_CONFIG = get_section("leaderboard", {
+    # 定期从数据库重建排行榜的间隔（秒），0 表示只在启动时重建
+    "refresh_interval": 0,
+})
+
+logger = logging.getLogger(__name__)
+
+# 积分范围不够时按该粒度扩展
+_MIN_SPAN = 1024
+
+
+class _Node:
+    __slots__ = ("name", "priority", "size", "left", "right")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.priority = random.random()
+        self.size = 1
+        self.left = None
+        self.right = None
+
+
+def _size(node) -> int:
+    return node.size if node is not None else 0
+
+
+def _split(node, name: str):
+    """按用户名拆成 (< name, >= name) 两棵树"""
+    if node is None:
+        return None, None
+    if node.name < name:
+        left, right = _split(node.right, name)
+        node.right = left
+        node.size = _size(node.left) + _size(left) + 1
+        return node, right
+    left, right = _split(node.left, name)
+    node.left = right
+    node.size = _size(right) + _size(node.right) + 1
+    return left, node
+
+
+def _merge(left, right):
+    """合并两棵树，left 中的用户名都小于 right 中的"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        left.size = _size(left.left) + _size(left.right) + 1
+        return left
+    right.left = _merge(left, right.left)
+    right.size = _size(right.left) + _size(right.right) + 1
+    return right
+
+
+class _Names:
+    """同分玩家的用户名集合，按用户名排序，支持按位置访问"""
+    __slots__ = ("root",)
+
+    def __init__(self):
+        self.root = None
+
+    def __len__(self):
+        return _size(self.root)
+
+    @classmethod
+    def from_sorted(cls, names):
+        """由已排序的用户名直接建成平衡的树（O(m)），全量重建时使用；优先级随深度递减，保持堆序"""
+        depth = max(1, len(names).bit_length())
+
+        def build(lo: int, hi: int, level: int):
+            if lo >= hi:
+                return None
+            mid = (lo + hi) // 2
+            node = _Node(names[mid])
+            node.priority = 1 - (level + node.priority) / depth
+            node.left = build(lo, mid, level + 1)
+            node.right = build(mid + 1, hi, level + 1)
+            node.size = hi - lo
+            return node
+
+        tree = cls()
+        tree.root = build(0, len(names), 0)
+        return tree
+
+    def add(self, name: str):
+        left, right = _split(self.root, name)
+        self.root = _merge(_merge(left, _Node(name)), right)
+
+    def remove(self, name: str):
+        left, right = _split(self.root, name)
+        # name + "\0" 是紧跟在 name 之后的字符串，中间一段恰好是 name 本身
+        _, right = _split(right, name + "\0")
+        self.root = _merge(left, right)
+
+    def index(self, name: str) -> int:
+        """小于 name 的用户名个数（name 在集合中时即其位置）"""
+        node, position = self.root, 0
+        while node is not None:
+            if node.name < name:
+                position += _size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return position
+
+    def at(self, position: int) -> str:
+        node = self.root
+        while True:
+            left = _size(node.left)
+            if position < left:
+                node = node.left
+            elif position == left:
+                return node.name
+            else:
+                position -= left + 1
+                node = node.right
+
+    def slice(self, start: int, stop: int):
+        """位置在 [start, stop) 中的用户名，按顺序"""
+        return [self.at(position) for position in range(max(0, start), min(len(self), stop))]
+
+
+class Leaderboard:
+    def __init__(self):
+        self._points = {}  # 格式: { username: points }
+        self._buckets = {}  # 格式: { points: _Names }
+        self._low = 0  # 树状数组下标 1 对应的积分
+        self._tree = [0] * (_MIN_SPAN + 1)
+        self._task = None
+
+    def __len__(self):
+        return len(self._points)
+
+    # ---------- 树状数组 ----------
+
+    def _index(self, points: int) -> int:
+        return points - self._low + 1
+
+    def _add_count(self, points: int, delta: int):
+        i = self._index(points)
+        tree = self._tree
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _count_at_most(self, points: int) -> int:
+        """积分 <= points 的人数"""
+        i = min(self._index(points), len(self._tree) - 1)
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _points_of_kth_lowest(self, k: int) -> int:
+        """从低到高第 k 个（从 1 开始）玩家的积分"""
+        tree = self._tree
+        pos = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(tree) and tree[nxt] < k:
+                pos = nxt
+                k -= tree[nxt]
+            step >>= 1
+        return pos + self._low
+
+    def _ensure_range(self, points: int):
+        """积分超出当前范围时扩大范围并重建树状数组"""
+        span = len(self._tree) - 1
+        if not self._low <= points < self._low + span:
+            self._layout([points, *self._buckets])
+
+    def _layout(self, values):
+        """按积分取值确定范围并重建树状数组"""
+        low, high = min(values), max(values)
+        span = max(_MIN_SPAN, len(self._tree) - 1)
+        while span <= high - low:
+            span *= 2
+        # 两侧各留出一半空间，减少后续扩展
+        self._low = low - (span - (high - low)) // 2
+        self._tree = [0] * (span + 1)
+        for value, names in self._buckets.items():
+            self._add_count(value, len(names))
+
+    # ---------- 更新 ----------
+
+    def _remove(self, username: str):
+        points = self._points.pop(username)
+        names = self._buckets[points]
+        names.remove(username)
+        if not names:
+            del self._buckets[points]
+        self._add_count(points, -1)
+
+    def set(self, username: str, points: int):
+        if username in self._points:
+            if self._points[username] == points:
+                return
+            self._remove(username)
+        self._ensure_range(points)
+        self._points[username] = points
+        names = self._buckets.get(points)
+        if names is None:
+            names = self._buckets[points] = _Names()
+        names.add(username)
+        self._add_count(points, 1)
+
+    def apply(self, deltas: dict):
+        """结算后按 { username: 积分变化 } 更新；不在榜上的用户忽略"""
+        for username, delta in deltas.items():
+            if delta and username in self._points:
+                self.set(username, self._points[username] + delta)
+
+    def rebuild(self, rows):
+        """用 (username, points) 全量重建：每个积分上的用户名排序后直接建树，不逐个插入"""
+        self._points = {}
+        grouped = {}
+        for username, points in rows:
+            self._points[username] = points
+            grouped.setdefault(points, []).append(username)
+        self._buckets = {points: _Names.from_sorted(sorted(names)) for points, names in grouped.items()}
+        self._low = 0
+        self._tree = [0] * (_MIN_SPAN + 1)
+        self._layout([0, *self._buckets])
+
+    # ---------- 查询 ----------
+
+    def rank(self, username: str):
+        """返回 (名次, 在榜单中的位置)；同分玩家名次相同（名次 = 积分更高的人数 + 1），位置从 0 开始。不在榜上返回 None"""
+        points = self._points.get(username)
+        if points is None:
+            return None
+        higher = len(self._points) - self._count_at_most(points)
+        return higher + 1, higher + self._buckets[points].index(username)
+
+    def entry(self, position: int) -> dict:
+        """按位置（从 0 开始，积分从高到低）取玩家"""
+        points = self._points_of_kth_lowest(len(self._points) - position)
+        higher = len(self._points) - self._count_at_most(points)
+        username = self._buckets[points].at(position - higher)
+        return {"rank": higher + 1, "username": username, "points": points}
+
+    def top(self, n: int):
+        return self.range(0, n)
+
+    def range(self, start: int, stop: int):
+        start = max(0, start)
+        stop = min(len(self._points), stop)
+        entries = []
+        position = start
+        while position < stop:
+            # 同一积分上的玩家一次取完，只需一次树状数组查找
+            first = self.entry(position)
+            points = first["points"]
+            higher = first["rank"] - 1
+            names = self._buckets[points]
+            for username in names.slice(position - higher, stop - higher):
+                entries.append({"rank": first["rank"], "username": username, "points": points})
+            position = min(stop, higher + len(names))
+        return entries
+
+    def around(self, username: str, k: int):
+        """返回用户自己的名次以及前后各 k 名玩家；用户不在榜上返回 None"""
+        ranked = self.rank(username)
+        if ranked is None:
+            return None
+        rank, position = ranked
+        return {
+            "rank": rank,
+            "points": self._points[username],
+            "total": len(self._points),
+            "players": self.range(position - k, position + k + 1),
+        }
+
+    # ---------- 与数据库同步 ----------
+
+    async def load(self):
+        """从 users 表重建（只读取用户名和积分，不排序）"""
+        rows = await read_database.fetch_all(select(users.c.username, users.c.points))
+        self.rebuild((row["username"], row["points"]) for row in rows)
+
+    async def _refresh(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.load()
+            except Exception:
+                # 例如数据库暂时不可用：保留当前榜单，下个周期重试
+                logger.exception("从数据库重建排行榜失败")
+
+    async def start(self):
+        await self.load()
+        interval = LEADERBOARD_CONFIG["refresh_interval"]
+        if interval and self._task is None:
+            self._task = asyncio.create_task(self._refresh(interval))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+# 全局排行榜实例
+leaderboard = Leaderboard()
@@ -0,0 +1,177 @@
+# app/lifecycle.py
+"""
+房间与游戏状态的生命周期管理：长时间无活动的房间、空房间和已结束的游戏按 TTL 回收，
+同时关闭仍连在这些房间上的 WebSocket，保证长时间运行时内存有界。
+  - 定时使用单层时间轮：每个 tick 只检查到期的那一格，不扫描全部房间
+  - 活动只记录时间（O(1)），不移动定时器；定时器到期时再根据最新活动时间决定回收还是顺延
+  - 状态存储中的版本号变化也视为活动，因此其他 worker 上的操作同样会推迟回收
+各类对象（room / game）由所属模块通过 register 注册检查与回收函数。
+"""
+import asyncio
+import logging
+import math
+import time
+from app.config import get_section
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LIFECYCLE_CONFIG = get_section("lifecycle", {
+    "tick": 1.0,              # 时间轮每格的时长（秒）
+    "slots": 4096,            # 时间轮格数，tick * slots 之内的定时器不需要多圈
+    "room_idle_ttl": 1800,    # 房间无活动多久后回收（秒）
+    "empty_room_ttl": 60,     # 所有玩家都离开后的房间保留多久
+    "game_idle_ttl": 1800,    # 未结束的游戏无活动多久后回收
+    "finished_game_ttl": 600, # 已结束的游戏保留多久（期间仍可重开）
+})
+
+RECLAIMED = registry.counter("cardgame_reclaimed_total", "生命周期管理回收的对象数", labels=("kind",))
+
+
+class TimerWheel:
+    """单层时间轮：每次 advance 前进一格并返回到期的 key；超过一圈的定时器记录剩余圈数"""
+
+    def __init__(self, tick: float, slots: int):
+        self.tick = tick
+        self._slots = [{} for _ in range(slots)]  # 每格格式: { key: 剩余圈数 }
+        self._position = 0
+        self._where = {}  # 格式: { key: 所在格 }
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def schedule(self, key, delay: float):
+        """delay 秒后到期（已存在的定时器会被替换）"""
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self.tick))
+        slot = (self._position + ticks) % len(self._slots)
+        self._slots[slot][key] = (ticks - 1) // len(self._slots)
+        self._where[key] = slot
+
+    def cancel(self, key):
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            del self._slots[slot][key]
+
+    def advance(self):
+        self._position = (self._position + 1) % len(self._slots)
+        slot = self._slots[self._position]
+        due = []
+        for key, rounds in list(slot.items()):
+            if rounds:
+                slot[key] = rounds - 1
+            else:
+                del slot[key]
+                del self._where[key]
+                due.append(key)
+        return due
+
+
+class _Entry:
+    __slots__ = ("last_activity", "due", "version")
+
+    def __init__(self, now: float):
+        self.last_activity = now
+        self.due = None
+        self.version = None
+
+
+class LifecycleManager:
+    def __init__(self, config: dict):
+        self.config = config
+        self.wheel = TimerWheel(config["tick"], config["slots"])
+        self._entries = {}  # 格式: { (kind, key): _Entry }
+        self._kinds = {}  # 格式: { kind: (inspect, reclaim) }
+        self._task = None
+
+    def register(self, kind: str, inspect, reclaim):
+        """
+        inspect(key) -> (版本号, ttl) 或 None（对象已不存在）；
+        reclaim(key) 删除对象并关闭相关连接。两者都是协程函数。
+        """
+        self._kinds[kind] = (inspect, reclaim)
+
+    def touch(self, kind: str, key: str, ttl: float):
+        """记录一次活动；ttl 为按对象当前状态应使用的保留时间"""
+        now = time.monotonic()
+        entry = self._entries.get((kind, key))
+        if entry is None:
+            entry = self._entries[(kind, key)] = _Entry(now)
+        entry.last_activity = now
+        # 只有新的到期时间更早时（例如房间刚变空）才需要移动定时器，否则到期时再顺延
+        if entry.due is None or now + ttl < entry.due:
+            self._schedule((kind, key), entry, ttl)
+
+    def forget(self, kind: str, key: str):
+        self._entries.pop((kind, key), None)
+        self.wheel.cancel((kind, key))
+
+    def tracked(self, kind: str = None) -> int:
+        if kind is None:
+            return len(self._entries)
+        return sum(1 for k, _ in self._entries if k == kind)
+
+    def _schedule(self, full_key, entry, delay):
+        entry.due = time.monotonic() + delay
+        self.wheel.schedule(full_key, delay)
+
+    async def _expire(self, full_key):
+        entry = self._entries.get(full_key)
+        if entry is None:
+            return
+        kind, key = full_key
+        inspect, reclaim = self._kinds[kind]
+        info = await inspect(key)
+        if info is None:
+            # 对象已被其他途径删除
+            self.forget(kind, key)
+            return
+        version, ttl = info
+        now = time.monotonic()
+        if entry.version is not None and version != entry.version:
+            # 版本号变化说明期间有过写入（可能来自其他 worker）
+            entry.last_activity = max(entry.last_activity, now - self.config["tick"])
+        entry.version = version
+        remaining = entry.last_activity + ttl - now
+        if remaining > 0:
+            self._schedule(full_key, entry, remaining)
+            return
+        self.forget(kind, key)
+        await reclaim(key)
+        RECLAIMED.inc(kind)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            for full_key in self.wheel.advance():
+                try:
+                    await self._expire(full_key)
+                except Exception:
+                    # 单个对象检查失败不影响其他对象，稍后重试
+                    logger.exception("生命周期检查失败: %s", full_key)
+                    entry = self._entries.get(full_key)
+                    if entry is not None:
+                        self._schedule(full_key, entry, self.wheel.tick * 10)
+
+    async def start(self, existing: dict = None):
+        """existing: { kind: [key, ...] }，启动时已存在（例如持久化状态存储中）的对象，从现在开始计时"""
+        for kind, keys in (existing or {}).items():
+            for key in keys:
+                inspect, _ = self._kinds[kind]
+                info = await inspect(key)
+                if info is not None:
+                    self.touch(kind, key, info[1])
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+# 全局生命周期管理实例
+lifecycle = LifecycleManager(LIFECYCLE_CONFIG)
@@ -0,0 +1,151 @@
+# app/lobby.py
+"""
+大厅：通过 /ws/lobby 浏览有空位的房间，不需要轮询。
+  - 连接时通过查询参数选择游戏模式和至少需要的空位数（?mode=poker_battle&seats=1），
+    先收到一次 lobby_snapshot，之后收到 lobby_diff（upsert: 新增或变化的房间，remove: 不再符合条件的房间号）
+  - 快照只读取房间目录中对应模式、有足够空位的几个索引桶，与房间总数无关；
+    已经没有玩家、等待回收的房间，以及有进行中对局的房间不显示
+  - 目录变化先累积起来，每隔 interval 秒统一生成一次差异；同一条件的订阅者共用一份编码，
+    每个订阅者每个周期最多收到一条消息。没有订阅者时不累积
+房间容量为游戏模式能够结算的最大玩家数（poker_battle 为 scoring 中最大的 "<n>_players"，即 3 人），
+见 room_manager.capacity，加入房间时同样按该容量检查；模式不存在时容量为 0，不显示任何房间。
+"""
+import asyncio
+import json
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from app.config import get_section
+from app.room_manager import DEFAULT_MODE, add_directory_listener, rooms_with_user_count, capacity
+from app.ws_hub import lobby_hub, dumps
+from app.admission import admission
+from app.auth import connection_token, websocket_token_rejected, AUTH_CLOSE_CODE
+from app import wire
+
+router = APIRouter()
+
+LOBBY_CONFIG = get_section("lobby", {
+    "interval": 0.5,          # 推送差异的最小间隔（秒）
+})
+
+
+def _view(entry: dict, room_capacity: int) -> dict:
+    return {
+        "room_id": entry["room_id"],
+        "mode": entry["mode"],
+        "players": entry["user_count"],
+        "ready": entry["ready_count"],
+        "capacity": room_capacity,
+    }
+
+
+def _group(mode: str, seats: int) -> str:
+    """订阅条件对应的广播分组"""
+    return f"{mode}/{seats}"
+
+
+class Lobby:
+    def __init__(self, config: dict):
+        self.config = config
+        self.seq = 0
+        self._changes = {}  # 格式: { room_id: 目录项或 None }，上次推送以来的变化
+        self._task = None
+
+    def on_change(self, room_id: str, entry):
+        if lobby_hub.rooms:
+            self._changes[room_id] = entry
+
+    def snapshot(self, mode: str, seats: int):
+        room_capacity = capacity(mode)
+        rooms = []
+        for user_count in range(1, room_capacity - seats + 1):
+            rooms.extend(
+                _view(entry, room_capacity) for entry in rooms_with_user_count(mode, user_count)
+                if not entry.get("playing")
+            )
+        return {"action": "lobby_snapshot", "seq": self.seq, "mode": mode, "capacity": room_capacity, "rooms": rooms}
+
+    def publish(self):
+        """把累积的变化按订阅条件生成差异并推送"""
+        changes, self._changes = self._changes, {}
+        if not changes:
+            return
+        self.seq += 1
+        for group in list(lobby_hub.rooms):
+            mode, seats = group.rsplit("/", 1)
+            room_capacity = capacity(mode)
+            max_users = room_capacity - int(seats)
+            upsert, remove = [], []
+            for room_id, entry in changes.items():
+                if entry is None:
+                    remove.append(room_id)
+                elif entry["mode"] != mode:
+                    # 房间的模式不会改变，其他模式的房间从未出现在该分组中
+                    continue
+                elif 0 < entry["user_count"] <= max_users and not entry.get("playing"):
+                    upsert.append(_view(entry, room_capacity))
+                else:
+                    # 不记录各订阅者已看到哪些房间，对订阅者而言重复的删除是无害的
+                    remove.append(room_id)
+            if upsert or remove:
+                message = {"action": "lobby_diff", "seq": self.seq, "upsert": upsert, "remove": remove}
+                lobby_hub.deliver_local(group, dumps(message))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.config["interval"])
+            self.publish()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+# 全局大厅实例
+lobby = Lobby(LOBBY_CONFIG)
+add_directory_listener(lobby.on_change)
+
+
+@router.websocket("/ws/lobby")
+async def lobby_websocket(websocket: WebSocket):
+    token = connection_token(websocket)
+    if websocket_token_rejected(token):
+        await websocket.close(code=AUTH_CLOSE_CODE)
+        return
+    mode = websocket.query_params.get("mode", DEFAULT_MODE)
+    try:
+        seats = max(1, int(websocket.query_params.get("seats", 1)))
+    except ValueError:
+        seats = 1
+    await websocket.accept()
+    conn = lobby_hub.register(_group(mode, seats), websocket)
+    limiter = admission.open("lobby")
+    lobby_hub.send(conn, dumps(lobby.snapshot(mode, seats)))
+    try:
+        # 大厅是只读的推送，客户端消息只用于保持连接（同样受准入控制）
+        while not conn.closed:
+            data = await wire.receive(websocket)
+            if conn.closed:
+                break
+            rejected = admission.admit(limiter, data)
+            if rejected is not None:
+                close_code = admission.close_code(limiter, rejected)
+                if close_code is not None:
+                    lobby_hub.close(conn, close_code)
+                    break
+                continue
+            try:
+                message = json.loads(data)
+            except Exception:
+                continue
+            if isinstance(message, dict) and message.get("action") == "snapshot":
+                # 客户端怀疑状态不一致时可以重新获取快照
+                lobby_hub.send(conn, dumps(lobby.snapshot(mode, seats)))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        lobby_hub.unregister(conn)
+        admission.close(limiter)
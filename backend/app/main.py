@@ -1,13 +1,30 @@
 # app/main.py
-from fastapi import FastAPI, HTTPException
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.room_manager import create_room, join_room, get_room_info
-from app.database import database, engine, metadata
+from app.room_manager import create_room, join_room, get_room_info, load_room_directory, DEFAULT_MODE
+from app.database import read_database, connect, disconnect, create_tables
 from app.models import users, game_records
 from sqlalchemy import select, update
 from pathlib import Path
-from app.user_manager import register_user, login_user
+from app.user_manager import register_user, login_user, get_users_points
 from app.game_manager import game_manager
+from app.pubsub import pubsub
+from app.ws_hub import deliver_remote, HUBS
+from app.metrics import registry
+from app.state_store import store
+from app.records import newest_first, fetch_page, page_size, ndjson_response
+from app.leaderboard import leaderboard
+from app.lifecycle import lifecycle
+from app.matchmaking import matchmaker
+from app.game_modes.poker_battle import GAME_STATES, restore_games
+from app.game_log import game_log
+from app.user_stats import get_user_stats, backfill_if_empty
+from app.settlement import journal
+from app.auth import tokens, authorize, check_secret
+from app.admission import admission
+from app.lobby import lobby
 
 app = FastAPI()
 
@@ -23,12 +40,71 @@ config = {}
 
 @app.on_event("startup")
 async def startup():
-    await database.connect()
-    metadata.create_all(engine)
+    # 多 worker 部署必须配置相同的令牌签名密钥
+    check_secret()
+    await connect()
+    # 创建缺少的数据表，并为已存在的表补建新增的索引
+    await create_tables()
+    # 根据对局事件日志恢复重启前进行中的游戏（只读取快照及其后的事件）
+    await restore_games()
+    game_log.start()
+    # 状态存储可能是持久化的，从中重建进程内房间目录
+    await load_room_directory()
+    # 房间在重建目录时已开始计时，这里再登记状态存储中已有的游戏状态，并启动回收定时器
+    await lifecycle.start({"game": await store.keys(GAME_STATES)})
+    matchmaker.start()
+    # 升级后首次启动时根据已有对局记录回填用户统计
+    await backfill_if_empty()
+    # write-behind 模式下重放上次未写入数据库的结算（需在构建排行榜之前完成）
+    await journal.start()
+    # 从 users 表一次性构建排行榜，之后由注册和结算增量更新
+    await leaderboard.start()
+    # 启动跨 worker 的发布订阅，接收其他进程的广播
+    await pubsub.start(deliver_remote)
+    # 游戏模式已在导入 game_manager 时加载并编译，这里只启动配置文件的热加载检查
+    game_manager.start_watching()
+    # 监测事件循环延迟，过载时丢弃非关键的 WebSocket 消息
+    admission.start()
+    # 定期把房间目录的变化推送给大厅订阅者
+    lobby.start()
 
 @app.on_event("shutdown")
 async def shutdown():
-    await database.disconnect()
+    lobby.stop()
+    admission.stop()
+    game_manager.stop_watching()
+    leaderboard.stop()
+    lifecycle.stop()
+    matchmaker.stop()
+    await pubsub.stop()
+    # 把结算日志中剩余的结算写入数据库后再断开
+    await journal.stop()
+    await game_log.stop()
+    await disconnect()
+
+# 实时仪表：抓取 /metrics 时才计算
+registry.gauge("cardgame_rooms", "当前房间数", lambda: store.count("rooms"))
+registry.gauge("cardgame_games", "当前游戏状态数", lambda: store.count("game_states"))
+registry.gauge(
+    "cardgame_open_sockets", "当前 worker 上打开的 WebSocket 连接数",
+    lambda: {(hub.name,): hub.connection_count() for hub in HUBS.values()},
+    labels=("hub",)
+)
+registry.gauge("cardgame_match_queue", "匹配队列中的玩家数", lambda: len(matchmaker))
+registry.gauge("cardgame_settlement_backlog", "结算日志中尚未写入数据库的对局数", lambda: len(journal))
+registry.gauge("cardgame_game_log_backlog", "尚未写入数据库的对局事件数", lambda: len(game_log))
+registry.gauge("cardgame_session_tokens_cached", "缓存中的会话令牌数", lambda: len(tokens))
+registry.gauge("cardgame_overloaded", "是否处于过载模式（1 表示正在丢弃非关键消息）", lambda: int(admission.overloaded))
+registry.gauge(
+    "cardgame_lifecycle_tracked", "生命周期管理中等待回收检查的对象数",
+    lambda: {(kind,): lifecycle.tracked(kind) for kind in ("room", "game")},
+    labels=("kind",)
+)
+
+# Prometheus 指标接口
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(await registry.render(), media_type="text/plain; version=0.0.4")
 
 # 用户注册接口
 @app.post("/register")
@@ -52,27 +128,31 @@ async def login(payload: dict):
     success, msg = await login_user(username, password)
     if not success:
         raise HTTPException(status_code=400, detail=msg)
-    return {"message": msg}
+    # 签发会话令牌，之后的请求和 WebSocket 连接携带该令牌证明身份
+    token, expires = tokens.issue(username)
+    return {"message": msg, "token": token, "expires_at": expires}
 
 # 房间创建接口
 @app.post("/room/create")
-async def room_create(payload: dict):
-    username = payload.get("username")
+async def room_create(payload: dict, request: Request):
+    username = authorize(request, payload.get("username"))
     if not username:
         raise HTTPException(status_code=400, detail="缺少用户名")
-    success, room_id = create_room(username)
+    mode = payload.get("mode", DEFAULT_MODE)
+    game_manager.get_mode(mode)  # 模式不存在时返回 400
+    success, room_id = await create_room(username, mode)
     if not success:
         raise HTTPException(status_code=400, detail="创建房间失败")
     return {"message": "房间创建成功", "room_id": room_id}
 
 # 房间加入接口
 @app.post("/room/join")
-async def room_join(payload: dict):
+async def room_join(payload: dict, request: Request):
     room_id = payload.get("room_id")
-    username = payload.get("username")
+    username = authorize(request, payload.get("username"))
     if not room_id or not username:
         raise HTTPException(status_code=400, detail="缺少房间ID或用户名")
-    success, msg = join_room(room_id, username)
+    success, msg = await join_room(room_id, username)
     if not success:
         raise HTTPException(status_code=400, detail=msg)
     return {"message": msg, "room_id": room_id}
@@ -80,64 +160,108 @@ async def room_join(payload: dict):
 # 获取房间信息接口（返回所有玩家信息，以数组形式）
 @app.get("/room/info")
 async def room_info(room_id: str):
-    room = get_room_info(room_id)
+    room = await get_room_info(room_id)
     if not room:
         raise HTTPException(status_code=404, detail="房间不存在")
-    users_info = []
-    for uname, ready in room["users"].items():
-        query = select(users).where(users.c.username == uname)
-        user_data = await database.fetch_one(query)
-        if user_data:
-            users_info.append({"username": uname, "points": user_data["points"], "ready": ready})
-        else:
-            users_info.append({"username": uname, "points": 0, "ready": ready})
+    # 批量获取房间内所有玩家的积分（优先命中进程内缓存）
+    points = await get_users_points(list(room["users"].keys()))
+    users_info = [
+        {"username": uname, "points": points.get(uname) or 0, "ready": ready}
+        for uname, ready in room["users"].items()
+    ]
     return {"room_id": room["room_id"], "users": users_info}
 
 # 离开房间接口
 @app.post("/room/leave")
-async def room_leave(payload: dict):
+async def room_leave(payload: dict, request: Request):
     room_id = payload.get("room_id")
-    username = payload.get("username")
+    username = authorize(request, payload.get("username"))
     if not room_id or not username:
         raise HTTPException(status_code=400, detail="缺少房间ID或用户名")
     from app.room_manager import leave_room  # 动态导入leave_room
-    success, msg = leave_room(room_id, username)
+    success, msg = await leave_room(room_id, username)
     if not success:
         raise HTTPException(status_code=400, detail=msg)
     return {"message": msg, "room_id": room_id}
 
 # 游戏开始接口（调用封装的 game_manager）
 @app.post("/game/start")
-async def start_game(payload: dict):
+async def start_game(payload: dict, request: Request):
+    user = authorize(request)
     room_id = payload.get("room_id")
-    mode = payload.get("mode", "poker_battle")  # 默认使用 poker_battle 模式
     if not room_id:
         raise HTTPException(status_code=400, detail="缺少房间ID")
-    room = get_room_info(room_id)
+    room = await get_room_info(room_id)
     if not room:
         raise HTTPException(status_code=404, detail="房间不存在")
+    # 默认使用创建房间时选择的模式（旧房间为 poker_battle）
+    mode = payload.get("mode") or room.get("mode", DEFAULT_MODE)
+    if user is not None and user not in room["users"]:
+        raise HTTPException(status_code=403, detail="用户未在房间内")
     return await game_manager.start_game(mode, room)
 
-# 获取游戏记录接口（返回用户id、用户名、当前积分及所有对局记录）
+# 排行榜接口：积分前 n 名
+@app.get("/leaderboard/top")
+async def leaderboard_top(n: int = 10):
+    if n < 1 or n > 100:
+        raise HTTPException(status_code=400, detail="n 的取值范围为 1~100")
+    return {"total": len(leaderboard), "players": leaderboard.top(n)}
+
+# 排行榜接口：用户自己的名次及前后各 k 名玩家
+@app.get("/leaderboard/rank")
+async def leaderboard_rank(username: str, k: int = 5):
+    if k < 0 or k > 50:
+        raise HTTPException(status_code=400, detail="k 的取值范围为 0~50")
+    around = leaderboard.around(username, k)
+    if around is None:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    return {"username": username, **around}
+
+# 用户统计接口（对局数、胜负平、胜率、连胜），只需一次按用户的单行查询
+@app.get("/user/stats")
+async def user_stats(username: str):
+    stats = await get_user_stats(username)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    return stats
+
+# 获取游戏记录接口（返回用户id、用户名、当前积分及一页对局记录）
+# 对局记录按时间从新到旧分页，next_cursor 不为 null 时将其作为 cursor 参数取下一页；
+# format=ndjson 时以 NDJSON 流式导出该用户的全部对局记录
 @app.get("/user/records")
-async def get_user_records(username: str):
-    query_user = select(users).where(users.c.username == username)
-    user = await database.fetch_one(query_user)
+async def get_user_records(username: str, cursor: Optional[str] = None, limit: Optional[int] = None, format: str = "json"):
+    query_user = select(users.c.id, users.c.username, users.c.points).where(users.c.username == username)
+    user = await read_database.fetch_one(query_user)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
-    query_records = game_records.select().where(game_records.c.user_id == user["id"]).order_by(game_records.c.game_time.desc())
-    records = await database.fetch_all(query_records)
+    query_records = newest_first(game_records.select().where(game_records.c.user_id == user["id"]), cursor=cursor)
+    if format == "ndjson":
+        return ndjson_response(query_records, f"{username}_records.ndjson")
+    records, next_cursor = await fetch_page(query_records, page_size(limit))
     return {
         "id": user["id"],
         "username": user["username"],
         "points": user["points"],
-        "game_records": [dict(record) for record in records]
+        "game_records": records,
+        "next_cursor": next_cursor
     }
 
 # 挂载 WebSocket 路由处理房间内就绪状态和游戏开始通知
 from app.room_ws import router as room_ws_router
 app.include_router(room_ws_router)
 
+# 挂载管理后台接口
+from app.admin import router as admin_router
+app.include_router(admin_router)
+
+# 挂载匹配服务的 WebSocket
+from app.matchmaking import router as matchmaking_router
+app.include_router(matchmaking_router)
+
+# 挂载大厅的 WebSocket（浏览有空位的房间）
+from app.lobby import router as lobby_router
+app.include_router(lobby_router)
+
 #挂载游戏界面的websocket
 from app.game_modes.poker_battle import router as poker_battle_router
 app.include_router(poker_battle_router)
@@ -0,0 +1,267 @@
+# app/matchmaking.py
+"""
+匹配服务：玩家通过 /ws/match 排队，按积分分桶自动组成 2 人或 3 人桌并创建房间。
+  - 每种桌型一组积分桶，桶内按排队顺序保存；入队时先在自己的桶里找对手
+  - 等待时间每超过 widen_interval，搜索范围向两侧各扩大一个桶（最多 max_window 个）；
+    扩大事件放在按时间排序的堆中，入队和每次扩大都是 O(log n)，不需要扫描整个队列；
+    每次入队递增排队票的代数，重新入队（如建房失败）后旧的扩大事件按代数失效
+  - 同一个事件循环周期内匹配成功的各桌合并成一批，通过 room_manager 批量创建房间
+匹配队列保存在当前 worker 进程内，多 worker 部署时需要把 /ws/match 路由到同一个 worker。
+
+协议：
+  客户端 -> {"action": "enqueue", "username": ..., "players": 2 或 3}
+           {"action": "cancel"}
+  服务端 -> {"action": "queued", "players": n, "points": 积分}
+           {"action": "matched", "room_id": ..., "players": [用户名, ...]}
+           {"action": "cancelled"} / {"action": "error", "detail": ...}
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import time
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from app.config import get_section
+from app.game_manager import game_manager
+from app.metrics import registry
+from app.room_manager import create_rooms
+from app.user_manager import get_users_points
+from app.ws_hub import match_hub, dumps
+from app.admission import admission
+from app.auth import connection_token, check_user, websocket_token_rejected, AUTH_CLOSE_CODE
+from app import wire
+
+MATCHMAKING_CONFIG = get_section("matchmaking", {
+    "bucket_width": 20,      # 每个积分桶覆盖的积分范围
+    "widen_interval": 5.0,   # 每等待多少秒搜索范围扩大一个桶
+    "max_window": 10,        # 搜索范围最多向两侧各扩大的桶数
+    "tick": 0.5,             # 检查扩大事件的间隔（秒）
+})
+
+# 匹配队列中的连接都登记在 match_hub 的同一个分组下，消息逐个连接单独发送
+QUEUE_GROUP = "queue"
+
+MATCH_WAIT_SECONDS = registry.histogram("cardgame_match_wait_seconds", "匹配成功前的排队时间", labels=("players",))
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+class Ticket:
+    __slots__ = ("username", "points", "players", "bucket", "window", "enqueued_at", "conn", "generation")
+
+    def __init__(self, username: str, points: int, players: int, conn):
+        self.username = username
+        self.points = points
+        self.players = players
+        self.bucket = None
+        self.window = 0
+        self.enqueued_at = time.monotonic()
+        self.conn = conn
+        self.generation = 0  # 入队次数，堆中代数不一致的扩大事件已失效
+
+
+class Matchmaker:
+    def __init__(self, config: dict):
+        self.config = config
+        self._tickets = {}  # 格式: { username: Ticket }，每个玩家同时只有一张排队票
+        self._buckets = {}  # 格式: { (桌型人数, 桶号): { username: Ticket } }，字典保持排队顺序
+        self._widen_heap = []  # 格式: [(扩大时间, 序号, Ticket, 代数)]，已出队或已重新入队的票在弹出时忽略
+        self._seq = itertools.count()
+        self._matched = []  # 本周期匹配成功、等待批量建房的各组 [Ticket, ...]
+        self._flush_scheduled = False
+        self._inflight = set()  # 正在建房的批次，保持引用直到完成
+        self._task = None
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def enqueue(self, ticket: Ticket):
+        self.cancel(ticket.username)
+        ticket.generation += 1
+        ticket.bucket = ticket.points // self.config["bucket_width"]
+        self._tickets[ticket.username] = ticket
+        self._buckets.setdefault((ticket.players, ticket.bucket), {})[ticket.username] = ticket
+        if not self._try_match(ticket):
+            self._schedule_widen(ticket)
+
+    def cancel(self, username: str, conn=None):
+        """撤销排队；指定 conn 时只撤销由该连接发起的排队票"""
+        ticket = self._tickets.get(username)
+        if ticket is None or (conn is not None and ticket.conn is not conn):
+            return None
+        del self._tickets[username]
+        key = (ticket.players, ticket.bucket)
+        bucket = self._buckets[key]
+        del bucket[username]
+        if not bucket:
+            del self._buckets[key]
+        return ticket
+
+    def _schedule_widen(self, ticket: Ticket):
+        if ticket.window < self.config["max_window"]:
+            due = ticket.enqueued_at + (ticket.window + 1) * self.config["widen_interval"]
+            heapq.heappush(self._widen_heap, (due, next(self._seq), ticket, ticket.generation))
+
+    def _nearby_buckets(self, ticket: Ticket):
+        """由近到远返回搜索范围内的桶"""
+        yield ticket.bucket
+        for offset in range(1, ticket.window + 1):
+            yield ticket.bucket - offset
+            yield ticket.bucket + offset
+
+    def _try_match(self, ticket: Ticket) -> bool:
+        need = ticket.players - 1
+        found = []
+        for bucket_id in self._nearby_buckets(ticket):
+            for other in self._buckets.get((ticket.players, bucket_id), {}).values():
+                if other is not ticket:
+                    found.append(other)
+                    if len(found) == need:
+                        break
+            if len(found) == need:
+                break
+        else:
+            return False
+        group = [ticket, *found]
+        for member in group:
+            self.cancel(member.username)
+        self._matched.append(group)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+        return True
+
+    def _widen_due(self):
+        now = time.monotonic()
+        heap = self._widen_heap
+        while heap and heap[0][0] <= now:
+            _, _, ticket, generation = heapq.heappop(heap)
+            if self._tickets.get(ticket.username) is not ticket or ticket.generation != generation:
+                continue
+            ticket.window += 1
+            if not self._try_match(ticket):
+                self._schedule_widen(ticket)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        groups, self._matched = self._matched, []
+        if groups:
+            task = asyncio.ensure_future(self._create_rooms(groups))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _create_rooms(self, groups):
+        try:
+            room_ids = await create_rooms([[ticket.username for ticket in group] for group in groups])
+        except Exception:
+            logger.exception("匹配成功后创建房间失败，%d 组玩家重新排队", len(groups))
+            tickets = [ticket for group in groups for ticket in group]
+            for ticket in tickets:
+                match_hub.send(ticket.conn, dumps({"action": "error", "detail": "创建房间失败，继续排队"}))
+            # 等待一个检查周期再放回队列，避免数据库不可用时反复匹配、建房
+            await asyncio.sleep(self.config["tick"])
+            for ticket in tickets:
+                # 保留原来的排队时间；期间断开或已从新连接重新排队的玩家不再放回
+                if not ticket.conn.closed and ticket.username not in self._tickets:
+                    self.enqueue(ticket)
+            return
+        now = time.monotonic()
+        for room_id, group in zip(room_ids, groups):
+            players = [ticket.username for ticket in group]
+            message = dumps({"action": "matched", "room_id": room_id, "players": players})
+            for ticket in group:
+                MATCH_WAIT_SECONDS.observe(now - ticket.enqueued_at, str(ticket.players))
+                match_hub.send(ticket.conn, message)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.config["tick"])
+            self._widen_due()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+# 全局匹配服务实例
+matchmaker = Matchmaker(MATCHMAKING_CONFIG)
+
+
+def supported_player_counts():
+    """finish_game 能够结算的桌型人数"""
+    return sorted(game_manager.get_compiled_config("poker_battle").scores)
+
+
+@router.websocket("/ws/match")
+async def match_websocket(websocket: WebSocket):
+    token = connection_token(websocket)
+    if websocket_token_rejected(token):
+        await websocket.close(code=AUTH_CLOSE_CODE)
+        return
+    await websocket.accept()
+    conn = match_hub.register(QUEUE_GROUP, websocket)
+    # 匹配队列的连接都在同一个分组中，只按连接限流
+    limiter = admission.open("match")
+    username = None
+    try:
+        while not conn.closed:
+            # 匹配只使用 JSON；二进制帧同样按 UTF-8 JSON 解析，无法解析时忽略
+            data = await wire.receive(websocket)
+            if conn.closed:
+                break
+            rejected = admission.admit(limiter, data)
+            if rejected is not None:
+                close_code = admission.close_code(limiter, rejected)
+                if close_code is not None:
+                    match_hub.close(conn, close_code)
+                    break
+                if admission.notify(limiter):
+                    match_hub.send(conn, dumps({"action": "error", "detail": "操作过于频繁，请稍后再试"}))
+                continue
+            try:
+                message = json.loads(data)
+            except Exception:
+                continue
+            if not isinstance(message, dict):
+                continue
+            action = message.get("action")
+            if action == "enqueue":
+                player, denied = check_user(token, message.get("username"))
+                if denied is not None:
+                    match_hub.send(conn, dumps({"action": "error", "detail": denied[1]}))
+                    continue
+                players = message.get("players", 2)
+                if players not in supported_player_counts():
+                    match_hub.send(conn, dumps({"action": "error", "detail": "不支持该玩家数量"}))
+                    continue
+                points = (await get_users_points([player])).get(player)
+                if points is None:
+                    match_hub.send(conn, dumps({"action": "error", "detail": "用户不存在"}))
+                    continue
+                if username is not None and username != player:
+                    matchmaker.cancel(username)
+                username = player
+                match_hub.send(conn, dumps({"action": "queued", "players": players, "points": points}))
+                matchmaker.enqueue(Ticket(username, points, players, conn))
+            elif action == "cancel":
+                if username is not None:
+                    matchmaker.cancel(username)
+                match_hub.send(conn, dumps({"action": "cancelled"}))
+            elif not admission.shed(limiter):
+                match_hub.send(conn, dumps({"action": "error", "detail": "Unknown action"}))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # 断开时只撤销本连接自己的排队票（同一玩家可能已从新连接重新排队）
+        if username is not None:
+            matchmaker.cancel(username, conn)
+        match_hub.unregister(conn)
+        admission.close(limiter)
@@ -0,0 +1,136 @@
+# app/metrics.py
+"""
+进程内指标：计数器、直方图和实时仪表，以 Prometheus 文本格式在 /metrics 暴露。
+  - 记录只做字典查找和列表下标累加，没有锁和后台任务，空闲时没有任何开销
+  - 仪表（Gauge）使用回调函数，只在抓取 /metrics 时计算
+"""
+import inspect
+from bisect import bisect_left
+
+# 默认的耗时分桶（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# 默认的消息大小分桶（字节）
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}  # 格式: { 标签值元组: 数值 }
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # 格式: { 标签值元组: [各分桶计数..., +Inf 计数, 总和] }
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for label_values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, (("le", bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {series[-1]}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge:
+    """实时仪表：callback 返回数值，或返回 { 标签值元组: 数值 }；可以是协程函数"""
+
+    def __init__(self, name: str, documentation: str, callback, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.callback = callback
+
+    async def collect(self):
+        value = self.callback()
+        if inspect.isawaitable(value):
+            value = await value
+        return value if isinstance(value, dict) else {(): value}
+
+    async def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for label_values, value in (await self.collect()).items():
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name, documentation, callback, labels=()):
+        return self._register(Gauge(name, documentation, callback, labels))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    async def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            if isinstance(metric, Gauge):
+                lines.extend(await metric.render())
+            else:
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# 热点路径上的指标
+WS_ACTION_SECONDS = registry.histogram(
+    "cardgame_ws_action_seconds", "WebSocket 消息处理耗时", labels=("route", "action"))
+WS_ACTION_FAILURES = registry.counter(
+    "cardgame_ws_action_failures_total", "WebSocket 消息处理时抛出异常的次数", labels=("route", "action"))
+WS_MESSAGE_BYTES = registry.histogram(
+    "cardgame_ws_message_bytes", "WebSocket 消息大小", labels=("route", "direction"), buckets=SIZE_BUCKETS)
+DB_QUERY_SECONDS = registry.histogram(
+    "cardgame_db_query_seconds", "数据库调用耗时", labels=("pool", "method"))
+BROADCAST_SECONDS = registry.histogram(
+    "cardgame_broadcast_seconds", "一次广播扇出（编码 + 入队）的耗时", labels=("hub",))
+JSON_ENCODE_SECONDS = registry.histogram(
+    "cardgame_json_encode_seconds", "消息 JSON 序列化耗时")
@@ -19,18 +19,91 @@ game_records = sqlalchemy.Table(
     sqlalchemy.Column("user_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("users.id"), nullable=False, index=True),
     sqlalchemy.Column("session_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("game_sessions.id"), nullable=False, index=True),
     sqlalchemy.Column("game_time", sqlalchemy.DateTime, nullable=False),
-    sqlalchemy.Column("room_id", sqlalchemy.String, nullable=False, index=True),
+    sqlalchemy.Column("room_id", sqlalchemy.String, nullable=False),
     sqlalchemy.Column("opponents", sqlalchemy.String, nullable=True),
     sqlalchemy.Column("result", sqlalchemy.String, nullable=False),  # "win", "loss", "draw"
-    sqlalchemy.Column("score_change", sqlalchemy.Integer, nullable=False)
+    sqlalchemy.Column("score_change", sqlalchemy.Integer, nullable=False),
+    # 按用户查询对局记录并按时间分页时使用的复合索引
+    sqlalchemy.Index("ix_game_records_user_id_game_time", "user_id", "game_time"),
+    # 管理后台按时间分页浏览全部对局记录时使用
+    sqlalchemy.Index("ix_game_records_game_time", "game_time"),
+    # 管理后台按房间号过滤并按时间分页时使用（同时覆盖只按房间号的查询）
+    sqlalchemy.Index("ix_game_records_room_id_game_time", "room_id", "game_time"),
 )
 
-# 游戏对局表：记录每场完整的对局信息
+# 游戏对局表：记录每场完整的对局信息。同一房间可以重新开局，一个房间号对应多局（以房间号 + 对局时间区分）
 game_sessions = sqlalchemy.Table(
     "game_sessions",
     metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, index=True, autoincrement=True),
-    sqlalchemy.Column("room_id", sqlalchemy.String, unique=True, nullable=False, index=True),
+    sqlalchemy.Column("room_id", sqlalchemy.String, nullable=False, index=True),
     sqlalchemy.Column("game_time", sqlalchemy.DateTime, nullable=False),
     sqlalchemy.Column("players", sqlalchemy.String, nullable=False),  # 以逗号分隔的玩家用户名列表
-)
\ No newline at end of file
+)
+# 用户统计表：每个用户一行，在结算事务中与对局记录一起更新，读取统计时只需按主键查一行
+#   current_streak: 当前连续结果，连胜为正数、连败为负数、平局归零；best_streak: 历史最长连胜
+user_stats = sqlalchemy.Table(
+    "user_stats",
+    metadata,
+    sqlalchemy.Column("user_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("users.id"), primary_key=True),
+    sqlalchemy.Column("games", sqlalchemy.Integer, nullable=False, server_default="0"),
+    sqlalchemy.Column("wins", sqlalchemy.Integer, nullable=False, server_default="0"),
+    sqlalchemy.Column("losses", sqlalchemy.Integer, nullable=False, server_default="0"),
+    sqlalchemy.Column("draws", sqlalchemy.Integer, nullable=False, server_default="0"),
+    sqlalchemy.Column("current_streak", sqlalchemy.Integer, nullable=False, server_default="0"),
+    sqlalchemy.Column("best_streak", sqlalchemy.Integer, nullable=False, server_default="0"),
+    sqlalchemy.Column("last_game_time", sqlalchemy.DateTime, nullable=True),
+)
+
+# 共享状态表：多个 worker 进程通过该表共享房间与游戏状态（SQLite 状态存储后端使用）
+state_store = sqlalchemy.Table(
+    "state_store",
+    metadata,
+    sqlalchemy.Column("namespace", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("key", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("version", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("data", sqlalchemy.Text, nullable=False),
+)
+
+# 跨进程广播消息表：SQLite 轮询方式的发布订阅使用，每行是某个 worker 在一个事件循环周期内发布的一批消息
+pubsub_messages = sqlalchemy.Table(
+    "pubsub_messages",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
+    sqlalchemy.Column("origin", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False, index=True),
+    sqlalchemy.Column("batch", sqlalchemy.Text, nullable=False),
+)
+
+# 已写入数据库的结算日志条目（write-behind 模式）：重放结算日志时据此跳过已写入的对局，保证幂等
+applied_settlements = sqlalchemy.Table(
+    "applied_settlements",
+    metadata,
+    sqlalchemy.Column("key", sqlalchemy.String, primary_key=True),  # 格式: "<room_id>@<对局时间>"
+    sqlalchemy.Column("session_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("game_sessions.id"), nullable=False),
+)
+
+# 对局事件日志：每局游戏的开局（随机种子）、摸牌、出牌、结算等操作各一行，用于重启恢复和对局回放
+#   game_key 与结算日志相同（"<room_id>@<开局时间>"），seq 为操作后的游戏状态版本号
+game_events = sqlalchemy.Table(
+    "game_events",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
+    sqlalchemy.Column("game_key", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("room_id", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("seq", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("kind", sqlalchemy.String, nullable=False),  # "init", "draw", "play", "finish", "reopen"
+    sqlalchemy.Column("data", sqlalchemy.Text, nullable=False),  # 紧凑 JSON，牌为整数编码
+    sqlalchemy.Index("ix_game_events_game_key_seq", "game_key", "seq"),
+    sqlalchemy.Index("ix_game_events_room_id_id", "room_id", "id"),
+)
+# 进行中游戏的快照：每个房间最多一行，开局时写入并定期更新，游戏被回收时删除；
+# 启动时只需从这些快照重放其后的少量事件，恢复时间与进行中的游戏数成正比
+game_snapshots = sqlalchemy.Table(
+    "game_snapshots",
+    metadata,
+    sqlalchemy.Column("room_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("game_key", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("seq", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("data", sqlalchemy.Text, nullable=False),  # GameState.to_record() 的 JSON
+)
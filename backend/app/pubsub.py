@@ -0,0 +1,304 @@
+# app/pubsub.py
+"""
+跨 worker 进程的发布订阅：让任意 worker 上的广播都能送达其他 worker 上订阅同一房间的连接。
+  - local:  单进程模式，不做任何跨进程转发（默认）
+  - unix:   通过本机 Unix socket 连接独立的 broker 进程，broker 按订阅关系转发
+            （启动 broker: python -m app.pubsub）
+  - sqlite: 没有 broker 时的后备方案，通过 pubsub_messages 表轮询
+同一个事件循环周期内发布的消息按频道合并成一帧（一行）发送，降低进程间通信开销。
+频道名格式为 "<hub 名称>:<room_id>"，消息是 { 协议: 已编码的 str / bytes }。
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import struct
+import time
+import uuid
+from abc import ABC, abstractmethod
+from sqlalchemy import select, insert, delete, func
+from app.config import get_section
+from app.database import database
+from app.models import pubsub_messages
+
+logger = logging.getLogger(__name__)
+
+PUBSUB_CONFIG = get_section("pubsub", {
+    "backend": "local",
+    "socket_path": "/tmp/cardgame-pubsub.sock",
+    "poll_interval": 0.05,
+    "retention_seconds": 60,
+    "reconnect_delay": 1.0,
+})
+
+_FRAME_HEADER = struct.Struct("!I")
+# broker 中单个 worker 积压超过该字节数时断开它，避免拖慢其他 worker
+_BROKER_MAX_BUFFER = 16 * 1024 * 1024
+
+
+def _encode_payload(payload):
+    if isinstance(payload, bytes):
+        return {"b64": base64.b64encode(payload).decode("ascii")}
+    return payload
+
+
+def _decode_payload(payload):
+    if isinstance(payload, dict):
+        return base64.b64decode(payload["b64"])
+    return payload
+
+
+def _encode_message(message: dict) -> dict:
+    return {protocol: _encode_payload(payload) for protocol, payload in message.items()}
+
+
+def _decode_message(message: dict) -> dict:
+    return {protocol: _decode_payload(payload) for protocol, payload in message.items()}
+
+
+class PubSub(ABC):
+    """发布订阅基类；enabled 为 False 时调用方可以跳过跨进程所需的编码工作"""
+    enabled = True
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self.subscriptions = set()
+        self._deliver = None
+        self._pending = {}  # 格式: { channel: [message, ...] }，等待本周期合并发送
+        self._flush_scheduled = False
+
+    async def start(self, deliver):
+        """deliver(channel, message) 在收到其他 worker 的消息时被调用"""
+        self._deliver = deliver
+
+    async def stop(self):
+        pass
+
+    def subscribe(self, channel: str):
+        self.subscriptions.add(channel)
+
+    def unsubscribe(self, channel: str):
+        self.subscriptions.discard(channel)
+
+    def publish(self, channel: str, message: dict):
+        self._pending.setdefault(channel, []).append(_encode_message(message))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        batch, self._pending = self._pending, {}
+        if batch:
+            self._send_batch(batch)
+
+    @abstractmethod
+    def _send_batch(self, batch: dict):
+        """把本周期合并的消息批次 { channel: [message, ...] } 发送给其他 worker"""
+
+    def _dispatch(self, batch: dict):
+        for channel, messages in batch.items():
+            if channel not in self.subscriptions:
+                continue
+            for message in messages:
+                self._deliver(channel, _decode_message(message))
+
+
+class LocalPubSub(PubSub):
+    enabled = False
+
+    def publish(self, channel, message):
+        pass
+
+    def _send_batch(self, batch):
+        pass
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> dict:
+    header = await reader.readexactly(_FRAME_HEADER.size)
+    body = await reader.readexactly(_FRAME_HEADER.unpack(header)[0])
+    return json.loads(body)
+
+
+def _write_frame(writer: asyncio.StreamWriter, frame: dict):
+    body = json.dumps(frame, separators=(",", ":")).encode("utf-8")
+    writer.write(_FRAME_HEADER.pack(len(body)) + body)
+
+
+class UnixSocketPubSub(PubSub):
+    def __init__(self, path: str, reconnect_delay: float):
+        super().__init__()
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self._writer = None
+        self._task = None
+        self._dropped = 0  # 与 broker 断开期间丢弃的批次数
+
+    async def start(self, deliver):
+        await super().start(deliver)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+    def subscribe(self, channel):
+        if channel not in self.subscriptions and self._writer is not None:
+            _write_frame(self._writer, {"sub": [channel]})
+        super().subscribe(channel)
+
+    def unsubscribe(self, channel):
+        if channel in self.subscriptions and self._writer is not None:
+            _write_frame(self._writer, {"unsub": [channel]})
+        super().unsubscribe(channel)
+
+    def _send_batch(self, batch):
+        # broker 不可用时直接丢弃：本地连接已经收到消息，其他 worker 重连后可通过快照恢复。
+        # 每次断开只在第一次丢弃时告警，重连时汇总丢弃的批次数
+        if self._writer is not None:
+            _write_frame(self._writer, {"batch": batch})
+            return
+        if not self._dropped:
+            logger.warning("pubsub broker %s 不可用，断开期间的消息不会转发给其他 worker", self.path)
+        self._dropped += 1
+
+    async def _run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            self._writer = writer
+            if self._dropped:
+                logger.warning("已重新连接 pubsub broker %s，断开期间丢弃了 %d 个消息批次", self.path, self._dropped)
+                self._dropped = 0
+            _write_frame(writer, {"sub": list(self.subscriptions)})
+            try:
+                while True:
+                    frame = await _read_frame(reader)
+                    self._dispatch(frame.get("batch", {}))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                self._writer = None
+                writer.close()
+            await asyncio.sleep(self.reconnect_delay)
+
+
+class SQLitePubSub(PubSub):
+    def __init__(self, poll_interval: float, retention_seconds: float):
+        super().__init__()
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._last_id = 0
+        self._task = None
+        self._inflight = set()  # 正在写入的批次，保持引用直到写入完成
+
+    async def start(self, deliver):
+        await super().start(deliver)
+        # 只接收启动之后发布的消息
+        self._last_id = await database.fetch_val(select(func.max(pubsub_messages.c.id))) or 0
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def _send_batch(self, batch):
+        task = asyncio.ensure_future(database.execute(insert(pubsub_messages).values(
+            origin=self.origin,
+            created_at=time.time(),
+            batch=json.dumps(batch, separators=(",", ":"))
+        )))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _poll(self):
+        last_cleanup = time.monotonic()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            query = (
+                select(pubsub_messages.c.id, pubsub_messages.c.origin, pubsub_messages.c.batch)
+                .where(pubsub_messages.c.id > self._last_id)
+                .order_by(pubsub_messages.c.id)
+            )
+            for row in await database.fetch_all(query):
+                self._last_id = row["id"]
+                if row["origin"] != self.origin and self.subscriptions:
+                    self._dispatch(json.loads(row["batch"]))
+            if time.monotonic() - last_cleanup > self.retention_seconds:
+                last_cleanup = time.monotonic()
+                await database.execute(
+                    delete(pubsub_messages).where(pubsub_messages.c.created_at < time.time() - self.retention_seconds)
+                )
+
+
+def create_pubsub(config: dict) -> PubSub:
+    backend = config["backend"]
+    if backend == "local":
+        return LocalPubSub()
+    if backend == "unix":
+        return UnixSocketPubSub(config["socket_path"], config["reconnect_delay"])
+    if backend == "sqlite":
+        return SQLitePubSub(config["poll_interval"], config["retention_seconds"])
+    raise ValueError(f"不支持的发布订阅后端: {backend}")
+
+
+# 全局发布订阅实例
+pubsub = create_pubsub(PUBSUB_CONFIG)
+
+
+##########################
+# Unix socket broker
+##########################
+
+async def run_broker(path: str):
+    """按订阅关系在各 worker 之间转发消息批次（不会回发给消息的发布者）"""
+    clients = {}  # 格式: { StreamWriter: set(channel) }
+
+    async def handle(reader, writer):
+        subscriptions = clients[writer] = set()
+        try:
+            while True:
+                frame = await _read_frame(reader)
+                if "sub" in frame:
+                    subscriptions.update(frame["sub"])
+                elif "unsub" in frame:
+                    subscriptions.difference_update(frame["unsub"])
+                elif "batch" in frame:
+                    for other, other_subscriptions in list(clients.items()):
+                        if other is writer:
+                            continue
+                        part = {c: m for c, m in frame["batch"].items() if c in other_subscriptions}
+                        if not part:
+                            continue
+                        if other.transport.get_write_buffer_size() > _BROKER_MAX_BUFFER:
+                            logger.warning("worker 积压超过 %d 字节，断开连接", _BROKER_MAX_BUFFER)
+                            other.close()
+                            continue
+                        _write_frame(other, {"batch": part})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            clients.pop(writer, None)
+            writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle, path)
+    logger.info("pubsub broker listening on %s", path)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CardGame 跨进程发布订阅 broker")
+    parser.add_argument("--path", default=PUBSUB_CONFIG["socket_path"], help="Unix socket 路径")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(run_broker(args.path))
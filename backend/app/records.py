@@ -0,0 +1,88 @@
+# app/records.py
+"""
+对局记录查询：
+  - 按 (game_time, id) 做游标分页，每页都是 (user_id, game_time) 索引上的一次范围扫描，
+    不随历史记录数量变慢（不使用 OFFSET）
+  - 全量导出使用 NDJSON 流式响应，逐行读取数据库、逐行发送，服务端内存占用不随记录数增长
+  - 查询都走只读连接池（read_database），不与结算写入争用连接
+"""
+import base64
+import json
+from datetime import datetime
+from urllib.parse import quote
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_
+from app.database import read_database
+from app.models import game_records
+
+# 每页默认条数与上限
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(game_time: datetime, record_id: int) -> str:
+    raw = f"{game_time.isoformat()}|{record_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    """解析游标，返回 (game_time, id)；游标不合法时返回 400"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        game_time, record_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(game_time), int(record_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="分页游标不合法")
+
+
+def page_size(limit) -> int:
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit 必须大于 0")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def newest_first(query, table=game_records, cursor: str = None):
+    """按对局时间从新到旧排序（时间相同按 id），并从游标之后继续"""
+    if cursor:
+        game_time, record_id = decode_cursor(cursor)
+        query = query.where(or_(
+            table.c.game_time < game_time,
+            and_(table.c.game_time == game_time, table.c.id < record_id)
+        ))
+    return query.order_by(table.c.game_time.desc(), table.c.id.desc())
+
+
+async def fetch_page(query, limit: int):
+    """
+    读取一页（query 需已按 newest_first 排序），多取一条判断是否还有下一页。
+    返回 (记录列表, 下一页游标 or None)
+    """
+    rows = await read_database.fetch_all(query.limit(limit + 1))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last["game_time"], last["id"])
+    return [dict(row) for row in rows], next_cursor
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def ndjson_response(query, filename: str) -> StreamingResponse:
+    """以 NDJSON（每行一个 JSON 对象）流式返回查询结果"""
+    async def lines():
+        async for row in read_database.iterate(query):
+            yield json.dumps(dict(row), ensure_ascii=False, default=_json_default) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"}
+    )
@@ -0,0 +1,97 @@
+# app/room_actor.py
+"""
+每个房间一个 actor 协程：
+  - 各玩家连接的接收协程只把消息放入房间的收件箱，由该房间唯一的 actor 依次处理，
+    同一房间的操作不会在 await 之间交错（例如两个连接同时发现所有人都已出牌而重复结算）
+  - actor 一次取出收件箱中已积压的全部消息（最多 MAX_BATCH 条）放在同一个批次中处理，
+    处理完后由批次对象统一发送，同一时刻的多个操作只产生一次合并后的广播
+  - 房间内最后一个连接断开或房间被回收时停止 actor，下次有消息时重新创建
+处理消息时抛出的异常（如结算写入失败）会记录日志和 cardgame_ws_action_failures_total 指标，
+并通过批次向发送者回复 INTERNAL_ERROR，actor 继续处理后续消息。
+跨进程的并发仍由状态存储的版本号保证，actor 只负责本进程内的串行化。
+"""
+import asyncio
+import logging
+import time
+from app.metrics import WS_ACTION_SECONDS, WS_ACTION_FAILURES
+
+logger = logging.getLogger(__name__)
+
+# 处理消息出错时回复给发送者的提示
+INTERNAL_ERROR = "服务器内部错误，请稍后重试"
+
+# 一个批次最多合并处理的消息数，避免持续有消息时迟迟不发送广播
+MAX_BATCH = 32
+# 收件箱暂时为空
+_IDLE = object()
+# 运行中的 actor 协程，保持引用直到退出
+_running = set()
+
+
+class RoomActors:
+    def __init__(self, name: str, handle, new_batch, actions=()):
+        """
+        handle(batch, conn, message): 处理一条消息的协程函数
+        new_batch(room_id): 创建批次对象（需有 room_id 属性），批次对象的 flush() 发送本批次积累的全部消息，
+            send_error(conn, detail) 在本批次中向单个连接回复错误
+        actions: 已知的消息类型，其余在指标中统一记为 unknown
+        """
+        self.name = name
+        self.handle = handle
+        self.new_batch = new_batch
+        self.actions = set(actions)
+        self.inboxes = {}  # 格式: { room_id: asyncio.Queue }，每个收件箱对应一个 actor 协程
+
+    def submit(self, room_id: str, conn, message: dict):
+        """把消息放入房间收件箱（不等待处理），actor 不存在时创建"""
+        inbox = self.inboxes.get(room_id)
+        if inbox is None:
+            inbox = self.inboxes[room_id] = asyncio.Queue()
+            task = asyncio.create_task(self._run(room_id, inbox))
+            _running.add(task)
+            task.add_done_callback(_running.discard)
+        inbox.put_nowait((conn, message, time.perf_counter()))
+
+    def stop(self, room_id: str):
+        """处理完已收到的消息后停止该房间的 actor（之后又收到消息时继续运行）"""
+        inbox = self.inboxes.get(room_id)
+        if inbox is not None:
+            inbox.put_nowait(None)
+
+    def __len__(self):
+        return len(self.inboxes)
+
+    async def _run(self, room_id: str, inbox: asyncio.Queue):
+        item = await inbox.get()
+        while True:
+            if item is None:
+                if inbox.empty():
+                    # 检查与移除之间没有 await，不会漏掉新消息
+                    del self.inboxes[room_id]
+                    return
+                item = inbox.get_nowait()
+                continue
+            batch = self.new_batch(room_id)
+            # 让出一次事件循环，同一时刻其他连接收到的消息先进入收件箱，与本条合并为一个批次
+            await asyncio.sleep(0)
+            for _ in range(MAX_BATCH):
+                await self._handle(batch, *item)
+                # 处理期间（await 时）新到达的消息也合并到本批次
+                item = _IDLE if inbox.empty() else inbox.get_nowait()
+                if item is _IDLE or item is None:
+                    break
+            batch.flush()
+            if item is _IDLE:
+                item = await inbox.get()
+
+    async def _handle(self, batch, conn, message: dict, received: float):
+        action = message.get("action")
+        label = action if action in self.actions else "unknown"
+        try:
+            await self.handle(batch, conn, message)
+        except Exception:
+            logger.exception("房间 %s 处理消息 %s 失败", batch.room_id, action)
+            WS_ACTION_FAILURES.inc(self.name, label)
+            batch.send_error(conn, INTERNAL_ERROR)
+            return
+        WS_ACTION_SECONDS.observe(time.perf_counter() - received, self.name, label)
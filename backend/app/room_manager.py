@@ -1,53 +1,271 @@
 # app/room_manager.py
+import json
 import random
 import string
+from fastapi import HTTPException
+from app.state_store import store, VersionConflict
+from app.lifecycle import lifecycle, LIFECYCLE_CONFIG
+from app.pubsub import pubsub
+from app.ws_hub import room_hub, register_remote
+
+# 房间信息保存在共享状态存储的 rooms 命名空间中，
+# 格式: { "room_id": ..., "mode": 游戏模式, "users": { username: ready }, "playing": 是否有进行中的对局 }
+# （较早创建的房间没有 mode 和 playing）
+ROOMS = "rooms"
+DEFAULT_MODE = "poker_battle"
+
+# 房间目录，格式: { room_id: { "room_id", "mode", "user_count": 玩家数, "ready_count": 已准备人数, "playing" } }
+# 房间变化时同步更新，列出房间时无需逐个读取状态存储；启动时由 load_room_directory 从状态存储重建。
+# 启用跨进程发布订阅时，各 worker 通过 "directory:rooms" 频道互相同步目录变化
+_room_directory = {}
+# 按 (游戏模式, 玩家数) 分桶的房间索引，格式: { (mode, user_count): { room_id: None } }，
+# 查找有空位的房间只需遍历对应的几个桶
+_room_index = {}
+# 目录变化的监听函数 listener(room_id, 目录项或 None)，例如大厅推送
+_listeners = []
+_DIRECTORY_CHANNEL = "directory:rooms"
+
+
+# 房间因长时间无活动被回收时，关闭仍连着的客户端使用的关闭码（1001: Going Away）
+ROOM_EXPIRED_CLOSE_CODE = 1001
+
+
+def _room_ttl(room) -> float:
+    return LIFECYCLE_CONFIG["empty_room_ttl"] if not room["users"] else LIFECYCLE_CONFIG["room_idle_ttl"]
+
+
+def _track(room_id: str, room, publish: bool = True):
+    """房间变化后更新房间目录（并同步给其他 worker），并记录一次活动"""
+    if room is None:
+        entry = None
+        lifecycle.forget("room", room_id)
+    else:
+        entry = {
+            "room_id": room_id,
+            "mode": room.get("mode", DEFAULT_MODE),
+            "user_count": len(room["users"]),
+            "ready_count": sum(1 for ready in room["users"].values() if ready),
+            "playing": room.get("playing", False),
+        }
+        lifecycle.touch("room", room_id, _room_ttl(room))
+    if _set_entry(room_id, entry) and publish and pubsub.enabled:
+        pubsub.publish(_DIRECTORY_CHANNEL, {"entry": json.dumps(entry or {"room_id": room_id})})
+
+
+def _set_entry(room_id: str, entry) -> bool:
+    """更新目录和索引，目录项有变化时通知监听函数并返回 True"""
+    previous = _room_directory.get(room_id)
+    if previous == entry:
+        return False
+    if previous is not None:
+        bucket = _room_index.get((previous["mode"], previous["user_count"]))
+        bucket.pop(room_id, None)
+        if not bucket:
+            del _room_index[(previous["mode"], previous["user_count"])]
+    if entry is None:
+        _room_directory.pop(room_id, None)
+    else:
+        _room_directory[room_id] = entry
+        _room_index.setdefault((entry["mode"], entry["user_count"]), {})[room_id] = None
+    for listener in _listeners:
+        listener(room_id, entry)
+    return True
+
+
+def _apply_remote(room_id: str, message: dict):
+    """其他 worker 发布的目录变化：只更新本地目录，不再转发"""
+    entry = json.loads(message["entry"])
+    _set_entry(entry["room_id"], entry if "mode" in entry else None)
+
+
+def add_directory_listener(listener):
+    _listeners.append(listener)
+
+
+async def load_room_directory():
+    """从状态存储重建房间目录（启动时调用一次）"""
+    _room_directory.clear()
+    _room_index.clear()
+    pubsub.subscribe(_DIRECTORY_CHANNEL)
+    for room_id in await store.keys(ROOMS):
+        # 其他 worker 从同一个状态存储重建，不需要再同步
+        _track(room_id, await get_room_info(room_id), publish=False)
+
+
+def list_rooms():
+    """返回所有房间的目录项"""
+    return list(_room_directory.values())
+
+
+def rooms_with_user_count(mode: str, user_count: int):
+    """索引中某个游戏模式下玩家数为 user_count 的房间目录项"""
+    return [_room_directory[room_id] for room_id in _room_index.get((mode, user_count), ())]
+
+
+def get_directory_entry(room_id: str):
+    return _room_directory.get(room_id)
+
+
+def capacity(mode: str) -> int:
+    """房间容量：游戏模式能够结算的最大玩家数；模式不存在时为 0"""
+    # 延迟导入：game_manager 加载游戏模式时会导入本模块
+    from app.game_manager import game_manager
+    try:
+        scores = getattr(game_manager.get_compiled_config(mode), "scores", None)
+    except HTTPException:
+        scores = None
+    return max(scores) if scores else 0
 
-# 改为字典形式存储房间信息，其中 users 为 { username: ready } 的形式
-rooms = {}
 
 def generate_random_room_id(length: int = 8) -> str:
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
 
-def create_room(username: str):
-    room_id = generate_random_room_id()
-    while room_id in rooms:
-        room_id = generate_random_room_id()
+
+async def create_room(username: str, mode: str = DEFAULT_MODE):
     # 初始化房间，将创建者加入，初始状态为未就绪
-    rooms[room_id] = {"room_id": room_id, "users": {}}
-    join_room(room_id, username)
-    return True, room_id
-
-def join_room(room_id: str, username: str):
-    if room_id not in rooms:
-        return False, "房间不存在"
-    # 如果玩家还未加入，则加入并标记未就绪
-    if username not in rooms[room_id]["users"]:
-        rooms[room_id]["users"][username] = False
-    return True, "加入房间成功"
-
-def set_ready(room_id: str, username: str):
-    if room_id not in rooms:
-        return False, "房间不存在"
-    if username not in rooms[room_id]["users"]:
-        return False, "用户未在房间内"
-    rooms[room_id]["users"][username] = True
-    return True, "已准备就绪"
-
-def all_ready(room_id: str):
-    if room_id not in rooms:
+    return True, await _create_room_with([username], mode)
+
+
+async def _create_room_with(usernames, mode: str = DEFAULT_MODE) -> str:
+    """创建包含给定玩家（均未就绪）的房间，返回房间号；房间号冲突时重新生成"""
+    while True:
+        room_id = generate_random_room_id()
+        room = {"room_id": room_id, "mode": mode, "users": dict.fromkeys(usernames, False)}
+        try:
+            await store.put(ROOMS, room_id, room, 0)
+        except VersionConflict:
+            continue
+        _track(room_id, room)
+        return room_id
+
+
+async def restore_room(room_id: str, usernames, mode: str = DEFAULT_MODE, playing: bool = True) -> bool:
+    """
+    重启后恢复进行中的游戏时补建房间（进程内状态存储中的房间已随进程丢失，前端无法重新进入）：
+    房间不存在时以原来的玩家（均已准备）重新创建，已存在时不修改，返回是否新建。
+    需在 load_room_directory 之前调用，由其登记到房间目录。
+    """
+    room = {"room_id": room_id, "mode": mode, "users": dict.fromkeys(usernames, True), "playing": playing}
+    try:
+        await store.put(ROOMS, room_id, room, 0)
+    except VersionConflict:
+        return False
+    return True
+
+
+async def create_rooms(groups, mode: str = DEFAULT_MODE):
+    """
+    批量创建房间（匹配服务使用）：每组玩家一个房间（均未就绪），所有房间一次批量写入状态存储，
+    房间号冲突的几个重新生成后再写一次。返回与 groups 对应的房间号列表
+    """
+    room_ids = [None] * len(groups)
+    pending = list(range(len(groups)))
+    while pending:
+        batch = {}  # 格式: { room_id: groups 中的下标 }
+        for index in pending:
+            room_id = generate_random_room_id()
+            while room_id in batch:
+                room_id = generate_random_room_id()
+            batch[room_id] = index
+        rooms = {
+            room_id: {"room_id": room_id, "mode": mode, "users": dict.fromkeys(groups[index], False)}
+            for room_id, index in batch.items()
+        }
+        conflicts = await store.create_many(ROOMS, rooms)
+        pending = [batch[room_id] for room_id in conflicts]
+        for room_id, room in rooms.items():
+            if room_id not in conflicts:
+                room_ids[batch[room_id]] = room_id
+                _track(room_id, room)
+    return room_ids
+
+
+async def join_room(room_id: str, username: str):
+    def mutate(room):
+        if room is None:
+            return False, "房间不存在", None
+        # 如果玩家还未加入，则加入并标记未就绪；已在房间内的玩家重复加入不受容量限制
+        if username not in room["users"]:
+            if len(room["users"]) >= capacity(room.get("mode", DEFAULT_MODE)):
+                return False, "房间已满", room
+            room["users"][username] = False
+        return True, "加入房间成功", room
+    success, msg, room = await store.update(ROOMS, room_id, mutate)
+    _track(room_id, room)
+    return success, msg
+
+
+async def set_ready(room_id: str, username: str):
+    def mutate(room):
+        if room is None:
+            return False, "房间不存在", None
+        if username not in room["users"]:
+            return False, "用户未在房间内", room
+        room["users"][username] = True
+        return True, "已准备就绪", room
+    success, msg, room = await store.update(ROOMS, room_id, mutate)
+    if success:
+        _track(room_id, room)
+    return success, msg, room
+
+
+async def all_ready(room_id: str):
+    room = await get_room_info(room_id)
+    if room is None:
         return False
     # 检查所有用户是否都为 True
-    return all(rooms[room_id]["users"].values())
+    return all(room["users"].values())
+
+
+async def get_room_info(room_id: str):
+    room, _ = await store.get(ROOMS, room_id)
+    return room
 
-def get_room_info(room_id: str):
-    return rooms.get(room_id)
 
-def leave_room(room_id: str, username: str):
+async def leave_room(room_id: str, username: str):
     """
     从指定房间中移除某个用户。
     """
-    if room_id not in rooms:
-        return False, "房间不存在"
-    if username in rooms[room_id]["users"]:
-        del rooms[room_id]["users"][username]
-    return True, "退出房间成功"
+    def mutate(room):
+        if room is None:
+            return False, "房间不存在", None
+        room["users"].pop(username, None)
+        return True, "退出房间成功", room
+    success, msg, room = await store.update(ROOMS, room_id, mutate)
+    _track(room_id, room)
+    return success, msg
+
+
+async def set_playing(room_id: str, playing: bool):
+    """游戏模块在开局、结算和回收对局时调用，大厅不显示有进行中对局的房间"""
+    def mutate(room):
+        if room is not None:
+            room["playing"] = playing
+        return room
+    room = await store.update(ROOMS, room_id, mutate)
+    if room is not None:
+        _track(room_id, room)
+
+
+async def delete_room(room_id: str):
+    """删除房间，返回房间此前是否存在"""
+    existed = await get_room_info(room_id) is not None
+    await store.delete(ROOMS, room_id)
+    _track(room_id, None)
+    return existed
+
+
+async def _inspect_room(room_id: str):
+    room, version = await store.get(ROOMS, room_id)
+    if room is None:
+        return None
+    return version, _room_ttl(room)
+
+
+async def _reclaim_room(room_id: str):
+    await delete_room(room_id)
+    room_hub.close_room(room_id, ROOM_EXPIRED_CLOSE_CODE)
+
+
+lifecycle.register("room", _inspect_room, _reclaim_room)
+register_remote("directory", _apply_remote)
@@ -1,46 +1,93 @@
 # app/room_ws.py
 import json
+import time
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from app.room_manager import set_ready, all_ready, get_room_info
+from app.room_manager import set_ready
+from app.ws_hub import room_hub, dumps
+from app.metrics import WS_ACTION_SECONDS, WS_MESSAGE_BYTES
+from app.admission import admission
+from app.auth import connection_token, check_user, websocket_token_rejected, AUTH_CLOSE_CODE
+from app import wire
 
 router = APIRouter()
 
-# 保存各个房间的 WebSocket 连接
-room_connections = {}
+
+def _encoder(message: dict, binary_message):
+    """按协议编码的广播消息；binary_message 为生成二进制帧的无参函数"""
+    return lambda protocol: binary_message() if protocol == wire.PROTOCOL_BINARY else dumps(message)
+
+
+def _send_error(conn, detail: str):
+    room_hub.send(conn, _encoder({"action": "error", "detail": detail}, lambda: wire.error(detail))(conn.protocol))
+
 
 @router.websocket("/ws/room/{room_id}")
 async def room_websocket(websocket: WebSocket, room_id: str):
+    """
+    房间 WebSocket；?protocol=binary&version=1 选择二进制协议（见 app/wire.py），连接后先收到 HELLO。
+    携带 ?token= 时消息中的 username 必须与令牌一致（见 app/auth.py）；消息先经过准入控制（见 app/admission.py）。
+    """
+    token = connection_token(websocket)
+    if websocket_token_rejected(token):
+        await websocket.close(code=AUTH_CLOSE_CODE)
+        return
     await websocket.accept()
-    if room_id not in room_connections:
-        room_connections[room_id] = []
-    room_connections[room_id].append(websocket)
+    protocol, version = wire.negotiate(websocket.query_params, (wire.PROTOCOL_BINARY,), "legacy")
+    # 连接登记到广播中心，发送统一经由连接自己的发送队列
+    conn = room_hub.register(room_id, websocket, protocol)
+    limiter = admission.open("room", room_id)
+    if protocol == wire.PROTOCOL_BINARY:
+        room_hub.send(conn, wire.hello(version))
     try:
-        while True:
-            data = await websocket.receive_text()
-            print("Received WebSocket data:", data)
+        # 连接被广播中心关闭（慢客户端、房间被回收或删除）后退出循环
+        while not conn.closed:
+            data = await wire.receive(websocket)
+            if conn.closed:
+                break
+            started = time.perf_counter()
+            WS_MESSAGE_BYTES.observe(wire.frame_size(data), "room", "in")
+            rejected = admission.admit(limiter, data)
+            if rejected is not None:
+                close_code = admission.close_code(limiter, rejected)
+                if close_code is not None:
+                    room_hub.close(conn, close_code)
+                    break
+                if admission.notify(limiter):
+                    _send_error(conn, "操作过于频繁，请稍后再试")
+                continue
             try:
-                message = json.loads(data)
+                message = wire.decode_client(data) if isinstance(data, bytes) else json.loads(data)
             except Exception:
                 continue
+            if not isinstance(message, dict):
+                continue
             action = message.get("action")
-            username = message.get("username")
+            username, denied = check_user(token, message.get("username"))
+            if denied is not None:
+                _send_error(conn, denied[1])
+                continue
             if action == "ready":
-                success, msg = set_ready(room_id, username)
+                success, msg, room = await set_ready(room_id, username)
                 if not success:
-                    await websocket.send_text(json.dumps({"action": "error", "detail": msg}))
-                    continue
-                # 广播最新房间状态
-                room = get_room_info(room_id)
-                broadcast_data = json.dumps({"action": "update_room", "room": room})
-                for conn in room_connections.get(room_id, []):
-                    await conn.send_text(broadcast_data)
-                if all_ready(room_id):
-                    start_data = json.dumps({"action": "game_start", "room_id": room_id})
-                    for conn in room_connections.get(room_id, []):
-                        await conn.send_text(start_data)
+                    _send_error(conn, msg)
+                else:
+                    # 广播最新房间状态
+                    room_hub.broadcast(room_id, _encoder({"action": "update_room", "room": room}, lambda: wire.room_update(room["users"])))
+                    if all(room["users"].values()):
+                        room_hub.broadcast(room_id, _encoder({"action": "game_start", "room_id": room_id}, wire.game_start))
+            elif admission.shed(limiter):
+                # 过载时先丢弃聊天回显和未知消息，保证准备等关键操作
+                action = "shed"
+            elif conn.protocol == wire.PROTOCOL_BINARY:
+                action = "unknown"
+                room_hub.send(conn, wire.error("Unknown action"))
             else:
                 # 处理其他类型消息（例如聊天等）
-                await websocket.send_text(json.dumps({"action": "echo", "data": message}))
+                action = "echo"
+                room_hub.send(conn, dumps({"action": "echo", "data": message}))
+            WS_ACTION_SECONDS.observe(time.perf_counter() - started, "room", action)
     except WebSocketDisconnect:
-        print("WebSocket disconnected for room:", room_id)
-        room_connections[room_id].remove(websocket)
+        pass
+    finally:
+        room_hub.unregister(conn)
+        admission.close(limiter)
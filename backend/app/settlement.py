@@ -0,0 +1,393 @@
+# app/settlement.py
+"""
+对局结算。两种模式（配置 settlement.mode）：
+  - sync: 对局结束时在单个事务中写入数据库，写入完成后才广播结算结果（默认）
+  - write_behind: 结算先追加到本地结算日志（同一轮内的追加共用一次 fsync），落盘后即可广播；
+    后台任务每隔 flush_interval 把日志中的结算合并成大批量事务写入数据库。
+    启动时重放日志中尚未写入的条目，按对局（房间号 + 对局时间）在 applied_settlements 中去重，保证幂等。
+    每批写入后压缩日志（只保留尚未写入的条目），日志大小和崩溃后的重放时间只与积压的结算数有关；
+    applied_settlements 中超过 applied_retention 秒的记录会被定期删除。
+    该模式下积分、排行榜和用户统计会比对局结束晚最多约 flush_interval 秒更新。
+结算日志属于单个进程，多 worker 部署时每个 worker 需要配置不同的 journal_path。
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from sqlalchemy import select, update, insert, delete
+from app.config import get_section
+from app.database import database
+from app.models import users, game_records, game_sessions, user_stats, applied_settlements
+from app.user_manager import points_changed
+from app.user_stats import settlement_update
+
+SETTLEMENT_CONFIG = get_section("settlement", {
+    "mode": "sync",                          # sync 或 write_behind
+    "journal_path": "./settlement.journal",  # write-behind 模式的结算日志文件
+    "flush_interval": 0.2,                   # 后台写入数据库的间隔（秒）
+    "batch_size": 500,                       # 每个事务最多写入的对局数
+    "fsync": True,                           # 追加后是否 fsync（关闭后进程崩溃不丢失，但断电可能丢失）
+    "max_attempts": 5,                       # 单条结算写入失败多少次后移入 .rejected 文件
+    "applied_retention": 86400,              # applied_settlements 去重记录的保留时间（秒，按对局时间计算）
+})
+
+logger = logging.getLogger(__name__)
+
+# 清理 applied_settlements 的间隔（秒）
+_PRUNE_INTERVAL = 3600
+
+# 每条多行 INSERT 最多写入的对局记录数，避免超出 SQLite 单条语句的参数个数上限
+_INSERT_CHUNK = 500
+
+
+def result_label(score_change: int) -> str:
+    """根据得分变化返回对局结果标签"""
+    if score_change > 0:
+        return "win"
+    if score_change < 0:
+        return "loss"
+    return "draw"
+
+
+def settlement_key(room_id: str, game_time) -> str:
+    """一局对局的唯一标识，重放结算日志时用于去重"""
+    return f"{room_id}@{game_time.isoformat()}"
+
+
+async def settle_game(room_id: str, game_time, results: dict):
+    """
+    结算一局游戏。results 格式: { username: score_change }
+    sync 模式下写入数据库并返回 session_id；write_behind 模式下结算日志落盘后返回 None。
+    """
+    entry = {"room_id": room_id, "game_time": game_time, "results": results}
+    if journal.enabled:
+        await journal.append(entry)
+        return None
+    async with database.transaction():
+        session_ids = await apply_settlements([entry])
+    after_commit([entry])
+    return session_ids[0]
+
+
+async def apply_settlements(entries, record_keys: bool = False):
+    """
+    在调用方的事务中写入一批对局结算，往返次数与对局数、玩家人数无关：
+      1. 写入对局 session 并获取 session_id（多局时用一条多行 INSERT ... RETURNING）
+      2. 用一条 IN 查询取出所有玩家的 id（同时查出哪些玩家还没有统计行）
+      3. 按每个玩家在这批对局中的累计得分变化分组，以 points = points + :delta 的相对更新修改积分
+      4. 用多行 INSERT 写入所有对局记录
+      5. 补建缺少的统计行，再按对局顺序、按结果分组相对更新 user_stats（保证连胜计算正确）
+    record_keys 为 True 时同时登记到 applied_settlements。
+    entries 格式: [{ "room_id", "game_time", "results" }]，返回与之对应的 session_id 列表
+    """
+    sessions = [
+        {"room_id": entry["room_id"], "game_time": entry["game_time"], "players": ",".join(entry["results"])}
+        for entry in entries
+    ]
+    if len(sessions) == 1:
+        session_ids = [await database.execute(insert(game_sessions).values(sessions[0]))]
+    else:
+        # RETURNING 的行顺序不保证与 VALUES 一致；同一房间可能有多局，按（房间号, 对局时间）对应
+        inserted = await database.fetch_all(
+            insert(game_sessions).values(sessions).returning(
+                game_sessions.c.id, game_sessions.c.room_id, game_sessions.c.game_time
+            )
+        )
+        id_by_game = {(row["room_id"], row["game_time"]): row["id"] for row in inserted}
+        session_ids = [id_by_game[(session["room_id"], session["game_time"])] for session in sessions]
+
+    players = {player for entry in entries for player in entry["results"]}
+    query = (
+        select(users.c.id, users.c.username, user_stats.c.user_id.label("stats_id"))
+        .select_from(users.outerjoin(user_stats, user_stats.c.user_id == users.c.id))
+        .where(users.c.username.in_(players))
+    )
+    rows = await database.fetch_all(query)
+    user_ids = {row["username"]: row["id"] for row in rows}
+    missing_stats = [{"user_id": row["id"]} for row in rows if row["stats_id"] is None]
+
+    total_deltas = {}  # 格式: { user_id: 累计得分变化 }
+    stats_updates = []  # 按对局顺序: [(label, [user_id, ...], game_time)]
+    records = []
+    for entry, session_id in zip(entries, session_ids):
+        results = entry["results"]
+        ids_by_label = {}
+        for player, score_change in results.items():
+            user_id = user_ids.get(player)
+            if user_id is None:
+                continue
+            total_deltas[user_id] = total_deltas.get(user_id, 0) + score_change
+            ids_by_label.setdefault(result_label(score_change), []).append(user_id)
+            records.append({
+                "user_id": user_id,
+                "session_id": session_id,
+                "game_time": entry["game_time"],
+                "room_id": entry["room_id"],
+                "opponents": ",".join(p for p in results if p != player),
+                "result": result_label(score_change),
+                "score_change": score_change
+            })
+        stats_updates.extend((label, ids, entry["game_time"]) for label, ids in ids_by_label.items())
+
+    ids_by_delta = {}
+    for user_id, delta in total_deltas.items():
+        if delta:
+            ids_by_delta.setdefault(delta, []).append(user_id)
+    for delta, ids in ids_by_delta.items():
+        upd = update(users).where(users.c.id.in_(ids)).values(points=users.c.points + delta)
+        await database.execute(upd)
+    for start in range(0, len(records), _INSERT_CHUNK):
+        await database.execute(insert(game_records).values(records[start:start + _INSERT_CHUNK]))
+    if missing_stats:
+        await database.execute(insert(user_stats).values(missing_stats))
+    for label, ids, game_time in stats_updates:
+        await database.execute(settlement_update(label, ids, game_time))
+    if record_keys:
+        await database.execute(insert(applied_settlements).values([
+            {"key": settlement_key(entry["room_id"], entry["game_time"]), "session_id": session_id}
+            for entry, session_id in zip(entries, session_ids)
+        ]))
+    return session_ids
+
+
+def after_commit(entries):
+    """结算提交后：使积分缓存失效并增量更新排行榜（同时通知其他 worker）"""
+    deltas = {}
+    for entry in entries:
+        for player, score_change in entry["results"].items():
+            deltas[player] = deltas.get(player, 0) + score_change
+    points_changed(deltas)
+
+
+class SettlementJournal:
+    """write-behind 模式的结算日志：每行一条 JSON 结算，写入数据库后压缩"""
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.enabled = config["mode"] == "write_behind"
+        self.path = Path(config["journal_path"])
+        self._file = None
+        self._pending = []  # 已追加到日志、尚未写入数据库的结算，保持追加顺序
+        self._applied = 0  # 上次压缩后已写入数据库（或移入 .rejected）、仍留在日志文件中的条数
+        self._retired = []  # 压缩后被替换、等待 fsync 结束后关闭的旧日志文件
+        self._next_prune = 0.0  # 下次清理 applied_settlements 的时间（time.monotonic）
+        self._attempts = {}  # 格式: { key: 单独写入失败次数 }
+        self._next_sync = None  # 下一轮 fsync 完成时结束的 future，同一轮内的追加共用
+        self._sync_task = None
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    # ---------- 追加 ----------
+
+    @staticmethod
+    def _line(entry: dict) -> str:
+        return json.dumps({
+            "key": settlement_key(entry["room_id"], entry["game_time"]),
+            "room_id": entry["room_id"],
+            "game_time": entry["game_time"].isoformat(),
+            "results": entry["results"],
+        }, ensure_ascii=False) + "\n"
+
+    async def append(self, entry: dict):
+        """追加一条结算，返回时已落盘"""
+        self._file.write(self._line(entry))
+        self._pending.append(entry)
+        await self._durable()
+
+    async def _durable(self):
+        if self._next_sync is None:
+            self._next_sync = asyncio.get_running_loop().create_future()
+            if self._sync_task is None:
+                self._sync_task = asyncio.create_task(self._sync_loop())
+        await asyncio.shield(self._next_sync)
+
+    async def _sync_loop(self):
+        # fsync 期间到达的追加等待下一轮，每轮只调用一次 fsync
+        try:
+            while self._next_sync is not None:
+                waiter, self._next_sync = self._next_sync, None
+                try:
+                    self._file.flush()
+                    if self.config["fsync"]:
+                        await asyncio.to_thread(os.fsync, self._file.fileno())
+                except Exception as e:
+                    waiter.set_exception(e)
+                else:
+                    waiter.set_result(None)
+        finally:
+            self._sync_task = None
+            for file in self._retired:
+                file.close()
+            self._retired.clear()
+
+    # ---------- 写入数据库 ----------
+
+    async def _apply(self, entries):
+        """在一个事务中写入一批结算，跳过已写入过的对局"""
+        keys = [settlement_key(entry["room_id"], entry["game_time"]) for entry in entries]
+        async with database.transaction():
+            rows = await database.fetch_all(
+                select(applied_settlements.c.key).where(applied_settlements.c.key.in_(keys))
+            )
+            done = {row["key"] for row in rows}
+            fresh = []
+            for entry, key in zip(entries, keys):
+                if key not in done:
+                    done.add(key)
+                    fresh.append(entry)
+            if fresh:
+                await apply_settlements(fresh, record_keys=True)
+        after_commit(fresh)
+
+    def _reject(self, entry: dict, error: Exception):
+        """多次写入失败的结算移入 .rejected 文件，避免阻塞后续结算"""
+        logger.error("房间 %s 的结算多次写入失败，已移入 rejected 文件: %s", entry["room_id"], error)
+        with open(self.path.with_name(self.path.name + ".rejected"), "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "room_id": entry["room_id"],
+                "game_time": entry["game_time"].isoformat(),
+                "results": entry["results"],
+                "error": str(error),
+            }, ensure_ascii=False) + "\n")
+
+    async def flush(self):
+        """把日志中的结算分批写入数据库，每批写入后压缩日志；返回写入（含跳过）的条数"""
+        async with self._flush_lock:
+            flushed = 0
+            while self._pending:
+                batch = self._pending[:self.config["batch_size"]]
+                try:
+                    await self._apply(batch)
+                except Exception:
+                    # 整批失败时逐条写入，找出有问题的结算；数据库暂时不可用时保留顺序，下次再试
+                    done = await self._apply_one_by_one(batch)
+                else:
+                    del self._pending[:len(batch)]
+                    self._applied += len(batch)
+                    done = True
+                self._compact()
+                if not done:
+                    break
+                flushed += len(batch)
+            return flushed
+
+    def _compact(self):
+        """
+        从日志文件中去掉已写入数据库的条目。重写的代价与剩余条数成正比，因此只在已写入的条数
+        不少于剩余条数时重写（均摊到每条结算是常数），日志文件最多约为积压条数的两倍。
+        判断、重写与替换之间没有 await，期间不会有新的追加。
+        """
+        if self._file is None or not self._applied or self._applied < len(self._pending):
+            return
+        if not self._pending:
+            self._file.truncate(0)
+        else:
+            # 先写好新文件并落盘，再原子替换：任何时刻崩溃，日志中都保留着全部未写入的条目
+            temp = self.path.with_name(self.path.name + ".tmp")
+            with open(temp, "w", encoding="utf-8") as f:
+                f.writelines(self._line(entry) for entry in self._pending)
+                f.flush()
+                if self.config["fsync"]:
+                    os.fsync(f.fileno())
+            os.replace(temp, self.path)
+            # 旧文件可能正在另一个线程中 fsync，等 _sync_loop 结束后再关闭
+            if self._sync_task is None:
+                self._file.close()
+            else:
+                self._retired.append(self._file)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._applied = 0
+
+    async def prune(self):
+        """删除对局时间超过 applied_retention 的去重记录；日志每批写入后都会压缩，这些对局不会再被重放"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.config["applied_retention"])
+        expired = (
+            select(applied_settlements.c.key)
+            .select_from(applied_settlements.join(game_sessions, game_sessions.c.id == applied_settlements.c.session_id))
+            .where(game_sessions.c.game_time < cutoff)
+        )
+        await database.execute(delete(applied_settlements).where(applied_settlements.c.key.in_(expired)))
+
+    async def _apply_one_by_one(self, batch) -> bool:
+        for entry in batch:
+            key = settlement_key(entry["room_id"], entry["game_time"])
+            try:
+                await self._apply([entry])
+            except Exception as e:
+                self._attempts[key] = self._attempts.get(key, 0) + 1
+                if self._attempts[key] < self.config["max_attempts"]:
+                    return False
+                self._reject(entry, e)
+            self._attempts.pop(key, None)
+            del self._pending[0]
+            self._applied += 1
+        return True
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.config["flush_interval"])
+            try:
+                await self.flush()
+                if time.monotonic() >= self._next_prune:
+                    await self.prune()
+                    self._next_prune = time.monotonic() + _PRUNE_INTERVAL
+            except Exception:
+                logger.exception("结算日志写入数据库失败")
+
+    # ---------- 启动与关闭 ----------
+
+    def _read(self):
+        """读取日志中的全部条目；进程崩溃时最后一行可能只写了一半，忽略"""
+        entries = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.read().split("\n")
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                if number < len(lines):
+                    logger.warning("结算日志第 %d 行无法解析，已跳过", number)
+                continue
+            entries.append({
+                "room_id": data["room_id"],
+                "game_time": datetime.fromisoformat(data["game_time"]),
+                "results": data["results"],
+            })
+        return entries
+
+    async def start(self):
+        """重放上次未写入数据库的结算，然后启动后台写入任务"""
+        if not self.enabled:
+            return
+        if self.path.exists():
+            self._pending = self._read() + self._pending
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._pending:
+            logger.info("重放结算日志: %d 条", len(self._pending))
+            await self.flush()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并写入剩余结算（需在断开数据库之前调用）"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._file is not None:
+            await self.flush()
+            if self._sync_task is not None:
+                await self._sync_task
+            self._file.close()
+            self._file = None
+
+
+# 全局结算日志实例
+journal = SettlementJournal(SETTLEMENT_CONFIG)
@@ -0,0 +1,143 @@
+# app/simulator.py
+"""
+poker_battle 无界面批量模拟器（需要 numpy，见 requirements-dev.txt）：
+  - 批量为每局每位玩家发出互不相同的随机牌（与洗牌后依次摸牌的分布一致）
+  - 用向量化的权重比较排名，按 scoring 计算得分
+  - 输出 2 人 / 3 人桌各座位的胜 / 平 / 负率以及积分漂移
+权重表、名次得分和同权重时的排序规则都直接复用 poker_battle 中 finish_game 使用的函数，
+用于在上线前检查 suit_order、card_value_order、scoring 等配置改动。
+
+用法: python -m app.simulator --rounds 1000000 --players 2 3 [--config 新配置.json] [--seed 42]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:  # numpy 只是模拟器的依赖，服务端本身不需要
+    np = None
+
+from app.game_modes.cards import DECK_SIZE, build_weight_table
+from app.game_manager import game_manager
+from app.game_modes.poker_battle import compute_results, rank_scores
+
+# 缺少 numpy 时的提示
+_NUMPY_MISSING = "模拟器需要 numpy，请先安装: pip install -r requirements-dev.txt"
+
+# 每批模拟的局数，控制内存占用
+CHUNK_SIZE = 1_000_000
+
+
+def deal(rng, rounds: int, players: int):
+    """
+    为每局发出 players 张互不相同的牌，返回形状为 (rounds, players) 的整数牌数组。
+    第 k 张牌在剩余 52 - k 张中均匀抽取，再跳过已发出的牌，等价于洗牌后依次摸牌。
+    """
+    cards = np.empty((rounds, players), dtype=np.int16)
+    for k in range(players):
+        drawn = rng.integers(0, DECK_SIZE - k, size=rounds, dtype=np.int16)
+        if k:
+            # 按从小到大的顺序跳过已发出的牌
+            for taken in np.sort(cards[:, :k], axis=1).T:
+                drawn += drawn >= taken
+        cards[:, k] = drawn
+    return cards
+
+
+def score_rounds(cards, weights, scores):
+    """向量化结算：返回形状为 (rounds, players) 的得分变化，与 compute_results 规则一致"""
+    weight_table = np.asarray(weights, dtype=np.int64)
+    # 稳定排序保证权重相同时按座位顺序排名，与 sorted(..., reverse=True) 一致
+    order = np.argsort(-weight_table[cards], axis=1, kind="stable")
+    result = np.empty(cards.shape, dtype=np.int64)
+    np.put_along_axis(result, order, np.asarray(scores, dtype=np.int64)[None, :], axis=1)
+    return result
+
+
+def check_against_rules(config, players: int, rng, samples: int = 2000):
+    """抽样对比向量化结算与 finish_game 使用的 compute_results，确保两者不会出现分歧"""
+    weights = build_weight_table(config)
+    scores = rank_scores(config, players)
+    cards = deal(rng, samples, players)
+    vectorized = score_rounds(cards, weights, scores)
+    seats = [f"p{i}" for i in range(players)]
+    for row, expected in zip(cards.tolist(), vectorized.tolist()):
+        results = compute_results(dict(zip(seats, row)), weights, scores)
+        if [results[seat] for seat in seats] != expected:
+            raise AssertionError(f"向量化结算与 finish_game 规则不一致: {row}")
+
+
+def simulate(config, players: int, rounds: int, seed: int = None):
+    """模拟 rounds 局 players 人桌，返回统计结果"""
+    if np is None:
+        raise RuntimeError(_NUMPY_MISSING)
+    rng = np.random.default_rng(seed)
+    check_against_rules(config, players, rng)
+    weights = build_weight_table(config)
+    scores = rank_scores(config, players)
+
+    wins = np.zeros(players, dtype=np.int64)
+    draws = np.zeros(players, dtype=np.int64)
+    losses = np.zeros(players, dtype=np.int64)
+    total = np.zeros(players, dtype=np.int64)
+    total_sq = np.zeros(players, dtype=np.int64)
+    started = time.perf_counter()
+    remaining = rounds
+    while remaining > 0:
+        size = min(CHUNK_SIZE, remaining)
+        result = score_rounds(deal(rng, size, players), weights, scores)
+        wins += (result > 0).sum(axis=0)
+        draws += (result == 0).sum(axis=0)
+        losses += (result < 0).sum(axis=0)
+        total += result.sum(axis=0)
+        total_sq += (result * result).sum(axis=0)
+        remaining -= size
+    elapsed = time.perf_counter() - started
+
+    mean = total / rounds
+    std = np.sqrt(np.maximum(total_sq / rounds - mean * mean, 0))
+    return {
+        "players": players,
+        "rounds": rounds,
+        "seats": [
+            {
+                "seat": seat,
+                "win_rate": wins[seat] / rounds,
+                "draw_rate": draws[seat] / rounds,
+                "loss_rate": losses[seat] / rounds,
+                # 每局平均积分变化（长期漂移）及其标准差
+                "drift_per_game": mean[seat],
+                "std_per_game": std[seat],
+            }
+            for seat in range(players)
+        ],
+        # 每局全桌积分变化之和，非 0 表示该计分规则会整体通胀 / 通缩
+        "inflation_per_game": float(total.sum() / rounds),
+        "rounds_per_second": rounds / elapsed if elapsed else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="poker_battle 批量模拟")
+    parser.add_argument("--rounds", type=int, default=1_000_000)
+    parser.add_argument("--players", type=int, nargs="+", default=[2, 3], choices=[2, 3])
+    parser.add_argument("--config", type=Path, help="待验证的模式配置文件，默认使用当前 poker_battle.json")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+    if np is None:
+        parser.exit(1, _NUMPY_MISSING + "\n")
+
+    config = game_manager.get_mode_config("poker_battle")
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    report = [simulate(config, players, args.rounds, args.seed) for players in args.players]
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2, default=float)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# app/state_store.py
+"""
+共享状态存储：房间和游戏状态统一通过 StateStore 读写，按 namespace + key 组织，每条记录带版本号。
+  - memory: 进程内字典，直接保存对象本身，只适用于单 worker
+  - sqlite: 基于 app/database.py 的 state_store 表，写入时做乐观版本校验，
+            多个 worker 进程可以共享同一批房间，进程重启后状态也不会丢失
+通过配置文件中的 "state_store": {"backend": "memory" | "sqlite"} 选择后端。
+"""
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+from sqlalchemy import select, update, insert, delete, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from app.config import get_section
+from app.database import database
+from app.models import state_store
+
+STATE_STORE_CONFIG = get_section("state_store", {"backend": "memory", "max_retries": 16})
+
+# 每条多行 INSERT 最多写入的记录数，避免超出 SQLite 单条语句的参数个数上限
+_INSERT_CHUNK = 500
+
+
+class VersionConflict(Exception):
+    """写入时记录的版本号已被其他进程修改"""
+
+
+class StateStore(ABC):
+    """状态存储后端的基类：后端需实现 get / put / delete / keys，缺少任何一个时无法实例化"""
+
+    def __init__(self):
+        self._codecs = {}
+
+    def register_codec(self, namespace: str, encode, decode):
+        """注册某个 namespace 的编解码函数（仅需要序列化的后端会用到）"""
+        self._codecs[namespace] = (encode, decode)
+
+    @abstractmethod
+    async def get(self, namespace: str, key: str):
+        """返回 (value, version)；记录不存在时返回 (None, 0)"""
+
+    @abstractmethod
+    async def put(self, namespace: str, key: str, value, expected_version: int) -> int:
+        """版本号等于 expected_version 时写入并返回新版本号，否则抛出 VersionConflict；expected_version 为 0 表示新建"""
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: str):
+        """删除记录；记录不存在时不做任何事"""
+
+    @abstractmethod
+    async def keys(self, namespace: str):
+        """namespace 中所有记录的 key 列表"""
+
+    async def count(self, namespace: str) -> int:
+        return len(await self.keys(namespace))
+
+    async def create_many(self, namespace: str, items: dict):
+        """批量新建记录（版本号为 1），格式: { key: value }；返回已存在而未写入的 key 集合"""
+        conflicts = set()
+        for key, value in items.items():
+            try:
+                await self.put(namespace, key, value, 0)
+            except VersionConflict:
+                conflicts.add(key)
+        return conflicts
+
+    async def update(self, namespace: str, key: str, mutate, retries: int = None):
+        """
+        读取-修改-写入：mutate(value) 原地修改 value 并返回结果，版本冲突时重新读取并重试。
+        记录不存在时以 None 调用 mutate 且不写入；mutate 抛出异常时同样不写入。
+        """
+        retries = STATE_STORE_CONFIG["max_retries"] if retries is None else retries
+        for _ in range(retries):
+            value, version = await self.get(namespace, key)
+            result = mutate(value)
+            if value is None:
+                return result
+            try:
+                await self.put(namespace, key, value, version)
+            except VersionConflict:
+                continue
+            return result
+        raise VersionConflict(f"{namespace}/{key} 写入冲突次数过多")
+
+
+class MemoryStateStore(StateStore):
+    def __init__(self):
+        super().__init__()
+        self._data = {}  # 格式: { namespace: { key: [value, version] } }
+
+    async def get(self, namespace, key):
+        entry = self._data.get(namespace, {}).get(key)
+        if entry is None:
+            return None, 0
+        return entry[0], entry[1]
+
+    async def put(self, namespace, key, value, expected_version):
+        entries = self._data.setdefault(namespace, {})
+        entry = entries.get(key)
+        current = 0 if entry is None else entry[1]
+        if current != expected_version:
+            raise VersionConflict(f"{namespace}/{key}")
+        entries[key] = [value, current + 1]
+        return current + 1
+
+    async def delete(self, namespace, key):
+        self._data.get(namespace, {}).pop(key, None)
+
+    async def keys(self, namespace):
+        return list(self._data.get(namespace, {}))
+
+    async def count(self, namespace):
+        return len(self._data.get(namespace, {}))
+
+
+class SQLiteStateStore(StateStore):
+    """
+    以 JSON 文本保存状态，各 namespace 通过 register_codec 注册编解码函数
+    （未注册时值本身需是可 JSON 序列化的字典）。
+    """
+
+    def _encode(self, namespace, value):
+        codec = self._codecs.get(namespace)
+        return json.dumps(codec[0](value) if codec else value, separators=(",", ":"))
+
+    def _decode(self, namespace, data):
+        value = json.loads(data)
+        codec = self._codecs.get(namespace)
+        return codec[1](value) if codec else value
+
+    async def get(self, namespace, key):
+        query = select(state_store.c.version, state_store.c.data).where(
+            state_store.c.namespace == namespace, state_store.c.key == key
+        )
+        row = await database.fetch_one(query)
+        if row is None:
+            return None, 0
+        return self._decode(namespace, row["data"]), row["version"]
+
+    async def put(self, namespace, key, value, expected_version):
+        data = self._encode(namespace, value)
+        if expected_version == 0:
+            try:
+                await database.execute(insert(state_store).values(namespace=namespace, key=key, version=1, data=data))
+            except (IntegrityError, sqlite3.IntegrityError):
+                raise VersionConflict(f"{namespace}/{key}")
+            return 1
+        # 只有版本号未变时才会更新成功，RETURNING 为空说明已被其他进程抢先写入
+        upd = (
+            update(state_store)
+            .where(
+                state_store.c.namespace == namespace,
+                state_store.c.key == key,
+                state_store.c.version == expected_version
+            )
+            .values(version=expected_version + 1, data=data)
+            .returning(state_store.c.version)
+        )
+        row = await database.fetch_one(upd)
+        if row is None:
+            raise VersionConflict(f"{namespace}/{key}")
+        return row["version"]
+
+    async def delete(self, namespace, key):
+        await database.execute(
+            delete(state_store).where(state_store.c.namespace == namespace, state_store.c.key == key)
+        )
+
+    async def keys(self, namespace):
+        query = select(state_store.c.key).where(state_store.c.namespace == namespace)
+        return [row["key"] for row in await database.fetch_all(query)]
+
+    async def count(self, namespace):
+        query = select(func.count()).select_from(state_store).where(state_store.c.namespace == namespace)
+        return await database.fetch_val(query)
+
+    async def create_many(self, namespace, items):
+        # 一条多行 INSERT ... ON CONFLICT DO NOTHING，RETURNING 只返回实际写入的 key
+        created = set()
+        rows = [
+            {"namespace": namespace, "key": key, "version": 1, "data": self._encode(namespace, value)}
+            for key, value in items.items()
+        ]
+        for start in range(0, len(rows), _INSERT_CHUNK):
+            stmt = (
+                sqlite_insert(state_store).values(rows[start:start + _INSERT_CHUNK])
+                .on_conflict_do_nothing().returning(state_store.c.key)
+            )
+            created.update(row["key"] for row in await database.fetch_all(stmt))
+        return set(items) - created
+
+
+def create_state_store(backend: str) -> StateStore:
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SQLiteStateStore()
+    raise ValueError(f"不支持的状态存储后端: {backend}")
+
+
+# 全局状态存储实例
+store = create_state_store(STATE_STORE_CONFIG["backend"])
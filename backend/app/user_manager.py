@@ -1,7 +1,82 @@
 # app/user_manager.py
-from sqlalchemy import select, insert
+import json
+import time
+from sqlalchemy import select, insert, update
 from app.database import database
 from app.models import users
+from app.leaderboard import leaderboard
+from app.auth import hash_password, verify_password, needs_rehash
+from app.pubsub import pubsub
+from app.ws_hub import register_remote
+
+# 进程内积分缓存：{ username: (points, 过期时间) }，points 为 None 表示该用户不存在
+_points_cache = {}
+_POINTS_CACHE_LIMIT = 100000
+# 多 worker 部署时，积分变化通过 "points:changed" 频道通知其他 worker 使缓存失效并更新排行榜；
+# broker 重连期间消息可能丢失，缓存条目最多保留 _POINTS_CACHE_TTL 秒
+_POINTS_CACHE_TTL = 30.0
+_POINTS_CHANNEL = "points:changed"
+# 每次失效时递增，用于丢弃失效前发起、失效后才返回的查询结果
+_cache_generation = 0
+
+
+def invalidate_points(usernames):
+    """积分或用户发生写入后调用，使对应缓存失效"""
+    global _cache_generation
+    _cache_generation += 1
+    for username in usernames:
+        _points_cache.pop(username, None)
+
+
+def points_changed(deltas: dict, registered=()):
+    """
+    本进程写入积分后调用（结算提交后，或注册了新用户后）：使积分缓存失效、更新排行榜，并通知其他 worker。
+    deltas 格式: { username: 积分变化 }，registered 为新注册的用户名（积分为 0）
+    """
+    _apply_points_change(deltas, registered)
+    if pubsub.enabled:
+        pubsub.publish(_POINTS_CHANNEL, {"change": json.dumps({"deltas": deltas, "registered": list(registered)})})
+
+
+def _apply_points_change(deltas: dict, registered):
+    invalidate_points([*deltas, *registered])
+    leaderboard.apply(deltas)
+    for username in registered:
+        leaderboard.set(username, 0)
+
+
+def _apply_remote(_, message: dict):
+    """其他 worker 发布的积分变化：只更新本进程，不再转发"""
+    change = json.loads(message["change"])
+    _apply_points_change(change["deltas"], change["registered"])
+
+
+async def get_users_points(usernames):
+    """
+    批量获取用户积分：命中缓存的直接返回，其余用户用一条 IN 查询一次取回。
+    返回 { username: points or None }
+    """
+    result = {}
+    missing = []
+    now = time.monotonic()
+    for username in usernames:
+        cached = _points_cache.get(username)
+        if cached is not None and cached[1] > now:
+            result[username] = cached[0]
+        else:
+            missing.append(username)
+    if missing:
+        generation = _cache_generation
+        query = select(users.c.username, users.c.points).where(users.c.username.in_(missing))
+        found = {row["username"]: row["points"] for row in await database.fetch_all(query)}
+        cacheable = generation == _cache_generation
+        if cacheable and len(_points_cache) + len(missing) > _POINTS_CACHE_LIMIT:
+            _points_cache.clear()
+        for username in missing:
+            result[username] = found.get(username)
+            if cacheable:
+                _points_cache[username] = (result[username], now + _POINTS_CACHE_TTL)
+    return result
 
 async def register_user(username: str, password: str):
     # 检查用户是否已存在
@@ -9,16 +84,25 @@ async def register_user(username: str, password: str):
     existing_user = await database.fetch_one(query)
     if existing_user:
         return False, "用户已存在"
-    # 插入新用户
-    query = insert(users).values(username=username, password=password)
+    # 插入新用户（只保存密码哈希）
+    query = insert(users).values(username=username, password=await hash_password(password))
     await database.execute(query)
+    points_changed({}, registered=[username])
     return True, "注册成功"
 
 async def login_user(username: str, password: str):
-    query = select(users).where(users.c.username == username)
+    query = select(users.c.id, users.c.password).where(users.c.username == username)
     user = await database.fetch_one(query)
     if not user:
         return False, "用户不存在"
-    if user["password"] != password:
+    if not await verify_password(password, user["password"]):
         return False, "密码错误"
+    if needs_rehash(user["password"]):
+        # 明文密码（或旧参数的哈希）在登录成功后升级
+        query = update(users).where(users.c.id == user["id"]).values(password=await hash_password(password))
+        await database.execute(query)
     return True, "登录成功"
+
+
+pubsub.subscribe(_POINTS_CHANNEL)
+register_remote("points", _apply_remote)
@@ -0,0 +1,112 @@
+# app/user_stats.py
+"""
+用户统计（user_stats 表）：
+  - 结算时与对局记录在同一事务中增量更新，按结果分组，每组一条 UPDATE
+  - 查询统计只需按用户查一行，与历史对局数量无关
+  - backfill 根据已有的 game_records 一次性重建统计（python -m app.user_stats）
+"""
+import asyncio
+from sqlalchemy import select, update, insert, delete, case, exists
+from app.database import database, read_database, connect, disconnect, create_tables
+from app.models import users, game_records, user_stats
+
+# 回填时每条多行 INSERT 写入的行数
+_BACKFILL_BATCH = 500
+
+
+def _streak_after(label: str, current_streak: int) -> int:
+    """本局结果之后的连续结果：连胜为正数、连败为负数、平局归零"""
+    if label == "win":
+        return current_streak + 1 if current_streak > 0 else 1
+    if label == "loss":
+        return current_streak - 1 if current_streak < 0 else -1
+    return 0
+
+
+def settlement_update(label: str, user_ids, game_time):
+    """结算时同一结果（win / loss / draw）的所有玩家共用的一条相对更新语句"""
+    c = user_stats.c
+    values = {"games": c.games + 1, "last_game_time": game_time}
+    if label == "win":
+        streak = case((c.current_streak > 0, c.current_streak + 1), else_=1)
+        values.update(
+            wins=c.wins + 1,
+            current_streak=streak,
+            best_streak=case((streak > c.best_streak, streak), else_=c.best_streak)
+        )
+    elif label == "loss":
+        values.update(losses=c.losses + 1, current_streak=case((c.current_streak < 0, c.current_streak - 1), else_=-1))
+    else:
+        values.update(draws=c.draws + 1, current_streak=0)
+    return update(user_stats).where(c.user_id.in_(user_ids)).values(**values)
+
+
+async def get_user_stats(username: str):
+    """按用户名读取统计（一次主键关联查询）；用户不存在时返回 None"""
+    query = (
+        select(
+            users.c.id, users.c.username, users.c.points,
+            user_stats.c.games, user_stats.c.wins, user_stats.c.losses, user_stats.c.draws,
+            user_stats.c.current_streak, user_stats.c.best_streak, user_stats.c.last_game_time
+        )
+        .select_from(users.outerjoin(user_stats, user_stats.c.user_id == users.c.id))
+        .where(users.c.username == username)
+    )
+    row = await read_database.fetch_one(query)
+    if row is None:
+        return None
+    stats = dict(row)
+    # 还没有结算过对局的用户没有统计行
+    for key in ("games", "wins", "losses", "draws", "current_streak", "best_streak"):
+        stats[key] = stats[key] or 0
+    stats["win_rate"] = stats["wins"] / stats["games"] if stats["games"] else 0.0
+    return stats
+
+
+async def backfill():
+    """根据 game_records 重建所有用户的统计，返回写入的行数"""
+    query = (
+        select(game_records.c.user_id, game_records.c.result, game_records.c.game_time)
+        .order_by(game_records.c.user_id, game_records.c.game_time, game_records.c.id)
+    )
+    rows = {}  # 格式: { user_id: 统计行 }，每个用户只保留一行汇总
+    async for record in database.iterate(query):
+        stats = rows.get(record["user_id"])
+        if stats is None:
+            stats = rows[record["user_id"]] = {
+                "user_id": record["user_id"], "games": 0, "wins": 0, "losses": 0, "draws": 0,
+                "current_streak": 0, "best_streak": 0, "last_game_time": None
+            }
+        label = record["result"]
+        stats["games"] += 1
+        stats[{"win": "wins", "loss": "losses"}.get(label, "draws")] += 1
+        stats["current_streak"] = _streak_after(label, stats["current_streak"])
+        stats["best_streak"] = max(stats["best_streak"], stats["current_streak"])
+        stats["last_game_time"] = record["game_time"]
+
+    values = list(rows.values())
+    async with database.transaction():
+        await database.execute(delete(user_stats))
+        for start in range(0, len(values), _BACKFILL_BATCH):
+            await database.execute(insert(user_stats).values(values[start:start + _BACKFILL_BATCH]))
+    return len(values)
+
+
+async def backfill_if_empty():
+    """user_stats 为空而已有对局记录时（例如刚升级到带统计表的版本）自动回填"""
+    has_stats = await database.fetch_val(select(exists().select_from(user_stats)))
+    if not has_stats and await database.fetch_val(select(exists().select_from(game_records))):
+        await backfill()
+
+
+async def _main():
+    await connect()
+    try:
+        await create_tables()
+        print("已回填用户统计:", await backfill())
+    finally:
+        await disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,215 @@
+# app/wire.py
+"""
+紧凑二进制 WebSocket 协议（连接时使用 ?protocol=binary&version=1 协商）：
+  - 每帧由固定 5 字节的帧头（消息类型 uint8 + 序号 uint32，大端）和消息体组成，通过 send_bytes 发送
+  - 牌使用 0~51 的整数编码，NO_CARD (255) 表示未出牌
+  - 玩家在快照中按入座顺序列出，之后的消息以 uint8 下标引用，不重复传输用户名
+  - 字符串为 uint16 长度 + UTF-8；已知的错误提示只发送 uint8 错误码（见 ERRORS），不再传输中文文本
+  - 连接建立后服务端先发送 HELLO，序号字段为协商后的版本号（不超过客户端请求版本的最高支持版本）
+游戏连接的语义与增量协议（delta）相同：加入时收到 SNAPSHOT，之后是带序号的 DRAW / PLAY / FINISH，
+序号断档（或在收到快照前就收到增量消息）时发送 SYNC 补发快照。
+同一时刻的多个操作会合并发送：一条 WebSocket 消息中可能依次包含多个帧（各帧的消息体长度均可自行确定），
+客户端应循环解析直到消息结束。
+客户端同样发送二进制帧（帧头 + 消息体，序号字段只有 SYNC 使用），也可以继续发送 JSON 文本。
+
+消息体（服务端 -> 客户端）：
+  HELLO        空
+  SNAPSHOT /   剩余张数 u8, 已结束 u8, 开局时间 f64 (Unix 秒), 玩家数 u8,
+  RESTART        每个玩家: 用户名 str, 状态位 u8 (1: 已摸牌, 2: 已出牌), 桌面牌 u8, 手牌数 u8, 手牌 u8 * n
+  DRAW         玩家 u8, 牌 u8, 剩余张数 u8, 状态位 u8
+  PLAY         玩家 u8, 牌 u8, 状态位 u8
+  FINISH       玩家数 u8, 每个玩家（入座顺序）: 桌面牌 u8, 得分 i16
+  SYNC         空（客户端状态已是最新）
+  ERROR        错误码 u8, 错误码为 0 时附带提示 str
+  ROOM_UPDATE  玩家数 u8, 每个玩家: 用户名 str, 已准备 u8
+  GAME_START   空
+消息体（客户端 -> 服务端）：
+  C_READY / C_DRAW  用户名 str
+  C_PLAY            用户名 str, 牌 u8
+  C_RESTART / C_FINISH 空；C_SYNC 使用帧头中的序号
+"""
+import struct
+from datetime import timezone
+from fastapi import WebSocket, WebSocketDisconnect
+
+PROTOCOL_BINARY = "binary"
+# 支持的二进制协议版本
+BINARY_VERSIONS = (1,)
+
+NO_CARD = 255
+
+# 服务端 -> 客户端
+HELLO = 0x00
+SNAPSHOT = 0x01
+DRAW = 0x02
+PLAY = 0x03
+FINISH = 0x04
+RESTART = 0x05
+SYNC = 0x06
+ERROR = 0x07
+ROOM_UPDATE = 0x10
+GAME_START = 0x11
+# 客户端 -> 服务端
+C_READY = 0x20
+C_DRAW = 0x21
+C_PLAY = 0x22
+C_RESTART = 0x23
+C_FINISH = 0x24
+C_SYNC = 0x25
+
+# 错误码：下标即错误码，只能在末尾追加（0 表示未登记的错误，附带文本）
+ERRORS = (
+    None,
+    "游戏状态未初始化",
+    "玩家不在本局游戏中",
+    "已摸牌，无法重复摸牌",
+    "牌堆为空",
+    "已出牌，无法重复出牌",
+    "该玩家没有这张牌",
+    "该局游戏已结束",
+    "并非所有玩家都已出牌",
+    "不支持该玩家数量",
+    "房间不存在",
+    "用户未在房间内",
+    "Unknown action",
+    "请先登录",
+    "登录已失效，请重新登录",
+    "无权以其他用户身份操作",
+    "操作过于频繁，请稍后再试",
+    "服务器内部错误，请稍后重试",
+)
+_ERROR_CODES = {detail: code for code, detail in enumerate(ERRORS) if detail}
+
+HEADER = struct.Struct("!BI")
+_U8 = struct.Struct("!B")
+_U16 = struct.Struct("!H")
+_SNAPSHOT_HEAD = struct.Struct("!BBdB")
+_DRAW = struct.Struct("!BBBB")
+_PLAY = struct.Struct("!BBB")
+_RESULT = struct.Struct("!Bh")
+_CLIENT_ACTIONS = {
+    C_READY: "ready", C_DRAW: "draw_card", C_PLAY: "play_card",
+    C_RESTART: "restart_game", C_FINISH: "finish_game", C_SYNC: "sync",
+}
+
+
+def negotiate(query_params, protocols, default: str):
+    """
+    根据连接的查询参数选择协议，返回 (协议, 二进制协议版本)；不支持的协议退回 default。
+    二进制协议选择不超过客户端请求版本的最高版本，客户端请求的版本都太低时给出最低版本，由客户端决定是否断开。
+    """
+    protocol = query_params.get("protocol")
+    if protocol not in protocols:
+        return default, None
+    if protocol != PROTOCOL_BINARY:
+        return protocol, None
+    try:
+        requested = int(query_params.get("version", BINARY_VERSIONS[-1]))
+    except ValueError:
+        requested = BINARY_VERSIONS[-1]
+    usable = [version for version in BINARY_VERSIONS if version <= requested]
+    return protocol, usable[-1] if usable else BINARY_VERSIONS[0]
+
+
+async def receive(websocket: WebSocket):
+    """接收一帧，文本帧返回 str，二进制帧返回 bytes"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    text = message.get("text")
+    return text if text is not None else message.get("bytes", b"")
+
+
+def frame_size(data) -> int:
+    """帧在线路上的字节数：文本帧按 UTF-8 编码后的长度计算（len(str) 是字符数，中文最多差 3 倍）"""
+    if isinstance(data, str) and not data.isascii():
+        return len(data.encode("utf-8"))
+    return len(data)
+
+
+# ---------- 编码 ----------
+
+def _str(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return _U16.pack(len(data)) + data
+
+
+def _flags(drawn: bool, played: bool) -> int:
+    return (1 if drawn else 0) | (2 if played else 0)
+
+
+def hello(version: int) -> bytes:
+    return HEADER.pack(HELLO, version)
+
+
+def snapshot(seq: int, deck_count: int, finished: bool, game_time, players, restart: bool = False) -> bytes:
+    """players: [(用户名, 已摸牌, 已出牌, 桌面牌或 None, 手牌整数列表), ...]，按入座顺序"""
+    parts = [
+        HEADER.pack(RESTART if restart else SNAPSHOT, seq),
+        _SNAPSHOT_HEAD.pack(deck_count, finished, game_time.replace(tzinfo=timezone.utc).timestamp(), len(players)),
+    ]
+    for username, drawn, played, table_card, hand in players:
+        parts.append(_str(username))
+        parts.append(bytes((_flags(drawn, played), NO_CARD if table_card is None else table_card, len(hand), *hand)))
+    return b"".join(parts)
+
+
+def draw(seq: int, player: int, card: int, deck_count: int, drawn: bool, played: bool) -> bytes:
+    return HEADER.pack(DRAW, seq) + _DRAW.pack(player, card, deck_count, _flags(drawn, played))
+
+
+def play(seq: int, player: int, card: int, drawn: bool, played: bool) -> bytes:
+    return HEADER.pack(PLAY, seq) + _PLAY.pack(player, card, _flags(drawn, played))
+
+
+def finish(seq: int, results) -> bytes:
+    """results: [(桌面牌, 得分), ...]，按入座顺序"""
+    return HEADER.pack(FINISH, seq) + _U8.pack(len(results)) + b"".join(_RESULT.pack(card, score) for card, score in results)
+
+
+def sync(seq: int) -> bytes:
+    return HEADER.pack(SYNC, seq)
+
+
+def error(detail: str) -> bytes:
+    code = _ERROR_CODES.get(detail, 0)
+    frame = HEADER.pack(ERROR, 0) + _U8.pack(code)
+    return frame + _str(detail) if code == 0 else frame
+
+
+def room_update(users: dict) -> bytes:
+    """users: { username: 是否已准备 }"""
+    parts = [HEADER.pack(ROOM_UPDATE, 0), _U8.pack(len(users))]
+    for username, ready in users.items():
+        parts.append(_str(username))
+        parts.append(_U8.pack(1 if ready else 0))
+    return b"".join(parts)
+
+
+def game_start() -> bytes:
+    return HEADER.pack(GAME_START, 0)
+
+
+# ---------- 解码客户端消息 ----------
+
+def decode_client(data: bytes) -> dict:
+    """把客户端二进制帧解码为与 JSON 协议相同形式的消息（牌为整数），格式不合法时抛出 ValueError"""
+    try:
+        kind, seq = HEADER.unpack_from(data)
+        action = _CLIENT_ACTIONS.get(kind)
+        if action is None:
+            return {"action": None}
+        message = {"action": action}
+        if kind == C_SYNC:
+            message["seq"] = seq
+        elif kind in (C_READY, C_DRAW, C_PLAY):
+            (length,) = _U16.unpack_from(data, HEADER.size)
+            offset = HEADER.size + _U16.size
+            if len(data) < offset + length:
+                raise ValueError("无效的二进制消息")
+            message["username"] = data[offset:offset + length].decode("utf-8")
+            if kind == C_PLAY:
+                message["card"] = data[offset + length]
+        return message
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ValueError("无效的二进制消息") from e
@@ -0,0 +1,207 @@
+# app/ws_hub.py
+"""
+WebSocket 广播中心：
+  - 每个连接拥有一个有界发送队列和独立的写协程，广播只是把消息放入各连接的队列，不等待网络发送
+  - 队列溢出（慢客户端）或发送失败（半断开的客户端）的连接会被自动移除并关闭
+  - 同一条广播按协议模式只编码一次；二进制协议（app/wire.py）的连接发送 bytes
+  - JSON 文本使用 orjson 编码，时间等非原生类型按 str() 输出
+  - 启用跨进程发布订阅时，广播同时发布到 "<hub 名称>:<room_id>" 频道，送达其他 worker 上的连接
+房间 WebSocket 和游戏 WebSocket 各使用一个 BroadcastHub 实例。
+"""
+import asyncio
+import time
+import orjson
+from fastapi import WebSocket
+from app.metrics import BROADCAST_SECONDS, JSON_ENCODE_SECONDS, WS_MESSAGE_BYTES
+from app.pubsub import pubsub
+from app.wire import frame_size
+
+# 每个连接最多积压的待发送消息数
+SEND_QUEUE_SIZE = 256
+# 慢客户端被移除时使用的关闭码（1013: Try Again Later）
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+def dumps(message) -> str:
+    """序列化要发送的消息，并记录序列化耗时"""
+    started = time.perf_counter()
+    # 时间交给 default=str 处理，与标准库 json.dumps(default=str) 的输出格式保持一致
+    text = orjson.dumps(message, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    JSON_ENCODE_SECONDS.observe(time.perf_counter() - started)
+    return text
+
+
+class Connection:
+    __slots__ = ("websocket", "room_id", "protocol", "queue", "writer", "closed")
+
+    def __init__(self, websocket: WebSocket, room_id: str, protocol: str, queue_size: int):
+        self.websocket = websocket
+        self.room_id = room_id
+        self.protocol = protocol
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.writer = None
+        self.closed = False
+
+
+class BroadcastHub:
+    def __init__(self, name: str, protocols=("legacy",), queue_size: int = SEND_QUEUE_SIZE, local_only: bool = False):
+        self.name = name
+        # 该 hub 上可能出现的全部协议；跨进程发布时需要为每种协议各编码一份
+        self.protocols = tuple(protocols)
+        self.queue_size = queue_size
+        # 为 True 时既不订阅也不发布跨进程频道，广播只送达本进程内的连接
+        self.local_only = local_only
+        self.rooms = {}  # 格式: { room_id: { Connection: None } }，字典保持加入顺序
+
+    def register(self, room_id: str, websocket: WebSocket, protocol: str = "legacy") -> Connection:
+        """登记一个已 accept 的连接，并启动它的写协程"""
+        conn = Connection(websocket, room_id, protocol, self.queue_size)
+        conn.writer = asyncio.create_task(self._writer(conn))
+        if room_id not in self.rooms:
+            self.rooms[room_id] = {}
+            if not self.local_only:
+                pubsub.subscribe(self._channel(room_id))
+        self.rooms[room_id][conn] = None
+        return conn
+
+    def unregister(self, conn: Connection):
+        """连接断开时调用（可重复调用）"""
+        self._drop(conn)
+
+    def connections(self, room_id: str):
+        return list(self.rooms.get(room_id, ()))
+
+    def connection_count(self, room_id: str = None) -> int:
+        if room_id is not None:
+            return len(self.rooms.get(room_id, ()))
+        return sum(len(conns) for conns in self.rooms.values())
+
+    def send(self, conn: Connection, payload) -> bool:
+        """把消息放入连接的发送队列；队列已满时移除该连接并返回 False"""
+        if conn.closed:
+            return False
+        try:
+            conn.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self._drop(conn, SLOW_CONSUMER_CLOSE_CODE)
+            return False
+        return True
+
+    def broadcast(self, room_id: str, message) -> int:
+        """
+        向房间内所有连接广播（包括其他 worker 上的连接），返回本进程内成功入队的连接数。
+        message 可以是已编码的 str / bytes，也可以是 encode(protocol) 函数；
+        后者对每种协议只调用一次。
+        """
+        started = time.perf_counter()
+        if pubsub.enabled and not self.local_only:
+            if callable(message):
+                encoded = {protocol: message(protocol) for protocol in self.protocols}
+                message = encoded.get
+            else:
+                encoded = {protocol: message for protocol in self.protocols}
+            pubsub.publish(self._channel(room_id), encoded)
+        sent = self.deliver_local(room_id, message)
+        BROADCAST_SECONDS.observe(time.perf_counter() - started, self.name)
+        return sent
+
+    def deliver_local(self, room_id: str, message) -> int:
+        """只投递给本进程内的连接"""
+        conns = self.rooms.get(room_id)
+        if not conns:
+            return 0
+        encoded = {}
+        sent = 0
+        for conn in list(conns):
+            if callable(message):
+                payload = encoded.get(conn.protocol)
+                if payload is None:
+                    payload = encoded[conn.protocol] = message(conn.protocol)
+            else:
+                payload = message
+            if self.send(conn, payload):
+                sent += 1
+        return sent
+
+    def close(self, conn: Connection, code: int = 1000):
+        """移除并关闭一个连接"""
+        self._drop(conn, code)
+
+    def close_room(self, room_id: str, code: int = 1000):
+        """关闭并移除房间内的所有连接"""
+        for conn in list(self.rooms.get(room_id, ())):
+            self._drop(conn, code)
+
+    def _channel(self, room_id: str) -> str:
+        return f"{self.name}:{room_id}"
+
+    async def _writer(self, conn: Connection):
+        websocket = conn.websocket
+        try:
+            while True:
+                payload = await conn.queue.get()
+                WS_MESSAGE_BYTES.observe(frame_size(payload), self.name, "out")
+                if isinstance(payload, bytes):
+                    await websocket.send_bytes(payload)
+                else:
+                    await websocket.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # 发送失败说明连接已不可用，移除即可，接收协程会随后收到断开事件
+            self._drop(conn)
+
+    def _drop(self, conn: Connection, close_code: int = None):
+        if conn.closed:
+            return
+        conn.closed = True
+        conns = self.rooms.get(conn.room_id)
+        if conns is not None:
+            conns.pop(conn, None)
+            if not conns:
+                del self.rooms[conn.room_id]
+                if not self.local_only:
+                    pubsub.unsubscribe(self._channel(conn.room_id))
+        if conn.writer is not None and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+        if close_code is not None:
+            task = asyncio.ensure_future(_close_quietly(conn.websocket, close_code))
+            _closing.add(task)
+            task.add_done_callback(_closing.discard)
+
+
+# 正在关闭的连接任务，保持引用直到关闭完成
+_closing = set()
+
+
+async def _close_quietly(websocket: WebSocket, code: int):
+    try:
+        await websocket.close(code=code)
+    except Exception:
+        pass
+
+
+# 房间（准备阶段）、游戏中和匹配队列中的连接分别使用独立的广播中心
+room_hub = BroadcastHub("room", protocols=("legacy", "binary"))
+game_hub = BroadcastHub("game", protocols=("legacy", "delta", "binary"))
+match_hub = BroadcastHub("match")
+# 大厅的推送由各 worker 根据（已同步的）房间目录各自生成，不订阅也不发布跨进程频道
+lobby_hub = BroadcastHub("lobby", local_only=True)
+HUBS = {hub.name: hub for hub in (room_hub, game_hub, match_hub, lobby_hub)}
+# 不对应连接的频道前缀（例如房间目录同步），格式: { 前缀: handler(频道其余部分, 消息) }
+_REMOTE_HANDLERS = {}
+
+
+def register_remote(prefix: str, handler):
+    """登记 "<prefix>:..." 频道的处理函数（频道仍需调用 pubsub.subscribe 订阅）"""
+    _REMOTE_HANDLERS[prefix] = handler
+
+
+def deliver_remote(channel: str, message: dict):
+    """pubsub 回调：把其他 worker 发布的消息投递给本进程内的连接"""
+    hub_name, room_id = channel.split(":", 1)
+    hub = HUBS.get(hub_name)
+    if hub is not None:
+        hub.deliver_local(room_id, message.get)
+    elif hub_name in _REMOTE_HANDLERS:
+        _REMOTE_HANDLERS[hub_name](room_id, message)
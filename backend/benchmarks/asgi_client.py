@@ -0,0 +1,126 @@
+# benchmarks/asgi_client.py
+"""
+进程内 ASGI 驱动：直接调用 FastAPI app，不经过网络和 uvicorn，
+用于压测时排除网络栈的干扰，只测量应用本身的开销。
+"""
+import asyncio
+import json
+
+
+class Lifespan:
+    """驱动 ASGI lifespan 协议，执行 app 的 startup / shutdown 事件"""
+
+    def __init__(self, app):
+        self.app = app
+        self._receive = asyncio.Queue()
+        self._send = asyncio.Queue()
+        self._task = None
+
+    async def __aenter__(self):
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._task = asyncio.create_task(self.app(scope, self._receive.get, self._send.put))
+        await self._receive.put({"type": "lifespan.startup"})
+        message = await self._send.get()
+        if message["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"应用启动失败: {message}")
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._receive.put({"type": "lifespan.shutdown"})
+        await self._send.get()
+        await self._task
+
+
+def _http_scope(method: str, path: str, query: str, headers):
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"bench"), *headers],
+        "client": ("127.0.0.1", 10000),
+        "server": ("bench", 80),
+    }
+
+
+async def http_request(app, method: str, path: str, payload=None, query: str = ""):
+    """发送一次 HTTP 请求，返回 (状态码, 解析后的 JSON 响应体)"""
+    body = b"" if payload is None else json.dumps(payload).encode()
+    headers = [(b"content-type", b"application/json")] if payload is not None else []
+    sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    status = None
+    chunks = []
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(_http_scope(method, path, query, headers), receive, send)
+    disconnected.set()
+    data = b"".join(chunks)
+    return status, json.loads(data) if data else None
+
+
+class WebSocketSession:
+    """进程内 WebSocket 会话"""
+
+    def __init__(self, app, path: str, query: str = ""):
+        self.app = app
+        scope = _http_scope("GET", path, query, [])
+        scope["type"] = "websocket"
+        scope["scheme"] = "ws"
+        scope["subprotocols"] = []
+        self.scope = scope
+        self._incoming = asyncio.Queue()
+        self._outgoing = asyncio.Queue()
+        self._task = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self.app(self.scope, self._incoming.get, self._outgoing.put))
+        await self._incoming.put({"type": "websocket.connect"})
+        message = await self._outgoing.get()
+        if message["type"] != "websocket.accept":
+            raise RuntimeError(f"WebSocket 连接被拒绝: {message}")
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._incoming.put({"type": "websocket.disconnect", "code": 1000})
+        await self._task
+
+    async def send_json(self, data):
+        await self._incoming.put({"type": "websocket.receive", "text": json.dumps(data)})
+
+    async def receive_json(self):
+        while True:
+            message = await self._outgoing.get()
+            if message["type"] == "websocket.close":
+                raise ConnectionError(f"WebSocket 已关闭: {message.get('code')}")
+            text = message.get("text")
+            if text is None:
+                return message.get("bytes")
+            return json.loads(text)
+
+    async def receive_until(self, predicate):
+        """丢弃不关心的消息，直到收到满足条件的一条"""
+        while True:
+            data = await self.receive_json()
+            if predicate(data):
+                return data
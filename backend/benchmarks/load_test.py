@@ -0,0 +1,194 @@
+# benchmarks/load_test.py
+"""
+进程内压测：用大量模拟玩家驱动真实的 FastAPI app，覆盖完整的房间与对局流程
+  注册 / 登录 -> /room/create -> /room/join -> /ws/room 准备 -> /game/start -> /ws/game 摸牌 / 出牌 / 结算
+输出每类操作的吞吐量与 p50 / p95 / p99 延迟，以及每局游戏的数据库查询次数。
+每次运行都在临时目录中使用全新的数据库，结果可复现。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.load_test --tables 200 --players 2 --concurrency 50
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+# 与 uvicorn 相同，以 backend 目录为导入根
+sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks.asgi_client import Lifespan, WebSocketSession, http_request  # noqa: E402
+
+# 统计数据库调用次数的方法
+DB_METHODS = ("fetch_one", "fetch_all", "fetch_val", "execute", "execute_many", "iterate")
+# 当前所处阶段（setup: 注册登录与房间准备；game: /game/start 到结算），数据库调用按阶段计数
+# 进程内调用 app 时上下文变量会随任务传递，因此 WebSocket 处理协程中的查询也能归到正确阶段
+_phase = contextvars.ContextVar("phase", default="setup")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # 格式: { 操作名: [秒, ...] }
+        self.db_calls = defaultdict(int)  # 格式: { 阶段: 次数 }
+
+    @contextlib.asynccontextmanager
+    async def measure(self, action: str):
+        started = time.perf_counter()
+        yield
+        self.latencies[action].append(time.perf_counter() - started)
+
+
+def count_db_calls(database, recorder: Recorder):
+    """包装 database 的查询方法，统计调用次数"""
+    for name in DB_METHODS:
+        original = getattr(database, name)
+        if name == "iterate":
+            def wrapper(*args, _original=original, **kwargs):
+                recorder.db_calls[_phase.get()] += 1
+                return _original(*args, **kwargs)
+        else:
+            async def wrapper(*args, _original=original, **kwargs):
+                recorder.db_calls[_phase.get()] += 1
+                return await _original(*args, **kwargs)
+        setattr(database, name, wrapper)
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def http(app, recorder, action, method, path, payload=None, query=""):
+    async with recorder.measure(action):
+        status, body = await http_request(app, method, path, payload, query)
+    if status != 200:
+        raise RuntimeError(f"{action} 失败: {status} {body}")
+    return body
+
+
+async def play_table(app, recorder: Recorder, table_no: int, players: int):
+    """模拟一桌玩家从注册到一局结算的完整流程"""
+    names = [f"bench_{table_no}_{i}" for i in range(players)]
+    for name in names:
+        await http(app, recorder, "register", "POST", "/register", {"username": name, "password": "pw"})
+        await http(app, recorder, "login", "POST", "/login", {"username": name, "password": "pw"})
+    room_id = (await http(app, recorder, "room_create", "POST", "/room/create", {"username": names[0]}))["room_id"]
+    for name in names[1:]:
+        await http(app, recorder, "room_join", "POST", "/room/join", {"room_id": room_id, "username": name})
+    await http(app, recorder, "room_info", "GET", "/room/info", query=f"room_id={room_id}")
+
+    async with contextlib.AsyncExitStack() as stack:
+        room_sockets = [await stack.enter_async_context(WebSocketSession(app, f"/ws/room/{room_id}")) for _ in names]
+        for name, ws in zip(names, room_sockets):
+            async with recorder.measure("ws_ready"):
+                await ws.send_json({"action": "ready", "username": name})
+                await ws.receive_until(lambda m: m.get("action") == "update_room")
+        for ws in room_sockets:
+            await ws.receive_until(lambda m: m.get("action") == "game_start")
+
+    _phase.set("game")
+    await http(app, recorder, "game_start", "POST", "/game/start", {"room_id": room_id, "mode": "poker_battle"})
+    async with contextlib.AsyncExitStack() as stack:
+        sockets = [await stack.enter_async_context(WebSocketSession(app, f"/ws/game/{room_id}")) for _ in names]
+        cards = {}
+        for name, ws in zip(names, sockets):
+            async with recorder.measure("ws_draw_card"):
+                await ws.send_json({"action": "draw_card", "username": name})
+                message = await ws.receive_until(lambda m: m.get("action") == "draw_card" and m.get("username") == name)
+            cards[name] = message["card"]
+        for name, ws in zip(names, sockets):
+            async with recorder.measure("ws_play_card"):
+                await ws.send_json({"action": "play_card", "username": name, "card": cards[name]})
+                await ws.receive_until(lambda m: m.get("action") == "play_card" and m.get("username") == name)
+        async with recorder.measure("ws_finish_game"):
+            for ws in sockets:
+                await ws.receive_until(lambda m: m.get("action") == "finish_game")
+
+
+async def run(tables: int, players: int, concurrency: int):
+    from app.main import app
+    from app.database import database
+
+    recorder = Recorder()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def guarded(table_no):
+        async with semaphore:
+            await play_table(app, recorder, table_no, players)
+
+    async with Lifespan(app):
+        count_db_calls(database, recorder)
+        started = time.perf_counter()
+        await asyncio.gather(*(guarded(i) for i in range(tables)))
+        elapsed = time.perf_counter() - started
+    return recorder, elapsed
+
+
+def report(recorder: Recorder, elapsed: float, tables: int, players: int) -> dict:
+    actions = {}
+    for action, values in recorder.latencies.items():
+        values.sort()
+        actions[action] = {
+            "count": len(values),
+            "throughput_per_s": len(values) / elapsed,
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+        }
+    return {
+        "tables": tables,
+        "players_per_table": players,
+        "elapsed_s": elapsed,
+        "games_per_s": tables / elapsed,
+        "db_queries_setup_per_table": recorder.db_calls["setup"] / tables,
+        "db_queries_per_game": recorder.db_calls["game"] / tables,
+        "actions": actions,
+    }
+
+
+def print_report(result: dict):
+    print(f"{result['tables']} 桌 x {result['players_per_table']} 人，用时 {result['elapsed_s']:.2f}s，"
+          f"{result['games_per_s']:.1f} 局/秒")
+    print(f"数据库查询：每局对局 {result['db_queries_per_game']:.1f} 次，每桌准备阶段 {result['db_queries_setup_per_table']:.1f} 次")
+    print(f"{'action':<16}{'count':>8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for action, stats in result["actions"].items():
+        print(f"{action:<16}{stats['count']:>8}{stats['throughput_per_s']:>10.1f}"
+              f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CardGame 进程内压测")
+    parser.add_argument("--tables", type=int, default=100, help="模拟的桌数（每桌一局）")
+    parser.add_argument("--players", type=int, default=2, choices=[2, 3], help="每桌玩家数")
+    parser.add_argument("--concurrency", type=int, default=20, help="同时进行的桌数")
+    parser.add_argument("--seed", type=int, default=0, help="房间号等随机数的种子")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    # 数据库地址是相对路径，切换到临时目录即可使用全新的数据库
+    os.chdir(tempfile.mkdtemp(prefix="cardgame-bench-"))
+    # 屏蔽业务代码中的 print，避免干扰输出
+    with contextlib.redirect_stdout(io.StringIO()):
+        recorder, elapsed = asyncio.run(run(args.tables, args.players, args.concurrency))
+    result = report(recorder, elapsed, args.tables, args.players)
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
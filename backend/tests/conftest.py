@@ -0,0 +1,49 @@
+# tests/conftest.py
+"""
+测试在临时目录中运行：配置中的 SQLite 文件、结算日志等相对路径都落在该目录下，不会修改 backend/test.db。
+必须在导入 app 之前切换目录。
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.chdir(tempfile.mkdtemp(prefix="cardgame-tests-"))
+
+from sqlalchemy import insert  # noqa: E402
+from app.database import connect, disconnect, create_tables, database, metadata  # noqa: E402
+from app.models import users  # noqa: E402
+from app import user_manager  # noqa: E402
+from app.leaderboard import leaderboard  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db():
+    """连接数据库并清空所有数据表，以及依赖数据表内容的进程内缓存"""
+    await connect()
+    await create_tables()
+    for table in reversed(metadata.sorted_tables):
+        await database.execute(table.delete())
+    user_manager._points_cache.clear()
+    leaderboard.rebuild([])
+    try:
+        yield database
+    finally:
+        await disconnect()
+
+
+async def add_users(*usernames, points: int = 0):
+    """直接写入测试用户，返回 { username: id }"""
+    ids = {}
+    for username in usernames:
+        ids[username] = await database.execute(
+            insert(users).values(username=username, password="x", points=points)
+        )
+    return ids
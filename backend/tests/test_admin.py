@@ -0,0 +1,54 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app.auth import AUTH_CONFIG, tokens
+from app.main import app
+from app.ws_hub import deliver_remote
+
+ROUTES = [
+    ("get", "/admin/rooms", {}),
+    ("get", "/admin/records", {}),
+    ("get", "/admin/records/export", {}),
+    ("get", "/admin/user", {"params": {"id": 1}}),
+    ("post", "/admin/room/delete", {"json": {"room_id": "NOPE"}}),
+]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setitem(AUTH_CONFIG, "admin_users", ["root"])
+    # 不触发启动事件：身份检查在访问数据库之前完成
+    return TestClient(app)
+
+
+def _headers(username):
+    return {"Authorization": f"Bearer {tokens.issue(username)[0]}"}
+
+
+@pytest.mark.parametrize("method, path, kwargs", ROUTES)
+def test_admin_routes_require_login(client, method, path, kwargs):
+    assert getattr(client, method)(path, **kwargs).status_code == 401
+    assert getattr(client, method)(path, headers={"Authorization": "Bearer forged"}, **kwargs).status_code == 401
+
+
+@pytest.mark.parametrize("method, path, kwargs", ROUTES)
+def test_admin_routes_require_admin_user(client, method, path, kwargs):
+    response = getattr(client, method)(path, headers=_headers("alice"), **kwargs)
+    assert response.status_code == 403
+
+
+def test_admin_user_is_allowed(client):
+    response = client.get("/admin/rooms", headers=_headers("root"))
+    assert response.status_code == 200
+    assert "rooms" in response.json()
+
+
+def test_rooms_include_other_workers(client):
+    entry = {"room_id": "REMOTE01", "mode": "poker_battle", "user_count": 1, "ready_count": 0}
+    deliver_remote("directory:rooms", {"entry": json.dumps(entry)})
+    try:
+        rooms = client.get("/admin/rooms", headers=_headers("root")).json()["rooms"]
+        assert entry in rooms
+    finally:
+        deliver_remote("directory:rooms", {"entry": json.dumps({"room_id": "REMOTE01"})})
+    assert entry not in client.get("/admin/rooms", headers=_headers("root")).json()["rooms"]
@@ -0,0 +1,102 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app.admission import (
+    ADMISSION_CONFIG, Admission, TokenBucket, TOO_BIG, CONNECTION_RATE, ROOM_RATE,
+    MESSAGE_TOO_BIG_CLOSE_CODE, RATE_LIMIT_CLOSE_CODE,
+)
+from app.auth import AUTH_CLOSE_CODE
+
+
+def _admission(**overrides):
+    return Admission({**ADMISSION_CONFIG, **overrides})
+
+
+def test_token_bucket_burst_and_refill():
+    bucket = TokenBucket(rate=10, burst=3)
+    now = bucket.updated
+    assert [bucket.take(now) for _ in range(4)] == [True, True, True, False]
+    # 0.1 秒补充 1 个令牌
+    assert bucket.take(now + 0.1)
+    assert not bucket.take(now + 0.1)
+    # 补充的令牌不超过 burst
+    assert [bucket.take(now + 100) for _ in range(4)] == [True, True, True, False]
+
+
+def test_oversized_message_is_rejected_and_closes():
+    admission = _admission(max_message_bytes=10)
+    limiter = admission.open("room", "R1")
+    assert admission.admit(limiter, "x" * 10) is None
+    assert admission.admit(limiter, "x" * 11) == TOO_BIG
+    assert admission.close_code(limiter, TOO_BIG) == MESSAGE_TOO_BIG_CLOSE_CODE
+
+
+def test_message_size_counts_utf8_bytes():
+    admission = _admission(max_message_bytes=10)
+    limiter = admission.open("room", "R1")
+    # 4 个中文字符是 12 个字节
+    assert admission.admit(limiter, "中文中文") == TOO_BIG
+    assert admission.admit(limiter, "中文") is None
+    assert admission.admit(limiter, "中文".encode("utf-8")) is None
+    assert admission.admit(limiter, b"x" * 11) == TOO_BIG
+
+
+def test_connection_rate_limit():
+    admission = _admission(connection_rate=0.001, connection_burst=2, max_violations=3)
+    limiter = admission.open("match")
+    assert admission.admit(limiter, "{}") is None
+    assert admission.admit(limiter, "{}") is None
+    reasons = [admission.admit(limiter, "{}") for _ in range(4)]
+    assert reasons == [CONNECTION_RATE] * 4
+    # 只回复第一次，超过 max_violations 后关闭连接
+    assert limiter.violations == 4
+    assert not admission.notify(limiter)
+    assert admission.close_code(limiter, CONNECTION_RATE) == RATE_LIMIT_CLOSE_CODE
+    # 限流关闭与令牌无效使用不同的关闭码，客户端不会因此重新登录
+    assert RATE_LIMIT_CLOSE_CODE != AUTH_CLOSE_CODE
+
+
+def test_room_rate_is_shared_and_released():
+    admission = _admission(connection_rate=1000, connection_burst=1000, room_rate=0.001, room_burst=3)
+    first = admission.open("game", "R1")
+    second = admission.open("game", "R1")
+    other_room = admission.open("game", "R2")
+    assert [admission.admit(first, "{}"), admission.admit(second, "{}"), admission.admit(first, "{}")] == [None] * 3
+    assert admission.admit(second, "{}") == ROOM_RATE
+    assert admission.admit(other_room, "{}") is None
+    # 房间内的连接全部断开后释放令牌桶，新连接重新获得完整的 burst
+    admission.close(first)
+    admission.close(second)
+    assert ("game", "R1") not in admission._rooms
+    assert admission.admit(admission.open("game", "R1"), "{}") is None
+
+
+def test_shed_only_when_overloaded():
+    admission = _admission()
+    limiter = admission.open("room", "R1")
+    assert not admission.shed(limiter)
+    admission.overloaded = True
+    assert admission.shed(limiter)
+
+
+@pytest.fixture
+def client():
+    from app.main import app
+    with TestClient(app) as client:
+        yield client
+
+
+def test_malformed_messages_do_not_kill_sockets(client):
+    for username in ("ma", "mb"):
+        client.post("/register", json={"username": username, "password": "pw"})
+    room_id = client.post("/room/create", json={"username": "ma"}).json()["room_id"]
+    with client.websocket_connect(f"/ws/room/{room_id}") as ws:
+        for data in ("[1, 2]", "3", "null", "not json"):
+            ws.send_text(data)
+        ws.send_json({"action": "ready", "username": "ma"})
+        assert ws.receive_json()["action"] == "update_room"
+    with client.websocket_connect("/ws/match") as ws:
+        ws.send_text("[1, 2]")
+        ws.send_bytes(b"\x00\x01")
+        ws.send_bytes(json.dumps({"action": "cancel"}).encode())
+        assert ws.receive_json() == {"action": "cancelled"}
@@ -0,0 +1,91 @@
+import pytest
+from app.auth import (
+    AUTH_CONFIG, SessionTokens, tokens, check_user, websocket_token_rejected, check_secret,
+    hash_password, verify_password, needs_rehash,
+)
+from app.pubsub import PUBSUB_CONFIG
+
+
+@pytest.fixture
+def require_token(monkeypatch):
+    monkeypatch.setitem(AUTH_CONFIG, "require_token", True)
+
+
+def test_token_round_trip():
+    token, expires = tokens.issue("alice")
+    assert tokens.resolve(token) == "alice"
+    # 不经过缓存时同样可以校验
+    assert SessionTokens(AUTH_CONFIG).resolve(token) == "alice"
+
+
+def test_tampered_token_is_rejected():
+    token, _ = tokens.issue("alice")
+    forged = SessionTokens(AUTH_CONFIG).issue("mallory")[0]
+    body = forged.rsplit(".", 1)[0]
+    assert tokens.resolve(body + "." + token.rsplit(".", 1)[1]) is None
+    assert tokens.resolve("not-a-token") is None
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    issuer = SessionTokens({**AUTH_CONFIG, "token_ttl": -1})
+    token, _ = issuer.issue("alice")
+    assert issuer.resolve(token) is None
+    assert tokens.resolve(token) is None
+
+
+def test_token_cache_is_bounded():
+    issuer = SessionTokens({**AUTH_CONFIG, "cache_size": 2})
+    issued = [issuer.issue(name)[0] for name in ("a", "b", "c")]
+    assert len(issuer) == 2
+    # 被挤出缓存的令牌仍可通过签名校验
+    assert issuer.resolve(issued[0]) == "a"
+
+
+def test_check_user_without_require_token():
+    token, _ = tokens.issue("alice")
+    assert check_user(None, "bob") == ("bob", None)
+    assert check_user(token, None) == ("alice", None)
+    assert check_user(token, "alice") == ("alice", None)
+    assert check_user(token, "bob") == (None, (403, "无权以其他用户身份操作"))
+    # 重启后密钥变化等原因无法验证的令牌按未携带处理
+    assert check_user("stale.token.value", "bob") == ("bob", None)
+    assert not websocket_token_rejected(None)
+    assert not websocket_token_rejected("stale.token.value")
+
+
+def test_check_user_with_require_token(require_token):
+    token, _ = tokens.issue("alice")
+    assert check_user(None, "bob") == (None, (401, "请先登录"))
+    assert check_user("stale.token.value", "bob") == (None, (401, "登录已失效，请重新登录"))
+    assert check_user(token, None) == ("alice", None)
+    assert websocket_token_rejected(None)
+    assert websocket_token_rejected("stale.token.value")
+    assert not websocket_token_rejected(token)
+
+
+def test_multi_worker_requires_secret(monkeypatch):
+    monkeypatch.setitem(AUTH_CONFIG, "secret", None)
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    check_secret()
+    monkeypatch.setenv("WEB_CONCURRENCY", "2")
+    with pytest.raises(RuntimeError):
+        check_secret()
+    monkeypatch.delenv("WEB_CONCURRENCY")
+    monkeypatch.setitem(PUBSUB_CONFIG, "backend", "sqlite")
+    with pytest.raises(RuntimeError):
+        check_secret()
+    monkeypatch.setitem(AUTH_CONFIG, "secret", "shared")
+    check_secret()
+
+
+@pytest.mark.anyio
+async def test_password_hashing(monkeypatch):
+    monkeypatch.setitem(AUTH_CONFIG, "pbkdf2_iterations", 1000)
+    stored = await hash_password("secret")
+    assert stored.startswith("pbkdf2_sha256$1000$")
+    assert await verify_password("secret", stored)
+    assert not await verify_password("wrong", stored)
+    assert not needs_rehash(stored)
+    # 升级前保存的明文密码仍可登录，登录后应重新哈希
+    assert await verify_password("plain", "plain")
+    assert needs_rehash("plain")
@@ -0,0 +1,68 @@
+import random
+import pytest
+from app.game_modes.cards import (
+    DECK_SIZE, RANKS, SUITS, Deck, Hand, build_weight_table, card_from_dict, card_to_dict,
+)
+
+
+def test_every_code_round_trips():
+    cards = [card_to_dict(code) for code in range(DECK_SIZE)]
+    assert [card_from_dict(card) for card in cards] == list(range(DECK_SIZE))
+    assert len({(card["suit"], card["rank"]) for card in cards}) == DECK_SIZE
+    assert card_to_dict(0) == {"suit": SUITS[0], "rank": RANKS[0]}
+    assert card_to_dict(DECK_SIZE - 1) == {"suit": SUITS[-1], "rank": RANKS[-1]}
+
+
+def test_suit_is_case_insensitive():
+    assert card_from_dict({"suit": "Hearts", "rank": "Q"}) == card_from_dict({"suit": "hearts", "rank": "Q"})
+    assert card_from_dict({"suit": "SPADES", "rank": "A"}) == SUITS.index("spades") * len(RANKS)
+
+
+@pytest.mark.parametrize("card", [
+    None, "AS", 5, {}, {"suit": "hearts"}, {"rank": "A"},
+    {"suit": "stars", "rank": "A"}, {"suit": "hearts", "rank": "1"}, {"suit": "hearts", "rank": "q"},
+])
+def test_invalid_cards_are_rejected(card):
+    assert card_from_dict(card) is None
+
+
+def test_deck_draws_in_iteration_order():
+    deck = Deck()
+    deck.shuffle(random.Random(1))
+    expected = list(deck)
+    assert sorted(expected) == list(range(DECK_SIZE))
+    assert [deck.draw() for _ in range(DECK_SIZE)] == expected
+    assert len(deck) == 0
+
+
+def test_deck_codes_round_trip():
+    deck = Deck()
+    deck.shuffle(random.Random(2))
+    deck.draw()
+    restored = Deck(deck.codes())
+    assert len(restored) == DECK_SIZE - 1
+    assert [restored.draw() for _ in range(len(restored))] == [deck.draw() for _ in range(len(deck))]
+
+
+def test_same_seed_gives_same_order():
+    first, second = Deck(), Deck()
+    first.shuffle(random.Random(42))
+    second.shuffle(random.Random(42))
+    assert first.codes() == second.codes()
+
+
+def test_hand():
+    hand = Hand([3, 7])
+    hand.add(51)
+    assert 51 in hand and len(hand) == 3
+    assert hand.remove(7)
+    assert not hand.remove(7)
+    assert list(hand) == hand.codes() == [3, 51]
+
+
+def test_weight_table():
+    weights = build_weight_table({"card_value_order": {"A": 14, "2": 2}, "suit_order": {"spades": 4}})
+    assert len(weights) == DECK_SIZE
+    assert weights[card_from_dict({"suit": "spades", "rank": "A"})] == 144
+    assert weights[card_from_dict({"suit": "clubs", "rank": "2"})] == 20
+    assert weights[card_from_dict({"suit": "clubs", "rank": "K"})] == 0
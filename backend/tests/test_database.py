@@ -0,0 +1,54 @@
+import asyncio
+import pytest
+from sqlalchemy import select, insert
+from app.database import database, read_database
+from app.metrics import DB_QUERY_SECONDS
+from app.models import users
+from conftest import add_users
+
+pytestmark = pytest.mark.anyio
+
+
+def _count(pool, method):
+    prefix = f'cardgame_db_query_seconds_count{{pool="{pool}",method="{method}"}} '
+    for line in DB_QUERY_SECONDS.render():
+        if line.startswith(prefix):
+            return int(line[len(prefix):])
+    return 0
+
+
+async def test_iterate_is_instrumented(db):
+    await add_users("a", "b", "c")
+    before = _count("read", "iterate")
+    names = [row["username"] async for row in read_database.iterate(select(users.c.username).order_by(users.c.username))]
+    assert names == ["a", "b", "c"]
+    assert _count("read", "iterate") == before + 1
+
+
+async def test_iterate_closed_early_is_instrumented(db):
+    await add_users("a", "b")
+    before = _count("write", "iterate")
+    rows = database.iterate(select(users.c.username))
+    async for _ in rows:
+        break
+    await rows.aclose()
+    assert _count("write", "iterate") == before + 1
+    # 提前结束的迭代把连接归还给连接池，之后的查询不受影响
+    assert await database.fetch_val(select(users.c.username).where(users.c.username == "b")) == "b"
+
+
+async def test_overlapping_read_then_write_transactions(db):
+    # 先读后写的事务互相重叠：延迟开始的写事务在升级时会因 SQLITE_BUSY 失败，BEGIN IMMEDIATE 则依次排队
+    async def register(username):
+        async with database.transaction():
+            await database.fetch_all(select(users.c.id))
+            await asyncio.sleep(0.05)
+            await database.execute(insert(users).values(username=username, password="x", points=0))
+
+    await asyncio.gather(*(register(f"u{i}") for i in range(4)))
+    assert len(await database.fetch_all(select(users.c.id))) == 4
+
+
+async def test_read_pool_rejects_writes(db):
+    with pytest.raises(Exception, match="readonly"):
+        await read_database.execute(insert(users).values(username="x", password="x", points=0))
@@ -0,0 +1,105 @@
+import asyncio
+import random
+import pytest
+from app.leaderboard import Leaderboard
+
+pytestmark = pytest.mark.anyio
+
+
+def _expected(points: dict):
+    """按定义直接排序得到的榜单：积分从高到低，同分按用户名；名次 = 积分更高的人数 + 1"""
+    ordered = sorted(points.items(), key=lambda item: (-item[1], item[0]))
+    return [
+        {"rank": 1 + sum(1 for value in points.values() if value > score), "username": name, "points": score}
+        for name, score in ordered
+    ]
+
+
+def _check(board: Leaderboard, points: dict):
+    expected = _expected(points)
+    assert len(board) == len(points)
+    assert board.top(len(points) + 5) == expected
+    for position, entry in enumerate(expected):
+        assert board.rank(entry["username"]) == (entry["rank"], position)
+        assert board.entry(position) == entry
+
+
+def test_ties_are_ordered_by_username():
+    board = Leaderboard()
+    board.rebuild([("carol", 5), ("bob", 0), ("alice", 0), ("dave", 5), ("erin", 9)])
+    assert board.top(5) == [
+        {"rank": 1, "username": "erin", "points": 9},
+        {"rank": 2, "username": "carol", "points": 5},
+        {"rank": 2, "username": "dave", "points": 5},
+        {"rank": 4, "username": "alice", "points": 0},
+        {"rank": 4, "username": "bob", "points": 0},
+    ]
+    assert board.rank("bob") == (4, 4)
+    assert board.rank("nobody") is None
+
+
+def test_random_updates_match_sorting():
+    rng = random.Random(7)
+    board = Leaderboard()
+    points = {f"u{i:03d}": rng.choice([0, 0, 0, rng.randint(-20, 40)]) for i in range(200)}
+    board.rebuild(points.items())
+    _check(board, points)
+    for step in range(2000):
+        name = f"u{rng.randrange(260):03d}"
+        if name in points and rng.random() < 0.5:
+            delta = rng.randint(-10, 10)
+            board.apply({name: delta})
+            points[name] += delta
+        else:
+            value = rng.choice([0, rng.randint(-30, 50)])
+            board.set(name, value)
+            points[name] = value
+        if step % 250 == 0:
+            _check(board, points)
+    _check(board, points)
+
+
+def test_points_outside_the_range_grow_it():
+    board = Leaderboard()
+    board.rebuild([("a", 0)])
+    board.set("low", -5000)
+    board.set("high", 100000)
+    _check(board, {"a": 0, "low": -5000, "high": 100000})
+
+
+def test_apply_ignores_unknown_users():
+    board = Leaderboard()
+    board.rebuild([("a", 1)])
+    board.apply({"a": 2, "ghost": 3})
+    assert board.top(5) == [{"rank": 1, "username": "a", "points": 3}]
+
+
+def test_around_returns_neighbours():
+    board = Leaderboard()
+    board.rebuild((f"u{i}", i) for i in range(10))
+    around = board.around("u5", 2)
+    assert around["rank"] == 5
+    assert around["total"] == 10
+    assert [entry["username"] for entry in around["players"]] == ["u7", "u6", "u5", "u4", "u3"]
+    # 靠近榜首时不越界
+    assert [entry["username"] for entry in board.around("u9", 2)["players"]] == ["u9", "u8", "u7"]
+    assert board.around("ghost", 2) is None
+
+
+async def test_refresh_keeps_running_after_a_failed_load(monkeypatch):
+    board = Leaderboard()
+    calls = []
+
+    async def load():
+        calls.append(None)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(board, "load", load)
+    task = asyncio.create_task(board._refresh(0.01))
+    try:
+        while len(calls) < 3:
+            await asyncio.sleep(0.01)
+        assert not task.done()
+    finally:
+        task.cancel()
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import pytest
+from app import lifecycle as lifecycle_module
+from app.lifecycle import LifecycleManager, TimerWheel
+
+pytestmark = pytest.mark.anyio
+
+
+def _advance_until_due(wheel, key, limit=100):
+    """前进直到 key 到期，返回前进的格数"""
+    for ticks in range(1, limit + 1):
+        if key in wheel.advance():
+            return ticks
+    raise AssertionError(f"{key} never became due")
+
+
+@pytest.mark.parametrize("delay, ticks", [(0, 1), (0.5, 1), (1, 1), (2.5, 3), (4, 4), (5, 5), (9, 9), (12, 12)])
+def test_timer_fires_after_its_delay(delay, ticks):
+    # 4 格的时间轮：超过一圈的定时器记录剩余圈数，每经过一次所在格减一圈
+    wheel = TimerWheel(1.0, 4)
+    wheel.advance()
+    wheel.schedule("k", delay)
+    assert _advance_until_due(wheel, "k") == ticks
+    assert "k" not in wheel and len(wheel) == 0
+
+
+def test_schedule_replaces_and_cancel_removes():
+    wheel = TimerWheel(1.0, 4)
+    wheel.schedule("a", 6)
+    wheel.schedule("a", 2)
+    wheel.schedule("b", 3)
+    assert len(wheel) == 2
+    assert _advance_until_due(wheel, "a") == 2
+    wheel.cancel("b")
+    wheel.cancel("b")
+    assert len(wheel) == 0
+    assert not any(wheel.advance() for _ in range(8))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class Objects:
+    """登记到生命周期管理的测试对象：{ key: (版本号, ttl) }"""
+
+    def __init__(self):
+        self.info = {}
+        self.reclaimed = []
+        self.fail = 0
+
+    async def inspect(self, key):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("store unavailable")
+        return self.info.get(key)
+
+    async def reclaim(self, key):
+        self.info.pop(key, None)
+        self.reclaimed.append(key)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(lifecycle_module, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def manager():
+    manager = LifecycleManager({**lifecycle_module.LIFECYCLE_CONFIG, "tick": 1.0, "slots": 8})
+    objects = Objects()
+    manager.register("room", objects.inspect, objects.reclaim)
+    manager.objects = objects
+    return manager
+
+
+async def _tick(manager, clock, seconds=1):
+    """模拟时间轮的 _run：每前进一格处理到期的对象"""
+    for _ in range(seconds):
+        clock.now += manager.wheel.tick
+        for full_key in manager.wheel.advance():
+            await manager._expire(full_key)
+
+
+async def test_idle_object_is_reclaimed(manager, clock):
+    manager.objects.info["R"] = (1, 5)
+    manager.touch("room", "R", 5)
+    await _tick(manager, clock, 4)
+    assert manager.objects.reclaimed == []
+    await _tick(manager, clock)
+    assert manager.objects.reclaimed == ["R"]
+    assert manager.tracked() == 0 and len(manager.wheel) == 0
+
+
+async def test_activity_postpones_without_moving_the_timer(manager, clock):
+    manager.objects.info["R"] = (1, 5)
+    manager.touch("room", "R", 5)
+    due = manager._entries[("room", "R")].due
+    await _tick(manager, clock, 3)
+    manager.touch("room", "R", 5)
+    # 只记录活动时间，定时器仍在原来的格子
+    assert manager._entries[("room", "R")].due == due
+    await _tick(manager, clock, 2)
+    assert manager.objects.reclaimed == []
+    # 到期时按最新活动时间顺延剩下的 3 秒
+    await _tick(manager, clock, 2)
+    assert manager.objects.reclaimed == []
+    await _tick(manager, clock)
+    assert manager.objects.reclaimed == ["R"]
+
+
+async def test_shorter_ttl_moves_the_timer(manager, clock):
+    manager.objects.info["R"] = (1, 2)
+    manager.touch("room", "R", 30)
+    # 例如房间刚变空：保留时间变短，定时器提前
+    manager.touch("room", "R", 2)
+    await _tick(manager, clock, 2)
+    assert manager.objects.reclaimed == ["R"]
+
+
+@pytest.mark.parametrize("written, reclaimed_after", [(False, 3), (True, 5)])
+async def test_version_change_counts_as_activity(manager, clock, written, reclaimed_after):
+    manager.objects.info["R"] = (1, 3)
+    manager.touch("room", "R", 1)
+    await _tick(manager, clock)  # 第一次到期：记录版本号，按 ttl=3 顺延 2 秒
+    if written:
+        # 期间其他 worker 写入过（版本号变化），视为上一格内的一次活动
+        manager.objects.info["R"] = (2, 3)
+    await _tick(manager, clock, reclaimed_after - 2)
+    assert manager.objects.reclaimed == []
+    await _tick(manager, clock)
+    assert manager.objects.reclaimed == ["R"]
+
+
+async def test_deleted_object_is_forgotten(manager, clock):
+    manager.touch("room", "gone", 1)
+    await _tick(manager, clock)
+    assert manager.objects.reclaimed == []
+    assert manager.tracked("room") == 0
+
+
+async def test_failed_inspection_is_logged_and_retried(manager, caplog):
+    manager.wheel.tick = 0.001
+    manager.objects.info["R"] = (1, 0)
+    manager.objects.fail = 1
+    manager.touch("room", "R", 0)
+    with caplog.at_level(logging.ERROR, logger="app.lifecycle"):
+        await manager.start()
+        try:
+            for _ in range(200):
+                if manager.objects.reclaimed:
+                    break
+                await asyncio.sleep(0.005)
+        finally:
+            manager.stop()
+    assert manager.objects.reclaimed == ["R"]
+    assert "生命周期检查失败" in caplog.text
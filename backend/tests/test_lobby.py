@@ -0,0 +1,91 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.lobby import capacity
+from app.main import app
+from app.pubsub import pubsub
+from app.room_manager import delete_room
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        for username in ("la", "lb", "lc", "ld"):
+            client.post("/register", json={"username": username, "password": "pw"})
+        yield client
+
+
+def test_capacity_comes_from_the_game_mode():
+    assert capacity("poker_battle") == 3
+    assert capacity("no_such_mode") == 0
+
+
+def test_lobby_snapshot_and_diffs(client):
+    existing = client.post("/room/create", json={"username": "ld"}).json()["room_id"]
+    with client.websocket_connect("/ws/lobby?seats=1") as ws:
+        snapshot = ws.receive_json()
+        assert snapshot["action"] == "lobby_snapshot"
+        assert snapshot["capacity"] == 3
+        assert existing in {room["room_id"] for room in snapshot["rooms"]}
+        # 大厅只在本进程内推送，不订阅跨进程频道
+        assert not any(channel.startswith("lobby:") for channel in pubsub.subscriptions)
+
+        room_id = client.post("/room/create", json={"username": "la"}).json()["room_id"]
+        diff = ws.receive_json()
+        assert diff["action"] == "lobby_diff"
+        assert diff["upsert"] == [{"room_id": room_id, "mode": "poker_battle", "players": 1, "ready": 0, "capacity": 3}]
+
+        client.post("/room/join", json={"username": "lb", "room_id": room_id})
+        assert ws.receive_json()["upsert"][0]["players"] == 2
+
+        # 满员后从列表中移除
+        client.post("/room/join", json={"username": "lc", "room_id": room_id})
+        assert ws.receive_json()["remove"] == [room_id]
+
+        client.post("/room/leave", json={"username": "lc", "room_id": room_id})
+        assert ws.receive_json()["upsert"][0]["players"] == 2
+
+        client.portal.call(delete_room, room_id)
+        assert ws.receive_json()["remove"] == [room_id]
+
+        ws.send_json({"action": "snapshot"})
+        assert room_id not in {room["room_id"] for room in ws.receive_json()["rooms"]}
+
+
+def test_unknown_mode_is_rejected_on_create(client):
+    response = client.post("/room/create", json={"username": "la", "mode": "no_such_mode"})
+    assert response.status_code == 400
+
+
+def test_join_is_limited_to_the_mode_capacity(client):
+    room_id = client.post("/room/create", json={"username": "la"}).json()["room_id"]
+    for username in ("lb", "lc"):
+        assert client.post("/room/join", json={"username": username, "room_id": room_id}).status_code == 200
+    response = client.post("/room/join", json={"username": "ld", "room_id": room_id})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "房间已满"
+    # 已在房间内的玩家重新加入不受影响
+    assert client.post("/room/join", json={"username": "lb", "room_id": room_id}).status_code == 200
+    client.portal.call(delete_room, room_id)
+
+
+def test_rooms_with_a_running_game_leave_the_lobby(client):
+    room_id = client.post("/room/create", json={"username": "la"}).json()["room_id"]
+    client.post("/room/join", json={"username": "lb", "room_id": room_id})
+    with client.websocket_connect("/ws/lobby?seats=1") as ws:
+        assert room_id in {room["room_id"] for room in ws.receive_json()["rooms"]}
+        client.post("/game/start", json={"room_id": room_id})
+        assert ws.receive_json()["remove"] == [room_id]
+        ws.send_json({"action": "snapshot"})
+        assert room_id not in {room["room_id"] for room in ws.receive_json()["rooms"]}
+
+        with client.websocket_connect(f"/ws/game/{room_id}?protocol=delta") as game:
+            game.receive_json()
+            for username in ("la", "lb"):
+                game.send_json({"action": "draw_card", "username": username})
+                card = game.receive_json()["ops"][0]["card"]
+                game.send_json({"action": "play_card", "username": username, "card": card})
+                game.receive_json()
+            assert game.receive_json()["action"] == "finish_game"
+        # 结算后房间重新出现在大厅中
+        assert ws.receive_json()["upsert"][0]["room_id"] == room_id
+    client.portal.call(delete_room, room_id)
@@ -0,0 +1,161 @@
+import asyncio
+import pytest
+from app import matchmaking, room_manager
+from app.matchmaking import Matchmaker, Ticket, MATCHMAKING_CONFIG
+from app.room_manager import ROOMS, create_rooms
+from app.state_store import store
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeConn:
+    closed = False
+
+
+class FakeHub:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, conn, message):
+        self.sent.append((conn, message))
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    hub = FakeHub()
+    monkeypatch.setattr(matchmaking, "match_hub", hub)
+    return hub
+
+
+@pytest.fixture
+def created(monkeypatch):
+    """记录建房请求，返回的房间号为 R0、R1 ..."""
+    calls = []
+
+    async def fake_create_rooms(groups):
+        calls.append(groups)
+        return [f"R{index}" for index in range(len(groups))]
+
+    monkeypatch.setattr(matchmaking, "create_rooms", fake_create_rooms)
+    return calls
+
+
+def _matchmaker(**overrides):
+    return Matchmaker({**MATCHMAKING_CONFIG, "bucket_width": 20, "tick": 0.01, **overrides})
+
+
+def _ticket(username, points, players=2):
+    return Ticket(username, points, players, FakeConn())
+
+
+async def _settle():
+    # 让 call_soon 安排的批量建房以及建房协程运行完
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def test_same_bucket_matches_in_one_batch(hub, created):
+    mm = _matchmaker()
+    for username, points in (("a", 0), ("b", 19), ("c", 40), ("d", 59)):
+        mm.enqueue(_ticket(username, points))
+    assert len(mm) == 0
+    await _settle()
+    # 同一轮匹配成功的两桌合并为一次建房
+    assert created == [[["b", "a"], ["d", "c"]]]
+    assert sum('"matched"' in message for _, message in hub.sent) == 4
+
+
+async def test_players_by_table_size_are_not_mixed(hub, created):
+    mm = _matchmaker()
+    mm.enqueue(_ticket("a", 0, players=2))
+    mm.enqueue(_ticket("b", 0, players=3))
+    mm.enqueue(_ticket("c", 0, players=3))
+    assert len(mm) == 3
+    mm.enqueue(_ticket("d", 0, players=3))
+    await _settle()
+    assert created == [[["d", "b", "c"]]]
+    assert len(mm) == 1
+
+
+async def test_window_widens_over_time(hub, created, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(matchmaking.time, "monotonic", lambda: clock[0])
+    mm = _matchmaker(widen_interval=5.0, max_window=2)
+    mm.enqueue(_ticket("a", 0))
+    mm.enqueue(_ticket("b", 45))  # 相隔两个桶
+    clock[0] += 5
+    mm._widen_due()
+    assert len(mm) == 2
+    clock[0] += 5
+    mm._widen_due()
+    assert len(mm) == 0
+    await _settle()
+    assert len(created) == 1
+
+
+async def test_requeued_ticket_widens_once_per_interval(hub, created, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(matchmaking.time, "monotonic", lambda: clock[0])
+    mm = _matchmaker(widen_interval=5.0)
+    ticket = _ticket("a", 0)
+    mm.enqueue(ticket)
+    # 重新入队同一张票（建房失败时的处理），堆中仍留着上一次入队的扩大事件
+    mm.cancel("a")
+    mm.enqueue(ticket)
+    clock[0] += 5
+    mm._widen_due()
+    assert ticket.window == 1
+
+
+async def test_failed_room_creation_requeues_players(hub, monkeypatch):
+    attempts = []
+
+    async def flaky_create_rooms(groups):
+        attempts.append(groups)
+        if len(attempts) == 1:
+            raise ConnectionError("database unavailable")
+        return ["R0"]
+
+    monkeypatch.setattr(matchmaking, "create_rooms", flaky_create_rooms)
+    mm = _matchmaker()
+    a, b = _ticket("a", 0), _ticket("b", 0)
+    mm.enqueue(a)
+    mm.enqueue(b)
+    b.conn.closed = True
+    c = _ticket("c", 0)
+    await _settle()
+    assert any('"error"' in message for _, message in hub.sent)
+    # 等待一个检查周期后放回队列；已断开的 b 不再放回
+    await asyncio.sleep(0.05)
+    assert list(mm._tickets) == ["a"]
+    mm.enqueue(c)
+    await _settle()
+    assert attempts[1] == [["c", "a"]]
+
+
+async def test_create_rooms_writes_one_batch(db, monkeypatch):
+    batches = []
+    create_many = store.create_many
+
+    async def recording_create_many(namespace, items):
+        batches.append(len(items))
+        return await create_many(namespace, items)
+
+    monkeypatch.setattr(store, "create_many", recording_create_many)
+    room_ids = await create_rooms([["a", "b"], ["c", "d", "e"]])
+    assert batches == [2]
+    rooms = [await room_manager.get_room_info(room_id) for room_id in room_ids]
+    assert [list(room["users"]) for room in rooms] == [["a", "b"], ["c", "d", "e"]]
+    for room_id in room_ids:
+        await room_manager.delete_room(room_id)
+
+
+async def test_create_rooms_retries_conflicting_ids(db, monkeypatch):
+    await store.put(ROOMS, "TAKEN", {"room_id": "TAKEN", "users": {}}, 0)
+    ids = iter(["TAKEN", "FREE1", "FREE2"])
+    monkeypatch.setattr(room_manager, "generate_random_room_id", lambda: next(ids))
+    assert await create_rooms([["a", "b"], ["c", "d"]]) == ["FREE2", "FREE1"]
+    assert (await room_manager.get_room_info("TAKEN"))["users"] == {}
+    await store.delete(ROOMS, "TAKEN")
+    for room_id in ("FREE1", "FREE2"):
+        await room_manager.delete_room(room_id)
@@ -0,0 +1,96 @@
+import copy
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.game_modes import poker_battle
+from app.game_modes.cards import Deck, DECK_SIZE
+from app.game_modes.poker_battle import GAME_STATES, GameState, compile_config, current_rules, prune_rules
+from app.state_store import store
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_stale_rules_are_pruned_once_no_game_uses_them():
+    current = current_rules()
+    # 模拟热加载前的配置：内容不同，摘要也不同
+    old = compile_config({**current.config, "reloaded": False})
+    assert old.digest != current.digest
+    await store.put(GAME_STATES, "RULES1", GameState(["a", "b"], Deck(), old), 0)
+    try:
+        assert await prune_rules() == 0
+        assert poker_battle._RULES[old.digest] is old
+    finally:
+        await store.delete(GAME_STATES, "RULES1")
+    assert await prune_rules() == 1
+    assert old.digest not in poker_battle._RULES
+    assert poker_battle._RULES[current.digest] is current
+
+
+def _apply(state, message):
+    """模拟增量协议客户端：在快照上依次应用 patch 和结算消息"""
+    action = message["action"]
+    if action in ("snapshot", "game_restart"):
+        return copy.deepcopy(message["game_state"])
+    if action == "patch":
+        assert message.get("base", message["seq"] - 1) == state["seq"]
+        for op in message["ops"]:
+            username = op["username"]
+            if op["op"] == "draw":
+                state["hands"][username].append(op["card"])
+                state["deck_count"] = op["deck_count"]
+            elif op["op"] == "play":
+                state["hands"][username].remove(op["card"])
+                state["table"][username] = op["card"]
+            elif op["op"] == "flags":
+                state["playerActions"][username] = {"drawn": op["drawn"], "played": op["played"]}
+            else:
+                raise AssertionError(f"unexpected op {op}")
+    elif action == "finish_game":
+        state["finished"] = True
+    else:
+        raise AssertionError(f"unexpected message {message}")
+    state["seq"] = message["seq"]
+    return state
+
+
+def _assert_deck_hidden(message):
+    assert "deck" not in message.get("game_state", {})
+    for op in message.get("ops", ()):
+        assert set(op) <= {"op", "username", "card", "deck_count", "drawn", "played"}
+
+
+def test_delta_patches_rebuild_the_snapshot():
+    with TestClient(app) as client:
+        for username in ("da", "db"):
+            client.post("/register", json={"username": username, "password": "pw"})
+        room_id = client.post("/room/create", json={"username": "da"}).json()["room_id"]
+        client.post("/room/join", json={"username": "db", "room_id": room_id})
+        client.post("/game/start", json={"room_id": room_id})
+        with client.websocket_connect(f"/ws/game/{room_id}?protocol=delta") as ws:
+            def send(message):
+                ws.send_json(message)
+                received = ws.receive_json()
+                _assert_deck_hidden(received)
+                return received
+
+            def server_snapshot():
+                snapshot = send({"action": "sync", "seq": -1})
+                assert snapshot["action"] == "snapshot"
+                return snapshot["game_state"]
+
+            snapshot = ws.receive_json()
+            _assert_deck_hidden(snapshot)
+            state = _apply(None, snapshot)
+            for username in ("da", "db"):
+                state = _apply(state, send({"action": "draw_card", "username": username}))
+            assert state == server_snapshot()
+            assert state["deck_count"] == DECK_SIZE - 2
+
+            state = _apply(state, send({"action": "play_card", "username": "da", "card": state["hands"]["da"][0]}))
+            state = _apply(state, send({"action": "play_card", "username": "db", "card": state["hands"]["db"][0]}))
+            finish = ws.receive_json()
+            assert finish["action"] == "finish_game"
+            state = _apply(state, finish)
+            assert state == server_snapshot()
+            assert state["finished"]
+            assert send({"action": "sync", "seq": state["seq"]}) == {"action": "sync", "seq": state["seq"]}
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import pytest
+from app.pubsub import LocalPubSub, PubSub, SQLitePubSub, UnixSocketPubSub, run_broker
+
+pytestmark = pytest.mark.anyio
+
+MESSAGE = {"json": '{"type": "update"}', "msgpack": b"\x81\xa4type"}
+
+
+class Inbox:
+    def __init__(self):
+        self.messages = []
+        self.event = asyncio.Event()
+
+    def __call__(self, channel, message):
+        self.messages.append((channel, message))
+        self.event.set()
+
+    async def wait(self, count=1):
+        while len(self.messages) < count:
+            self.event.clear()
+            await asyncio.wait_for(self.event.wait(), 2)
+
+
+async def _until(predicate):
+    for _ in range(200):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met")
+
+
+def test_backend_without_send_batch_cannot_be_created():
+    class Incomplete(PubSub):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+async def test_local_backend_does_not_forward():
+    pubsub = LocalPubSub()
+    inbox = Inbox()
+    await pubsub.start(inbox)
+    pubsub.subscribe("room:A")
+    pubsub.publish("room:A", MESSAGE)
+    await asyncio.sleep(0)
+    assert not pubsub.enabled
+    assert pubsub._pending == {}
+    assert inbox.messages == []
+    await pubsub.stop()
+
+
+async def test_sqlite_backend_delivers_to_other_workers(db):
+    sender, receiver = SQLitePubSub(0.01, 60), SQLitePubSub(0.01, 60)
+    sender_inbox, inbox = Inbox(), Inbox()
+    await sender.start(sender_inbox)
+    await receiver.start(inbox)
+    sender.subscribe("room:A")
+    receiver.subscribe("room:A")
+    try:
+        # 同一周期内发布的消息合并为一行，不回发给发布者，未订阅的频道不投递
+        sender.publish("room:A", MESSAGE)
+        sender.publish("room:A", {"json": "second"})
+        sender.publish("room:B", {"json": "ignored"})
+        await inbox.wait(2)
+        await asyncio.sleep(0.05)
+    finally:
+        await sender.stop()
+        await receiver.stop()
+    assert inbox.messages == [("room:A", MESSAGE), ("room:A", {"json": "second"})]
+    assert sender_inbox.messages == []
+
+
+async def test_unix_backend_forwards_through_broker(tmp_path):
+    path = str(tmp_path / "pubsub.sock")
+    broker = asyncio.create_task(run_broker(path))
+    sender, receiver = UnixSocketPubSub(path, 0.01), UnixSocketPubSub(path, 0.01)
+    inbox = Inbox()
+    receiver.subscribe("room:A")
+    await sender.start(Inbox())
+    await receiver.start(inbox)
+    try:
+        await _until(lambda: sender._writer is not None and receiver._writer is not None)
+        # 等待 broker 处理完订阅帧
+        for _ in range(100):
+            sender.publish("room:A", MESSAGE)
+            await asyncio.sleep(0.01)
+            if inbox.messages:
+                break
+        assert inbox.messages[0] == ("room:A", MESSAGE)
+        receiver.unsubscribe("room:A")
+        await asyncio.sleep(0.05)
+        count = len(inbox.messages)
+        sender.publish("room:A", MESSAGE)
+        await asyncio.sleep(0.05)
+        assert len(inbox.messages) == count
+    finally:
+        await sender.stop()
+        await receiver.stop()
+        broker.cancel()
+
+
+async def test_unix_backend_logs_dropped_batches(tmp_path, caplog):
+    pubsub = UnixSocketPubSub(str(tmp_path / "missing.sock"), 60)
+    with caplog.at_level(logging.WARNING, logger="app.pubsub"):
+        pubsub.publish("room:A", MESSAGE)
+        await asyncio.sleep(0)
+        pubsub.publish("room:A", MESSAGE)
+        await asyncio.sleep(0)
+    assert pubsub._dropped == 2
+    # 每次断开只告警一次
+    assert len(caplog.records) == 1
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+from app.database import database
+from app.models import game_records
+from app.records import decode_cursor, encode_cursor, fetch_page, newest_first
+from app.settlement import settle_game
+from conftest import add_users
+
+pytestmark = pytest.mark.anyio
+
+GAME_1 = datetime(2024, 1, 1, 12, 0, 0)
+
+
+async def _settle_games(count):
+    """每局两名玩家各一条记录：同一局的记录 game_time 相同"""
+    await add_users("a", "b")
+    for i in range(count):
+        await settle_game(f"ROOM{i % 2}", GAME_1 + timedelta(minutes=i), {"a": 1, "b": -1})
+    rows = await database.fetch_all(newest_first(select(game_records.c.id, game_records.c.game_time)))
+    return [row["id"] for row in rows]
+
+
+async def _walk(limit, room_id=None):
+    """从第一页开始按游标翻到最后一页，返回每页的记录 id"""
+    pages, cursor = [], None
+    while True:
+        query = select(game_records)
+        if room_id:
+            query = query.where(game_records.c.room_id == room_id)
+        records, cursor = await fetch_page(newest_first(query, cursor=cursor), limit)
+        pages.append([record["id"] for record in records])
+        if cursor is None:
+            return pages
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(GAME_1, 42)
+    assert decode_cursor(cursor) == (GAME_1, 42)
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor("not a cursor")
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize("limit", [1, 3, 4, 6, 7])
+async def test_pages_split_ties_on_game_time(db, limit):
+    expected = await _settle_games(3)
+    assert len(expected) == 6
+    pages = await _walk(limit)
+    # 相同 game_time 的两条记录可能分在两页，翻页时既不重复也不遗漏
+    assert [record_id for page in pages for record_id in page] == expected
+    # 记录数恰好是页大小的整数倍时，最后一页之后不再返回游标（不会多出一个空页）
+    assert all(pages)
+    assert len(pages) == -(-len(expected) // limit)
+
+
+async def test_room_filter_pages(db):
+    await _settle_games(4)
+    pages = await _walk(1, room_id="ROOM1")
+    rows = await database.fetch_all(
+        newest_first(select(game_records.c.id).where(game_records.c.room_id == "ROOM1"))
+    )
+    assert [page[0] for page in pages] == [row["id"] for row in rows]
+    assert len(pages) == 4
+
+
+async def test_room_filter_uses_room_time_index(db):
+    plan = await database.fetch_all(
+        "EXPLAIN QUERY PLAN SELECT id FROM game_records WHERE room_id = 'R' ORDER BY game_time DESC, id DESC"
+    )
+    assert any("ix_game_records_room_id_game_time" in row["detail"] for row in plan)
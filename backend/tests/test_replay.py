@@ -0,0 +1,63 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.auth import AUTH_CONFIG, tokens
+from app.main import app
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setitem(AUTH_CONFIG, "admin_users", ["root"])
+    with TestClient(app) as client:
+        yield client
+
+
+def _admin():
+    return {"Authorization": f"Bearer {tokens.issue('root')[0]}"}
+
+
+def _start_game(client, *usernames):
+    for username in usernames:
+        client.post("/register", json={"username": username, "password": "pw"})
+    room_id = client.post("/room/create", json={"username": usernames[0]}).json()["room_id"]
+    for username in usernames[1:]:
+        client.post("/room/join", json={"username": username, "room_id": room_id})
+    client.post("/game/start", json={"room_id": room_id})
+    return room_id
+
+
+def _play(ws, username):
+    ws.send_json({"action": "draw_card", "username": username})
+    card = ws.receive_json()["ops"][0]["card"]
+    ws.send_json({"action": "play_card", "username": username, "card": card})
+    return ws.receive_json()
+
+
+def test_replay_requires_admin(client):
+    assert client.get("/game/replay", params={"room_id": "NOPE"}).status_code == 401
+    headers = {"Authorization": f"Bearer {tokens.issue('alice')[0]}"}
+    assert client.get("/game/replay", params={"room_id": "NOPE"}, headers=headers).status_code == 403
+
+
+def test_live_game_is_not_replayed(client):
+    room_id = _start_game(client, "pa", "pb")
+    with client.websocket_connect(f"/ws/game/{room_id}?protocol=delta") as ws:
+        ws.receive_json()
+        _play(ws, "pa")
+        response = client.get("/game/replay", params={"room_id": room_id}, headers=_admin())
+    assert response.status_code == 409
+    assert "seed" not in response.text
+
+
+def test_settled_game_is_replayed(client):
+    room_id = _start_game(client, "qa", "qb")
+    with client.websocket_connect(f"/ws/game/{room_id}?protocol=delta") as ws:
+        ws.receive_json()
+        _play(ws, "qa")
+        _play(ws, "qb")
+        assert ws.receive_json()["action"] == "finish_game"
+    replay = client.get("/game/replay", params={"room_id": room_id}, headers=_admin())
+    assert replay.status_code == 200
+    body = replay.json()
+    assert body["consistent"]
+    assert body["final_state"]["finished"]
+    assert [event["action"] for event in body["events"]] == ["init", "draw", "play", "draw", "play", "finish"]
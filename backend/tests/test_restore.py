@@ -0,0 +1,33 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from app.room_manager import list_rooms
+from app.state_store import store
+
+
+def _restart_with_empty_state_store():
+    """模拟进程重启：进程内状态存储与房间目录随进程丢失，只剩数据库中的对局事件日志"""
+    store._data.clear()
+
+
+def test_restored_game_can_be_rejoined():
+    with TestClient(app) as client:
+        for username in ("ra", "rb"):
+            client.post("/register", json={"username": username, "password": "pw"})
+        room_id = client.post("/room/create", json={"username": "ra"}).json()["room_id"]
+        client.post("/room/join", json={"username": "rb", "room_id": room_id})
+        client.post("/game/start", json={"room_id": room_id})
+        with client.websocket_connect(f"/ws/game/{room_id}?protocol=delta") as ws:
+            assert ws.receive_json()["action"] == "snapshot"
+            ws.send_json({"action": "draw_card", "username": "ra"})
+            assert ws.receive_json()["action"] == "patch"
+    _restart_with_empty_state_store()
+
+    with TestClient(app) as client:
+        room = client.get("/room/info", params={"room_id": room_id})
+        assert room.status_code == 200
+        assert {user["username"] for user in room.json()["users"]} == {"ra", "rb"}
+        assert any(entry["room_id"] == room_id for entry in list_rooms())
+        with client.websocket_connect(f"/ws/game/{room_id}?protocol=delta") as ws:
+            snapshot = ws.receive_json()
+            assert snapshot["action"] == "snapshot"
+            assert snapshot["game_state"]["playerActions"]["ra"]["drawn"]
@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from app.metrics import WS_ACTION_FAILURES
+from app.room_actor import RoomActors, INTERNAL_ERROR
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeBatch:
+    flushed = []
+
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.messages = []
+
+    def send_error(self, conn, detail):
+        self.messages.append((conn, {"action": "error", "detail": detail}))
+
+    def flush(self):
+        FakeBatch.flushed.extend(self.messages)
+
+
+async def _handle(batch, conn, message):
+    if message["action"] == "finish_game":
+        raise RuntimeError("database is locked")
+    batch.messages.append((conn, {"action": "ok", "n": message["n"]}))
+
+
+async def _drain(actors, room_id):
+    actors.stop(room_id)
+    while room_id in actors.inboxes:
+        await asyncio.sleep(0)
+
+
+async def test_failed_message_replies_error_and_actor_continues():
+    FakeBatch.flushed = []
+    actors = RoomActors("test", _handle, FakeBatch, {"finish_game", "draw_card"})
+    failures = WS_ACTION_FAILURES.value("test", "finish_game")
+    actors.submit("R1", "a", {"action": "draw_card", "n": 1})
+    actors.submit("R1", "b", {"action": "finish_game"})
+    actors.submit("R1", "a", {"action": "draw_card", "n": 2})
+    await _drain(actors, "R1")
+    assert FakeBatch.flushed == [
+        ("a", {"action": "ok", "n": 1}),
+        ("b", {"action": "error", "detail": INTERNAL_ERROR}),
+        ("a", {"action": "ok", "n": 2}),
+    ]
+    assert WS_ACTION_FAILURES.value("test", "finish_game") == failures + 1
+
+
+async def test_messages_of_one_room_are_serialized():
+    order = []
+
+    async def handle(batch, conn, message):
+        order.append(("start", message["n"]))
+        await asyncio.sleep(0)
+        order.append(("end", message["n"]))
+
+    actors = RoomActors("test", handle, FakeBatch)
+    for n in range(3):
+        actors.submit("R1", None, {"action": "x", "n": n})
+    await _drain(actors, "R1")
+    assert order == [(step, n) for n in range(3) for step in ("start", "end")]
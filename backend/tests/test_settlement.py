@@ -0,0 +1,159 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select, func
+from app import settlement
+from app.database import database
+from app.models import users, game_sessions, game_records, user_stats, applied_settlements
+from app.settlement import settle_game, apply_settlements, SettlementJournal, SETTLEMENT_CONFIG
+from conftest import add_users
+
+pytestmark = pytest.mark.anyio
+
+GAME_1 = datetime(2024, 1, 1, 12, 0, 0)
+GAME_2 = GAME_1 + timedelta(minutes=1)
+
+
+async def _points():
+    rows = await database.fetch_all(select(users.c.username, users.c.points))
+    return {row["username"]: row["points"] for row in rows}
+
+
+async def _sessions():
+    rows = await database.fetch_all(select(game_sessions).order_by(game_sessions.c.id))
+    return [(row["room_id"], row["game_time"]) for row in rows]
+
+
+async def test_settle_two_games_in_same_room(db):
+    await add_users("a", "b")
+    first = await settle_game("ROOM1", GAME_1, {"a": 1, "b": -1})
+    second = await settle_game("ROOM1", GAME_2, {"a": 1, "b": -1})
+    assert first != second
+    assert await _sessions() == [("ROOM1", GAME_1), ("ROOM1", GAME_2)]
+    assert await _points() == {"a": 2, "b": -2}
+    stats = await database.fetch_all(select(user_stats).order_by(user_stats.c.user_id))
+    assert [(row["games"], row["wins"], row["current_streak"]) for row in stats] == [(2, 2, 2), (2, 0, -2)]
+
+
+async def test_batch_maps_sessions_by_room_and_time(db):
+    await add_users("a", "b")
+    entries = [
+        {"room_id": "ROOM1", "game_time": GAME_1, "results": {"a": 1, "b": -1}},
+        {"room_id": "ROOM1", "game_time": GAME_2, "results": {"a": -1, "b": 1}},
+        {"room_id": "ROOM2", "game_time": GAME_1, "results": {"a": 0, "b": 0}},
+    ]
+    async with database.transaction():
+        session_ids = await apply_settlements(entries)
+    assert len(set(session_ids)) == 3
+    for entry, session_id in zip(entries, session_ids):
+        row = await database.fetch_one(select(game_sessions).where(game_sessions.c.id == session_id))
+        assert (row["room_id"], row["game_time"]) == (entry["room_id"], entry["game_time"])
+        records = await database.fetch_all(select(game_records).where(game_records.c.session_id == session_id))
+        assert {record["score_change"] for record in records} == set(entry["results"].values())
+
+
+async def test_write_behind_two_games_in_same_room(db, tmp_path, monkeypatch):
+    await add_users("a", "b")
+    journal = SettlementJournal({
+        **SETTLEMENT_CONFIG, "mode": "write_behind", "journal_path": str(tmp_path / "settlement.journal"),
+        "flush_interval": 60, "fsync": False,
+    })
+    monkeypatch.setattr(settlement, "journal", journal)
+    await journal.start()
+    try:
+        assert await settle_game("ROOM1", GAME_1, {"a": 1, "b": -1}) is None
+        assert await settle_game("ROOM1", GAME_2, {"a": 1, "b": -1}) is None
+        assert await journal.flush() == 2
+    finally:
+        await journal.stop()
+    assert len(journal) == 0
+    assert not (tmp_path / "settlement.journal.rejected").exists()
+    assert await _sessions() == [("ROOM1", GAME_1), ("ROOM1", GAME_2)]
+    assert await _points() == {"a": 2, "b": -2}
+
+
+async def test_write_behind_replay_is_idempotent(db, tmp_path):
+    await add_users("a", "b")
+    config = {
+        **SETTLEMENT_CONFIG, "mode": "write_behind", "journal_path": str(tmp_path / "settlement.journal"),
+        "flush_interval": 60, "fsync": False,
+    }
+    journal = SettlementJournal(config)
+    await journal.start()
+    await journal.append({"room_id": "ROOM1", "game_time": GAME_1, "results": {"a": 1, "b": -1}})
+    await journal.flush()
+    # 模拟写入数据库后、截断日志前崩溃：日志中仍保留已写入的条目
+    journal.path.write_text(
+        '{"key": "ROOM1@%s", "room_id": "ROOM1", "game_time": "%s", "results": {"a": 1, "b": -1}}\n'
+        % (GAME_1.isoformat(), GAME_1.isoformat()), encoding="utf-8"
+    )
+    journal._file.close()
+    journal._file = None
+    await journal.stop()
+
+    replayed = SettlementJournal(config)
+    await replayed.start()
+    await replayed.stop()
+    assert await database.fetch_val(select(func.count()).select_from(game_sessions)) == 1
+    assert await _points() == {"a": 1, "b": -1}
+
+
+async def test_unique_room_index_is_migrated(db):
+    await database.execute("DROP INDEX ix_game_sessions_room_id")
+    await database.execute("CREATE UNIQUE INDEX ix_game_sessions_room_id ON game_sessions (room_id)")
+    from app.database import create_tables
+    await create_tables()
+    await add_users("a", "b")
+    await settle_game("ROOM1", GAME_1, {"a": 1, "b": -1})
+    await settle_game("ROOM1", GAME_2, {"a": 1, "b": -1})
+    assert len(await _sessions()) == 2
+
+
+def _journal_config(tmp_path, **overrides):
+    return {
+        **SETTLEMENT_CONFIG, "mode": "write_behind", "journal_path": str(tmp_path / "settlement.journal"),
+        "flush_interval": 60, "fsync": False, **overrides,
+    }
+
+
+def _entry(room_id, game_time=GAME_1):
+    return {"room_id": room_id, "game_time": game_time, "results": {"a": 1, "b": -1}}
+
+
+async def test_journal_keeps_only_unapplied_entries(db, tmp_path, monkeypatch):
+    await add_users("a", "b")
+    journal = SettlementJournal(_journal_config(tmp_path, batch_size=2))
+    await journal.start()
+    for room_id in ("ROOM1", "ROOM2", "ROOM3"):
+        await journal.append(_entry(room_id))
+    apply = journal._apply
+
+    async def apply_first_batch_only(entries):
+        if entries[0]["room_id"] == "ROOM3":
+            raise ConnectionError("database unavailable")
+        await apply(entries)
+
+    monkeypatch.setattr(journal, "_apply", apply_first_batch_only)
+    assert await journal.flush() == 2
+    # 第一批写入后日志被压缩，只剩写入失败的一条；之后的追加仍写入新的日志文件
+    lines = journal.path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["room_id"] for line in lines] == ["ROOM3"]
+    await journal.append(_entry("ROOM4"))
+    monkeypatch.setattr(journal, "_apply", apply)
+    assert await journal.flush() == 2
+    assert journal.path.read_text(encoding="utf-8") == ""
+    await journal.stop()
+    assert len(await _sessions()) == 4
+
+
+async def test_prune_applied_settlements(db, tmp_path):
+    await add_users("a", "b")
+    journal = SettlementJournal(_journal_config(tmp_path))
+    await journal.start()
+    await journal.append(_entry("OLD", GAME_1))
+    await journal.append(_entry("NEW", datetime.utcnow()))
+    await journal.flush()
+    await journal.prune()
+    await journal.stop()
+    rows = await database.fetch_all(select(applied_settlements.c.key))
+    assert [row["key"].split("@")[0] for row in rows] == ["NEW"]
@@ -0,0 +1,18 @@
+import pytest
+from app import simulator
+
+
+def test_missing_numpy_exits_with_install_hint(monkeypatch, capsys):
+    monkeypatch.setattr(simulator, "np", None)
+    with pytest.raises(SystemExit) as exit_info:
+        simulator.main(["--rounds", "10"])
+    assert exit_info.value.code == 1
+    assert "requirements-dev.txt" in capsys.readouterr().err
+
+
+def test_simulation_rates_sum_to_one():
+    pytest.importorskip("numpy")
+    config = simulator.game_manager.get_mode_config("poker_battle")
+    report = simulator.simulate(config, 2, 2000, seed=1)
+    for seat in report["seats"]:
+        assert seat["win_rate"] + seat["draw_rate"] + seat["loss_rate"] == pytest.approx(1)
@@ -0,0 +1,108 @@
+import asyncio
+import pytest
+from app.state_store import STATE_STORE_CONFIG, StateStore, VersionConflict, create_state_store
+
+pytestmark = pytest.mark.anyio
+
+NS = "test"
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+async def store(request, db):
+    return create_state_store(request.param)
+
+
+def _increment(value):
+    if value is None:
+        return None
+    value["n"] += 1
+    return value["n"]
+
+
+async def test_put_checks_version(store):
+    assert await store.get(NS, "k") == (None, 0)
+    assert await store.put(NS, "k", {"n": 0}, 0) == 1
+    with pytest.raises(VersionConflict):
+        await store.put(NS, "k", {"n": 1}, 0)
+    assert await store.put(NS, "k", {"n": 1}, 1) == 2
+    with pytest.raises(VersionConflict):
+        await store.put(NS, "k", {"n": 2}, 1)
+    value, version = await store.get(NS, "k")
+    assert (value, version) == ({"n": 1}, 2)
+
+
+async def test_update_retries_after_conflict(store, monkeypatch):
+    await store.put(NS, "k", {"n": 0}, 0)
+    put = store.put
+    raced = []
+
+    async def racing_put(namespace, key, value, expected_version):
+        if not raced:
+            # 另一个进程在本次读取之后抢先写入
+            raced.append(expected_version)
+            await put(namespace, key, {"n": 100}, expected_version)
+        return await put(namespace, key, value, expected_version)
+
+    monkeypatch.setattr(store, "put", racing_put)
+    assert await store.update(NS, "k", _increment) == 101
+    assert await store.get(NS, "k") == ({"n": 101}, 3)
+
+
+async def test_update_gives_up_after_max_retries(store, monkeypatch):
+    await store.put(NS, "k", {"n": 0}, 0)
+
+    async def always_conflict(namespace, key, value, expected_version):
+        raise VersionConflict(key)
+
+    monkeypatch.setattr(store, "put", always_conflict)
+    with pytest.raises(VersionConflict):
+        await store.update(NS, "k", _increment, retries=3)
+
+
+async def test_concurrent_updates_are_not_lost(store):
+    # 每轮冲突至少有一个写入成功，并发数不超过 max_retries 时全部都能写入
+    writers = min(10, STATE_STORE_CONFIG["max_retries"])
+    await store.put(NS, "k", {"n": 0}, 0)
+    await asyncio.gather(*(store.update(NS, "k", _increment) for _ in range(writers)))
+    value, _ = await store.get(NS, "k")
+    assert value["n"] == writers
+
+
+async def test_update_missing_key_does_not_write(store):
+    assert await store.update(NS, "missing", _increment) is None
+    assert await store.keys(NS) == []
+
+
+async def test_keys_count_and_delete(store):
+    for key in ("a", "b"):
+        await store.put(NS, key, {"n": 0}, 0)
+    assert sorted(await store.keys(NS)) == ["a", "b"]
+    assert await store.count(NS) == 2
+    await store.delete(NS, "a")
+    assert await store.keys(NS) == ["b"]
+    assert await store.get(NS, "a") == (None, 0)
+
+
+async def test_sqlite_codec_round_trip(db):
+    store = create_state_store("sqlite")
+    store.register_codec(NS, lambda value: {"items": sorted(value)}, lambda data: set(data["items"]))
+    await store.put(NS, "k", {3, 1, 2}, 0)
+    assert await store.get(NS, "k") == ({1, 2, 3}, 1)
+
+
+async def test_create_many_reports_existing_keys(store):
+    await store.put(NS, "b", {"n": 0}, 0)
+    conflicts = await store.create_many(NS, {"a": {"n": 1}, "b": {"n": 2}, "c": {"n": 3}})
+    assert conflicts == {"b"}
+    assert await store.get(NS, "a") == ({"n": 1}, 1)
+    assert await store.get(NS, "b") == ({"n": 0}, 1)
+    assert await store.get(NS, "c") == ({"n": 3}, 1)
+
+
+def test_backend_missing_a_method_cannot_be_created():
+    class Incomplete(StateStore):
+        async def get(self, namespace, key):
+            return None, 0
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,60 @@
+import json
+import pytest
+from sqlalchemy import update
+from app import user_manager
+from app.database import database
+from app.leaderboard import leaderboard
+from app.models import users
+from app.user_manager import get_users_points, points_changed
+from app.ws_hub import deliver_remote
+from conftest import add_users
+
+pytestmark = pytest.mark.anyio
+
+
+async def _settled_elsewhere(username, delta):
+    """模拟另一个 worker 的结算：直接修改数据库，本进程只会收到 points:changed 消息"""
+    await database.execute(update(users).where(users.c.username == username).values(points=users.c.points + delta))
+    return {"change": json.dumps({"deltas": {username: delta}, "registered": []})}
+
+
+async def test_points_are_cached(db):
+    await add_users("a")
+    assert await get_users_points(["a", "ghost"]) == {"a": 0, "ghost": None}
+    await _settled_elsewhere("a", 5)
+    assert await get_users_points(["a"]) == {"a": 0}
+
+
+async def test_remote_change_invalidates_cache_and_updates_leaderboard(db):
+    await add_users("a", "b")
+    leaderboard.rebuild([("a", 0), ("b", 0)])
+    await get_users_points(["a", "b"])
+    message = await _settled_elsewhere("a", 5)
+    deliver_remote("points:changed", message)
+    assert await get_users_points(["a", "b"]) == {"a": 5, "b": 0}
+    assert leaderboard.top(1) == [{"rank": 1, "username": "a", "points": 5}]
+
+
+async def test_remote_registration_clears_missing_user(db):
+    assert await get_users_points(["newbie"]) == {"newbie": None}
+    await add_users("newbie")
+    deliver_remote("points:changed", {"change": json.dumps({"deltas": {}, "registered": ["newbie"]})})
+    assert await get_users_points(["newbie"]) == {"newbie": 0}
+    assert leaderboard.rank("newbie") is not None
+
+
+async def test_cache_entries_expire(db, monkeypatch):
+    monkeypatch.setattr(user_manager, "_POINTS_CACHE_TTL", 0)
+    await add_users("a")
+    assert await get_users_points(["a"]) == {"a": 0}
+    # 没有收到通知（消息丢失）时，缓存过期后同样读到新积分
+    await _settled_elsewhere("a", 3)
+    assert await get_users_points(["a"]) == {"a": 3}
+
+
+async def test_local_change_is_published(db, monkeypatch):
+    published = []
+    monkeypatch.setattr(user_manager.pubsub, "enabled", True, raising=False)
+    monkeypatch.setattr(user_manager.pubsub, "publish", lambda channel, message: published.append((channel, message)))
+    points_changed({"a": 1})
+    assert published == [("points:changed", {"change": json.dumps({"deltas": {"a": 1}, "registered": []})})]
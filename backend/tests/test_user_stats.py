@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select
+from app.database import database
+from app.models import user_stats
+from app.settlement import settle_game
+from app.user_stats import backfill, backfill_if_empty, get_user_stats
+from conftest import add_users
+
+pytestmark = pytest.mark.anyio
+
+GAME_1 = datetime(2024, 1, 1, 12, 0, 0)
+# a 的结果序列：两连胜、三连败、平局、再一胜
+SCORES = [1, 1, -1, -1, -1, 0, 1]
+
+
+async def _play(scores):
+    await add_users("a", "b")
+    for i, score in enumerate(scores):
+        await settle_game("ROOM1", GAME_1 + timedelta(minutes=i), {"a": score, "b": -score})
+
+
+async def _stats_rows():
+    rows = await database.fetch_all(select(user_stats).order_by(user_stats.c.user_id))
+    return [dict(row) for row in rows]
+
+
+def _summary(stats):
+    return {key: stats[key] for key in ("games", "wins", "losses", "draws", "current_streak", "best_streak")}
+
+
+@pytest.mark.parametrize("scores, a, b", [
+    (SCORES,
+     {"games": 7, "wins": 3, "losses": 3, "draws": 1, "current_streak": 1, "best_streak": 2},
+     {"games": 7, "wins": 3, "losses": 3, "draws": 1, "current_streak": -1, "best_streak": 3}),
+    ([-1, -1],
+     {"games": 2, "wins": 0, "losses": 2, "draws": 0, "current_streak": -2, "best_streak": 0},
+     {"games": 2, "wins": 2, "losses": 0, "draws": 0, "current_streak": 2, "best_streak": 2}),
+    ([0],
+     {"games": 1, "wins": 0, "losses": 0, "draws": 1, "current_streak": 0, "best_streak": 0},
+     {"games": 1, "wins": 0, "losses": 0, "draws": 1, "current_streak": 0, "best_streak": 0}),
+])
+async def test_settlement_updates_counters_and_streaks(db, scores, a, b):
+    await _play(scores)
+    stats_a, stats_b = await get_user_stats("a"), await get_user_stats("b")
+    assert _summary(stats_a) == a
+    assert _summary(stats_b) == b
+    assert stats_a["last_game_time"] == GAME_1 + timedelta(minutes=len(scores) - 1)
+    assert stats_a["win_rate"] == a["wins"] / a["games"]
+
+
+async def test_backfill_matches_incremental_updates(db):
+    await _play(SCORES)
+    incremental = await _stats_rows()
+    assert await backfill() == 2
+    assert await _stats_rows() == incremental
+
+
+async def test_backfill_if_empty(db):
+    await _play(SCORES)
+    incremental = await _stats_rows()
+    await database.execute(user_stats.delete())
+    await backfill_if_empty()
+    assert await _stats_rows() == incremental
+    # 已有统计时不重建
+    await database.execute(user_stats.update().values(games=100))
+    await backfill_if_empty()
+    assert {row["games"] for row in await _stats_rows()} == {100}
+
+
+async def test_user_without_games_has_empty_stats(db):
+    await add_users("new")
+    stats = await get_user_stats("new")
+    assert _summary(stats) == dict.fromkeys(("games", "wins", "losses", "draws", "current_streak", "best_streak"), 0)
+    assert stats["win_rate"] == 0.0
+    assert await get_user_stats("missing") is None
@@ -0,0 +1,137 @@
+import struct
+from datetime import datetime
+import pytest
+from app import wire
+
+GAME_TIME = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def _header(frame):
+    return wire.HEADER.unpack_from(frame)
+
+
+def _read_str(frame, offset):
+    (length,) = struct.unpack_from("!H", frame, offset)
+    offset += 2
+    return frame[offset:offset + length].decode("utf-8"), offset + length
+
+
+def _client_frame(kind, username=None, card=None, seq=0):
+    frame = wire.HEADER.pack(kind, seq)
+    if username is not None:
+        frame += wire._str(username)
+    if card is not None:
+        frame += bytes((card,))
+    return frame
+
+
+def test_header_is_five_bytes():
+    assert wire.HEADER.size == 5
+    assert wire.hello(1) == b"\x00\x00\x00\x00\x01"
+    assert _header(wire.sync(70000)) == (wire.SYNC, 70000)
+    assert _header(wire.game_start()) == (wire.GAME_START, 0)
+
+
+def test_snapshot_round_trip():
+    players = [("甲", True, False, None, [0, 51]), ("b", True, True, 13, [])]
+    frame = wire.snapshot(7, 40, False, GAME_TIME, players)
+    assert _header(frame) == (wire.SNAPSHOT, 7)
+    deck_count, finished, timestamp, count = struct.unpack_from("!BBdB", frame, wire.HEADER.size)
+    assert (deck_count, finished, count) == (40, 0, 2)
+    assert datetime.utcfromtimestamp(timestamp) == GAME_TIME
+    offset = wire.HEADER.size + struct.calcsize("!BBdB")
+    decoded = []
+    for _ in range(count):
+        username, offset = _read_str(frame, offset)
+        flags, table_card, hand_size = frame[offset:offset + 3]
+        hand = list(frame[offset + 3:offset + 3 + hand_size])
+        offset += 3 + hand_size
+        decoded.append((username, bool(flags & 1), bool(flags & 2), None if table_card == wire.NO_CARD else table_card, hand))
+    assert offset == len(frame)
+    assert decoded == players
+    assert _header(wire.snapshot(8, 40, True, GAME_TIME, players, restart=True))[0] == wire.RESTART
+
+
+def test_incremental_frames():
+    assert wire.draw(3, 1, 50, 39, True, False) == wire.HEADER.pack(wire.DRAW, 3) + bytes((1, 50, 39, 1))
+    assert wire.play(4, 0, 12, True, True) == wire.HEADER.pack(wire.PLAY, 4) + bytes((0, 12, 3))
+    frame = wire.finish(5, [(12, 1), (50, -1)])
+    assert _header(frame) == (wire.FINISH, 5)
+    assert frame[wire.HEADER.size] == 2
+    assert list(struct.iter_unpack("!Bh", frame[wire.HEADER.size + 1:])) == [(12, 1), (50, -1)]
+
+
+def test_room_update_round_trip():
+    frame = wire.room_update({"甲": True, "b": False})
+    assert _header(frame) == (wire.ROOM_UPDATE, 0)
+    offset = wire.HEADER.size + 1
+    users = {}
+    for _ in range(frame[wire.HEADER.size]):
+        username, offset = _read_str(frame, offset)
+        users[username] = bool(frame[offset])
+        offset += 1
+    assert offset == len(frame)
+    assert users == {"甲": True, "b": False}
+
+
+def test_known_errors_send_only_the_code():
+    for code, detail in enumerate(wire.ERRORS):
+        if detail is None:
+            continue
+        assert wire.error(detail) == wire.HEADER.pack(wire.ERROR, 0) + bytes((code,))
+    assert len(set(wire.ERRORS)) == len(wire.ERRORS)
+
+
+def test_unknown_error_carries_text():
+    frame = wire.error("未知错误")
+    assert frame[wire.HEADER.size] == 0
+    assert _read_str(frame, wire.HEADER.size + 1) == ("未知错误", len(frame))
+
+
+@pytest.mark.parametrize("frame, message", [
+    (_client_frame(wire.C_READY, "甲"), {"action": "ready", "username": "甲"}),
+    (_client_frame(wire.C_DRAW, "a"), {"action": "draw_card", "username": "a"}),
+    (_client_frame(wire.C_PLAY, "a", 51), {"action": "play_card", "username": "a", "card": 51}),
+    (_client_frame(wire.C_RESTART), {"action": "restart_game"}),
+    (_client_frame(wire.C_FINISH), {"action": "finish_game"}),
+    (_client_frame(wire.C_SYNC, seq=42), {"action": "sync", "seq": 42}),
+    (_client_frame(0x7F), {"action": None}),
+])
+def test_decode_client(frame, message):
+    assert wire.decode_client(frame) == message
+
+
+@pytest.mark.parametrize("frame", [
+    b"\x20\x00",
+    _client_frame(wire.C_READY),
+    _client_frame(wire.C_READY, "abc")[:-1],
+    _client_frame(wire.C_PLAY, "a"),
+    wire.HEADER.pack(wire.C_DRAW, 0) + b"\x00\x02\xff\xfe",
+])
+def test_decode_client_rejects_malformed_frames(frame):
+    with pytest.raises(ValueError):
+        wire.decode_client(frame)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ({}, ("legacy", None)),
+    ({"protocol": "unknown"}, ("legacy", None)),
+    ({"protocol": "delta"}, ("delta", None)),
+    ({"protocol": "binary"}, ("binary", wire.BINARY_VERSIONS[-1])),
+    ({"protocol": "binary", "version": "1"}, ("binary", 1)),
+    ({"protocol": "binary", "version": "99"}, ("binary", wire.BINARY_VERSIONS[-1])),
+    ({"protocol": "binary", "version": "0"}, ("binary", wire.BINARY_VERSIONS[0])),
+    ({"protocol": "binary", "version": "x"}, ("binary", wire.BINARY_VERSIONS[-1])),
+])
+def test_negotiate(query, expected):
+    assert wire.negotiate(query, ("legacy", "delta", "binary"), "legacy") == expected
+
+
+def test_negotiate_ignores_protocols_the_endpoint_does_not_offer():
+    assert wire.negotiate({"protocol": "binary"}, ("legacy",), "legacy") == ("legacy", None)
+
+
+def test_frame_size_counts_utf8_bytes():
+    assert wire.frame_size("abc") == 3
+    assert wire.frame_size("房间") == 6
+    assert wire.frame_size(b"\x00\x01") == 2
@@ -0,0 +1,126 @@
+import asyncio
+from collections import Counter
+import pytest
+from app import ws_hub
+from app.ws_hub import BroadcastHub, SLOW_CONSUMER_CLOSE_CODE
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeWebSocket:
+    def __init__(self, block=False, fail=False):
+        self.sent = []
+        self.closed_with = None
+        self.block = block
+        self.fail = fail
+
+    async def _send(self, payload):
+        if self.fail:
+            raise ConnectionResetError("peer gone")
+        if self.block:
+            await asyncio.Event().wait()
+        self.sent.append(payload)
+
+    async def send_text(self, text):
+        await self._send(text)
+
+    async def send_bytes(self, data):
+        await self._send(data)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+class FakePubSub:
+    enabled = True
+
+    def __init__(self):
+        self.published = []
+
+    def subscribe(self, channel):
+        pass
+
+    def unsubscribe(self, channel):
+        pass
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+async def _drain():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def _encoder(calls):
+    def encode(protocol):
+        calls[protocol] += 1
+        return b"binary" if protocol == "binary" else f"{protocol} text"
+    return encode
+
+
+async def test_message_is_encoded_once_per_protocol():
+    hub = BroadcastHub("test", protocols=("legacy", "delta", "binary"), local_only=True)
+    sockets = {protocol: [FakeWebSocket(), FakeWebSocket()] for protocol in ("legacy", "binary")}
+    for protocol, websockets in sockets.items():
+        for websocket in websockets:
+            hub.register("R", websocket, protocol)
+    calls = Counter()
+    assert hub.broadcast("R", _encoder(calls)) == 4
+    await _drain()
+    # 房间内没有 delta 连接，不为它编码
+    assert calls == {"legacy": 1, "binary": 1}
+    assert [websocket.sent for websocket in sockets["legacy"]] == [["legacy text"]] * 2
+    assert [websocket.sent for websocket in sockets["binary"]] == [[b"binary"]] * 2
+    hub.close_room("R")
+
+
+async def test_published_encodings_are_reused_locally(monkeypatch):
+    pubsub = FakePubSub()
+    monkeypatch.setattr(ws_hub, "pubsub", pubsub)
+    hub = BroadcastHub("test", protocols=("legacy", "binary"))
+    websocket = FakeWebSocket()
+    hub.register("R", websocket, "legacy")
+    calls = Counter()
+    hub.broadcast("R", _encoder(calls))
+    await _drain()
+    assert calls == {"legacy": 1, "binary": 1}
+    assert pubsub.published == [("test:R", {"legacy": "legacy text", "binary": b"binary"})]
+    assert websocket.sent == ["legacy text"]
+    hub.close_room("R")
+
+
+async def test_slow_consumer_is_evicted():
+    hub = BroadcastHub("test", queue_size=2, local_only=True)
+    slow, fast = FakeWebSocket(block=True), FakeWebSocket()
+    slow_conn = hub.register("R", slow)
+    hub.register("R", fast)
+    await _drain()
+    # 慢连接的写协程卡在第一条消息上，队列再积压 2 条后溢出
+    sent = []
+    for i in range(4):
+        sent.append(hub.broadcast("R", f"m{i}"))
+        await _drain()
+    assert sent == [2, 2, 2, 1]
+    assert slow_conn.closed
+    assert slow.closed_with == SLOW_CONSUMER_CLOSE_CODE
+    assert hub.connection_count("R") == 1
+    assert fast.sent == ["m0", "m1", "m2", "m3"]
+    hub.close_room("R")
+
+
+async def test_broken_connection_is_removed():
+    hub = BroadcastHub("test", local_only=True)
+    broken_conn = hub.register("R", FakeWebSocket(fail=True))
+    healthy = FakeWebSocket()
+    hub.register("R", healthy)
+    hub.broadcast("R", "hello")
+    await _drain()
+    assert broken_conn.closed
+    assert hub.connection_count("R") == 1
+    assert hub.broadcast("R", "again") == 1
+    await _drain()
+    assert healthy.sent == ["hello", "again"]
+    hub.close_room("R")
+    assert hub.connection_count() == 0
+    assert not hub.send(broken_conn, "late")
@@ -1,8 +1,50 @@
 // src/utils/axios.js
 import axios from 'axios';
+import router from '@/router';
 
 const instance = axios.create({
   baseURL: 'http://localhost:9000', // 后端 API 地址
 });
 
+// 登录后每个请求都携带会话令牌
+instance.interceptors.request.use((config) => {
+  const token = localStorage.getItem("token");
+  if (token) {
+    config.headers.Authorization = `Bearer ${token}`;
+  }
+  return config;
+});
+
+// 会话令牌无效时服务端以该关闭码关闭 WebSocket（1008: Policy Violation）
+export const AUTH_CLOSE_CODE = 1008;
+
+// 令牌失效（接口返回 401 或 WebSocket 以 AUTH_CLOSE_CODE 关闭）时清除登录状态，回到登录页重新登录
+export function handleAuthExpired() {
+  localStorage.removeItem("token");
+  localStorage.removeItem("username");
+  if (router.currentRoute.value.name !== 'Auth') {
+    router.push({ name: 'Auth' });
+  }
+}
+
+instance.interceptors.response.use(
+  (response) => response,
+  (error) => {
+    if (error.response?.status === 401) {
+      handleAuthExpired();
+    }
+    return Promise.reject(error);
+  }
+);
+
+// WebSocket 无法设置请求头，令牌通过查询参数传递
+export function wsUrl(path) {
+  const token = localStorage.getItem("token");
+  if (!token) {
+    return `ws://localhost:9000${path}`;
+  }
+  const separator = path.includes("?") ? "&" : "?";
+  return `ws://localhost:9000${path}${separator}token=${encodeURIComponent(token)}`;
+}
+
 export default instance;